@@ -8,25 +8,17 @@ Created on Tue May  7 11:04:26 2024
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy import stats
-from scipy import signal
-
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.filters import butter_lowpass_filter
 
 order = 6
 fs = 1000
 cutoff = 10
 
-MVC = np.loadtxt("MVC/PP00_MVC.txt")[:, -1]
+MVC = load_opensignals("MVC/PP00_MVC.txt").channel('ES-L right')
 MVC = MVC[31000: 35800]
 MVC = ((MVC-(2**16-1)/2)/32768)*1.5
 t = range(0, len(MVC))
@@ -1,32 +1,27 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.envelope import rms_envelope
+from emg_pipeline.channels import LUMBAR_CHANNELS
+from emg_pipeline.manifest import load_manifest
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 # Load the data from the file
-data = np.loadtxt("MVC/PP03_MVC.txt")
+manifest = load_manifest('PP03')
+data = load_opensignals(manifest.mvc_file())
 
 # Define the frequency range to extract data from
-start_freq = 5600
-end_freq = 18700
+start_freq, end_freq = manifest.mvc_window()
 
-# Extract the relevant columns (5th to 8th) for the specified frequency range
+# Extract the erector spinae channels for the specified frequency range
 frequency = data[:, 0]  
-relevant_data = data[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+relevant_data = data.window(start_freq, end_freq, LUMBAR_CHANNELS)
 
 # Transform values to millivolt
 transformed_data = transform_mV(relevant_data)
@@ -35,19 +30,10 @@ cutoff = 10  # Define the cutoff frequency
 fs = 1000   # Define the sampling frequency
 order = 4   # Define the filter order
 
-# Filter ES-L left and right data and calculate RMS
-filtered_rms_left = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
-filtered_rms_right = butter_lowpass_filter((transformed_data[:, 3])**2, cutoff, fs, order)
-
-# Ensure no negative or NaN values
-filtered_rms_left[filtered_rms_left < 0] = 0
-filtered_rms_left = np.nan_to_num(filtered_rms_left)
-filtered_rms_right[filtered_rms_right < 0] = 0
-filtered_rms_right = np.nan_to_num(filtered_rms_right)
-
-# Take the square root to get RMS after filtering
-filtered_rms_left = np.sqrt(filtered_rms_left)
-filtered_rms_right = np.sqrt(filtered_rms_right)
+# RMS envelope of the left and right channel at once (negative filter output clipped to zero)
+envelopes = rms_envelope(transformed_data, cutoff, fs, order)
+filtered_rms_left = envelopes[:, 0]
+filtered_rms_right = envelopes[:, 1]
 
 # Calculate the average RMS
 average_rms = (filtered_rms_left + filtered_rms_right) / 2
@@ -67,8 +53,8 @@ time = np.arange(len(selected_indices))
 
 # Plot the selected data
 plt.figure(figsize=(12, 6))
-plt.plot(time, transformed_data[:, 1], label='ES-T Left')
-plt.plot(time, transformed_data[:, 3], label='ES-T Right')
+plt.plot(time, transformed_data[:, 0], label='ES-T Left')
+plt.plot(time, transformed_data[:, 1], label='ES-T Right')
 plt.xlabel('Sample Index')
 plt.ylabel('Amplitude (mV)')
 plt.title('Erector Spinae Data for Specified Frequency Range')
@@ -1,33 +1,27 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.filters import butter_lowpass_filter
+from emg_pipeline.channels import THORACIC_CHANNELS
 
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 # Load the data from the file
-data_6 = np.loadtxt("PP00_6kg.txt")
+data_6 = load_opensignals("PP00_6kg.txt")
 
 # Define the frequency range to extract data from
 start_freq = 4000  
 end_freq = 7200   
 
-# Extract the relevant columns (5th to 8th) for the specified frequency range
+# Extract the erector spinae channels for the specified frequency range
 frequency = data_6[:, 0]  
-relevant_data = data_6[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+relevant_data = data_6.window(start_freq, end_freq, THORACIC_CHANNELS)
 
 # transform values to milivolt
 transformed_data = transform_mV(relevant_data)
@@ -1,29 +1,24 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.filters import butter_lowpass_filter
+from emg_pipeline.channels import LUMBAR_CHANNELS
+from emg_pipeline.manifest import load_manifest
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 def process_and_plot(file_path, start_freq, end_freq, plot_position):
     # Load the data from the file
-    data = np.loadtxt(file_path)
+    data = load_opensignals(file_path)
 
-    # Extract the relevant columns (5th to 8th) for the specified frequency range
+    # Extract the erector spinae channels for the specified frequency range
     frequency = data[:, 0]  
-    relevant_data = data[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+    relevant_data = data.window(start_freq, end_freq, LUMBAR_CHANNELS)
 
     # Transform values to millivolt
     transformed_data = transform_mV(relevant_data)
@@ -33,8 +28,8 @@ def process_and_plot(file_path, start_freq, end_freq, plot_position):
     order = 4   # Define the filter order
 
     # Filter ES-L left and right data and calculate RMS
-    filtered_rms_left = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
-    filtered_rms_right = butter_lowpass_filter((transformed_data[:, 3])**2, cutoff, fs, order)
+    filtered_rms_left = butter_lowpass_filter((transformed_data[:, 0])**2, cutoff, fs, order)
+    filtered_rms_right = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
 
     # Take the square root to get RMS after filtering
     filtered_rms_left = np.sqrt(filtered_rms_left)
@@ -55,8 +50,8 @@ def process_and_plot(file_path, start_freq, end_freq, plot_position):
 
     # Plot the selected data
     plt.subplot(3, 1, plot_position)
-    plt.plot(time, transformed_data[:, 1], label='ES-L Left')
-    plt.plot(time, transformed_data[:, 3], label='ES-L Right')
+    plt.plot(time, transformed_data[:, 0], label='ES-L Left')
+    plt.plot(time, transformed_data[:, 1], label='ES-L Right')
     plt.xlabel('Sample Index')
     plt.ylabel('Amplitude (mV)')
     plt.title(f'Erector Spinae Data for {file_path} Specified Frequency Range')
@@ -79,10 +74,12 @@ def process_and_plot(file_path, start_freq, end_freq, plot_position):
 
     return max_avg_rms
 
-# Define file paths and frequency ranges
-file_paths = ["PP00/PP00_6kg.txt", "PP00/PP00_8kg.txt", "PP00/PP00_10kg.txt"]
-frequency_ranges = [(4000, 7200), (11880, 15800), (4300, 5500)]
-loads = [6,8,10]
+# File paths and frequency ranges from the participant's manifest
+manifest = load_manifest('PP00')
+trials = manifest.trials(region='lumbar', region_window=True)
+file_paths = [manifest.path(trial) for trial in trials]
+frequency_ranges = [(trial.start_freq, trial.end_freq) for trial in trials]
+loads = [trial.load for trial in trials]
 
 # Create a figure for subplots
 plt.figure(figsize=(12, 18))
@@ -97,7 +94,8 @@ for i, (file_path, freq_range, load) in enumerate(zip(file_paths, frequency_rang
 # Show the plots
 plt.show()
 
-mvc_pp00 = 0.22775161368853739
+# Lumbar reference the results were published with (MVC/PP00_MVC_data.py settings, see the manifest)
+mvc_pp00 = manifest.mvc_variant('lumbar_script')
 
 norm_max_rms_values = np.divide(max_rms_values, mvc_pp00)
 
@@ -1,29 +1,24 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.filters import butter_lowpass_filter
+from emg_pipeline.channels import THORACIC_CHANNELS
+from emg_pipeline.manifest import load_manifest
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 def process_and_plot(file_path, start_freq, end_freq, plot_position):
     # Load the data from the file
-    data = np.loadtxt(file_path)
+    data = load_opensignals(file_path)
 
-    # Extract the relevant columns (5th to 8th) for the specified frequency range
+    # Extract the erector spinae channels for the specified frequency range
     frequency = data[:, 0]  
-    relevant_data = data[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+    relevant_data = data.window(start_freq, end_freq, THORACIC_CHANNELS)
 
     # Transform values to millivolt
     transformed_data = transform_mV(relevant_data)
@@ -77,9 +72,11 @@ def process_and_plot(file_path, start_freq, end_freq, plot_position):
 
     plt.legend()
 
-# Define file paths and frequency ranges
-file_paths = ["PP00_6kg.txt", "PP00_8kg.txt", "PP00_10kg.txt"]
-frequency_ranges = [(4000, 7200), (11880, 15800), (4300, 5500)]
+# File paths and frequency ranges from the participant's manifest
+manifest = load_manifest('PP00')
+trials = manifest.trials(region='thoracic', region_window=True)
+file_paths = [manifest.path(trial) for trial in trials]
+frequency_ranges = [(trial.start_freq, trial.end_freq) for trial in trials]
 
 # Create a figure for subplots
 plt.figure(figsize=(12, 18))
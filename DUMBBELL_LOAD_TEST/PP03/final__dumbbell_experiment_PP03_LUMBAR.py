@@ -1,29 +1,24 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.filters import butter_lowpass_filter
+from emg_pipeline.channels import LUMBAR_CHANNELS
+from emg_pipeline.manifest import load_manifest
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 def process_and_plot(file_path, start_freq, end_freq, ax):
     # Load the data from the file
-    data = np.loadtxt(file_path)
+    data = load_opensignals(file_path)
 
-    # Extract the relevant columns (5th to 8th) for the specified frequency range
+    # Extract the erector spinae channels for the specified frequency range
     frequency = data[:, 0]  
-    relevant_data = data[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+    relevant_data = data.window(start_freq, end_freq, LUMBAR_CHANNELS)
 
     # Transform values to millivolt
     transformed_data = transform_mV(relevant_data)
@@ -33,8 +28,8 @@ def process_and_plot(file_path, start_freq, end_freq, ax):
     order = 4   # Define the filter order
 
     # Filter ES-L left and right data and calculate RMS
-    filtered_rms_left = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
-    filtered_rms_right = butter_lowpass_filter((transformed_data[:, 3])**2, cutoff, fs, order)
+    filtered_rms_left = butter_lowpass_filter((transformed_data[:, 0])**2, cutoff, fs, order)
+    filtered_rms_right = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
 
     # Clip negative values to zero
     filtered_rms_left = np.clip(filtered_rms_left, 0, None)
@@ -58,8 +53,8 @@ def process_and_plot(file_path, start_freq, end_freq, ax):
     time = np.arange(len(selected_indices))
 
     # Plot the selected data
-    ax.plot(time, transformed_data[:, 1], label='ES-L Left')
-    ax.plot(time, transformed_data[:, 3], label='ES-L Right')
+    ax.plot(time, transformed_data[:, 0], label='ES-L Left')
+    ax.plot(time, transformed_data[:, 1], label='ES-L Right')
     ax.set_xlabel('Time [ms]')
     ax.set_ylabel('Amplitude (mV)')
     ax.set_title(f'Erector Spinae Data for {file_path} Specified Frequency Range')
@@ -80,10 +75,12 @@ def process_and_plot(file_path, start_freq, end_freq, ax):
 
     return ax
 
-# Define file paths and frequency ranges
-file_paths = ["DUMBBELL_LOAD_TEST/PP03/PP03_6kg.txt", "DUMBBELL_LOAD_TEST/PP03/PP03_10kg.txt"]
-frequency_ranges = [(5200, 7100), (4100, 5500)]
-loads = [6, 10]  # Corresponding loads in kg
+# File paths and frequency ranges from the participant's manifest
+manifest = load_manifest('PP03')
+trials = manifest.trials(region='lumbar', region_window=True)
+file_paths = [manifest.path(trial) for trial in trials]
+frequency_ranges = [(trial.start_freq, trial.end_freq) for trial in trials]
+loads = [trial.load for trial in trials]
 
 # Create a figure for subplots
 fig, axes = plt.subplots(2, 1, figsize=(12, 12))
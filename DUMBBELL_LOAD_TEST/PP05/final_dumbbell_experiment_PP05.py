@@ -1,55 +1,46 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import signal
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.envelope import rms_envelope
+from emg_pipeline.channels import ES_CHANNELS
+from emg_pipeline.manifest import load_manifest
+from emg_pipeline.quality import quality_summary, screen_raw
 
 def transform_mV(emg_data):
     transformed_data = (emg_data - ((2**16 - 1) / 2)) / 32768
     return transformed_data
 
-def butter_lowpass(cutoff, fs, order=5):
-    nyq = 0.5 * fs
-    normal_cutoff = cutoff / nyq
-    b, a = signal.butter(order, normal_cutoff, btype='low', analog=False)
-    return b, a
-
-def butter_lowpass_filter(data, cutoff, fs, order=5):
-    b, a = butter_lowpass(cutoff, fs, order=order)
-    y = signal.lfilter(b, a, data)
-    return y
-
 def process_and_plot(file_path, start_freq, end_freq, MVC_values):
     # Load the data from the file
-    data = np.loadtxt(file_path)
+    data = load_opensignals(file_path)
 
-    # Extract the relevant columns (5th to 8th) for the specified frequency range
-    frequency = data[:, 0]
-    relevant_data = data[(frequency >= start_freq) & (frequency <= end_freq), 4:8]
+    # Extract the erector spinae channels for the specified frequency range
+    relevant_data = data.window(start_freq, end_freq, ES_CHANNELS)
 
     print(relevant_data)
 
+    # Screen the raw counts for clipping, flat lines, drift, noise and lead-off
+    quality = quality_summary(screen_raw(relevant_data), ES_CHANNELS)
+    if np.any(quality['status'] == 'bad'):
+        print(f"Bad signal quality in {file_path}: {', '.join(quality['channel'][quality['status'] == 'bad'])}")
+        return None, None, None, None
+
     # Transform values to millivolt
     transformed_data = transform_mV(relevant_data)
 
-    # Check for any invalid values
-    if np.any(np.isnan(transformed_data)) or np.any(np.isinf(transformed_data)):
-        print(f"Invalid values found in transformed data for {file_path}")
-        return None, None, None, None
-
     cutoff = 10  # Define the cutoff frequency
     fs = 1000   # Define the sampling frequency
     order = 4   # Define the filter order
 
-    # Filter ES-T thoracic data and calculate RMS
-    filtered_rms_left_thoracic = butter_lowpass_filter((transformed_data[:, 0])**2, cutoff, fs, order)
-    filtered_rms_right_thoracic = butter_lowpass_filter((transformed_data[:, 2])**2, cutoff, fs, order)
-    filtered_rms_left_thoracic = np.sqrt(np.abs(filtered_rms_left_thoracic))
-    filtered_rms_right_thoracic = np.sqrt(np.abs(filtered_rms_right_thoracic))
-
-    # Filter ES-T lumbar data and calculate RMS
-    filtered_rms_left_lumbar = butter_lowpass_filter((transformed_data[:, 1])**2, cutoff, fs, order)
-    filtered_rms_right_lumbar = butter_lowpass_filter((transformed_data[:, 3])**2, cutoff, fs, order)
-    filtered_rms_left_lumbar = np.sqrt(np.abs(filtered_rms_left_lumbar))
-    filtered_rms_right_lumbar = np.sqrt(np.abs(filtered_rms_right_lumbar))
+    # RMS envelope of all four channels at once
+    envelopes = rms_envelope(transformed_data, cutoff, fs, order, negative='abs')
+    filtered_rms_left_thoracic = envelopes[:, 0]
+    filtered_rms_left_lumbar = envelopes[:, 1]
+    filtered_rms_right_thoracic = envelopes[:, 2]
+    filtered_rms_right_lumbar = envelopes[:, 3]
 
     # Calculate the average of the maximum and minimum RMS values for thoracic and lumbar regions
     avg_rms_left_thoracic = (np.max(filtered_rms_left_thoracic) + np.min(filtered_rms_left_thoracic)) / 2
@@ -71,26 +62,36 @@ def process_and_plot(file_path, start_freq, end_freq, MVC_values):
     # Return the normalized values for plotting
     return normalized_rms_left_thoracic, normalized_rms_right_thoracic, normalized_rms_left_lumbar, normalized_rms_right_lumbar
 
-# Define file paths and frequency ranges
-file_paths = ["DUMBBELL_LOAD_TEST/PP05/PP05_6kg.txt", "DUMBBELL_LOAD_TEST/PP05/PP05_8kg.txt", "DUMBBELL_LOAD_TEST/PP05/PP05_10kg.txt"]
-frequency_ranges = [(6600, 8400), (7200,8400), (8600, 10100)]
-MVC_values = [0.1436, 0.1427, 0.3514, 0.1418]
-loads = [6, 8, 10]
+# File paths, frequency ranges and MVC values from the participant's manifest
+manifest = load_manifest('PP05')
+trials = manifest.trials(region='thoracic')  # one per load, both regions share the window
+file_paths = [manifest.path(trial) for trial in trials]
+frequency_ranges = [(trial.start_freq, trial.end_freq) for trial in trials]
+MVC_values = manifest.mvc_values(['ES-T left', 'ES-T right', 'ES-L left', 'ES-L right'])
 
-# Collect normalized values for each load
+# Collect normalized values for each load (only the loads whose trial passed the checks)
+loads = []
+dropped_loads = []
 normalized_values_thoracic_left = []
 normalized_values_thoracic_right = []
 normalized_values_lumbar_left = []
 normalized_values_lumbar_right = []
 
 # Process each file and collect the normalized values
-for file_path, freq_range in zip(file_paths, frequency_ranges):
+for trial, file_path, freq_range in zip(trials, file_paths, frequency_ranges):
     normalized_rms_left_thoracic, normalized_rms_right_thoracic, normalized_rms_left_lumbar, normalized_rms_right_lumbar = process_and_plot(file_path, freq_range[0], freq_range[1], MVC_values)
     if normalized_rms_left_thoracic is not None:
+        loads.append(trial.load)
         normalized_values_thoracic_left.append(normalized_rms_left_thoracic)
         normalized_values_thoracic_right.append(normalized_rms_right_thoracic)
         normalized_values_lumbar_left.append(normalized_rms_left_lumbar)
         normalized_values_lumbar_right.append(normalized_rms_right_lumbar)
+    else:
+        dropped_loads.append(trial.load)
+
+# Say which loads are missing from the data points and the plot
+if dropped_loads:
+    print(f"Dropped loads (kg), failed the signal checks with the default quality thresholds: {dropped_loads}")
 
 # Collect the data points into arrays
 data_points = [loads,normalized_values_thoracic_left,normalized_values_thoracic_right,normalized_values_lumbar_left,normalized_values_lumbar_right]
@@ -1,56 +1,58 @@
 import numpy as np 
 import matplotlib.pyplot as plt
 from scipy.stats import linregress
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from emg_pipeline.channels import ES_CHANNELS
+from emg_pipeline.batch import DEFAULT_PARAMS, ensure_results
+from emg_pipeline.impute import channel_name, dense_grid, impute, imputed_cells
+from emg_pipeline.results import ResultsStore
+
+participants = ['PP00', 'PP03', 'PP04', 'PP05']
+
+# Normalized values from the results store; participants that are not in it yet are processed first
+with ResultsStore() as store:
+    ensure_results(store, participants, max_workers=1)
+    normalized = store.series('normalized', DEFAULT_PARAMS, participant=participants)
+
+# Fill missing trials (PP03 has no 8 kg recording) by linear interpolation between the measured loads
+grid, missing, grid_participants, grid_loads = dense_grid(normalized, participants)
+filled, source = impute(grid, missing, 'linear', grid_loads)
+for cell in imputed_cells(source, grid_participants, grid_loads):
+    print('Imputed:', *cell)
+
+def normalized_values(participant, region, side):
+    return list(filled[grid_participants.index(participant), :, ES_CHANNELS.index(channel_name(region, side))])
 
 # Weight in kilograms
 loads = [6,8,10]
 
 # Normalized data point of each participant: T-L, T-R, L-L, L-R
-data_pp00_TL = [0.21333903380098804, 0.26593544679594794, 0.2659808540953603]
-data_pp00_TR = [0.23551494851468313, 0.261556607384162, 0.22961731147233577]
-data_pp00_LL = [0.21901000822690855, 0.27465000795596134, 0.2676357312443546]
-data_pp00_LR = [0.2246945408714792, 0.23187571723597222, 0.2706794741320111]
+data_pp00_TL = normalized_values('PP00', 'thoracic', 'left')
+data_pp00_TR = normalized_values('PP00', 'thoracic', 'right')
+data_pp00_LL = normalized_values('PP00', 'lumbar', 'left')
+data_pp00_LR = normalized_values('PP00', 'lumbar', 'right')
 
 # Mean values of thoracic and lumbar region: PP00
 mean_pp00_thoracic = [(x + y) / 2 for x, y in zip(data_pp00_TL, data_pp00_TR)]
 mean_pp00_lumbar = [(x + y) / 2 for x, y in zip(data_pp00_LL, data_pp00_LR)]
 
 # Given data points
-data_pp03_TL = [0.10177419830901005, 0.091521716550284]
-data_pp03_TR = [0.08106633583443414, 0.12440700761938041]
-data_pp03_LL = [0.08315429345883311, 0.08762104669074129]
-data_pp03_LR = [0.12715909096481537, 0.14192482103740792]
-
-# Interpolate for each pair of data points at 8 kg
-interpolated_values = {}
-
-# Interpolate for data_pp03_TL
-interpolated_values['TL'] = np.interp(8, [6, 10], data_pp03_TL)
-
-# Interpolate for data_pp03_TR
-interpolated_values['TR'] = np.interp(8, [6, 10], data_pp03_TR)
-
-# Interpolate for data_pp03_LL
-interpolated_values['LL'] = np.interp(8, [6, 10], data_pp03_LL)
-
-# Interpolate for data_pp03_LR
-interpolated_values['LR'] = np.interp(8, [6, 10], data_pp03_LR)
-
-# Create lists with interpolated values included: PP03
-data_pp03_TL_big = [data_pp03_TL[0], interpolated_values['TL'], data_pp03_TL[1]]
-data_pp03_TR_big = [data_pp03_TR[0], interpolated_values['TR'], data_pp03_TR[1]]
-data_pp03_LL_big = [data_pp03_LL[0], interpolated_values['LL'], data_pp03_LL[1]]
-data_pp03_LR_big = [data_pp03_LR[0], interpolated_values['LR'], data_pp03_LR[1]]
+data_pp03_TL = normalized_values('PP03', 'thoracic', 'left')
+data_pp03_TR = normalized_values('PP03', 'thoracic', 'right')
+data_pp03_LL = normalized_values('PP03', 'lumbar', 'left')
+data_pp03_LR = normalized_values('PP03', 'lumbar', 'right')
 
 # Mean values of thoracic and lumbar region: PP03
-mean_pp03_thoracic = [(x + y) / 2 for x, y in zip(data_pp03_TL_big, data_pp03_TR_big)]
-mean_pp03_lumbar = [(x + y) / 2 for x, y in zip(data_pp03_LL_big, data_pp03_LR_big)]
+mean_pp03_thoracic = [(x + y) / 2 for x, y in zip(data_pp03_TL, data_pp03_TR)]
+mean_pp03_lumbar = [(x + y) / 2 for x, y in zip(data_pp03_LL, data_pp03_LR)]
 
 # PP04 Data
-data_pp04_TL = [0.112263287856807, 0.10128526758809676, 0.09563060116409758]
-data_pp04_TR = [0.10776309075431048, 0.12979179481336825, 0.12401269447869485]
-data_pp04_LL = [0.09748086906121536, 0.11885247478930842, 0.11527589034165936]
-data_pp04_LR = [0.09627550088698694, 0.11245900544323154, 0.08409940845778568]
+data_pp04_TL = normalized_values('PP04', 'thoracic', 'left')
+data_pp04_TR = normalized_values('PP04', 'thoracic', 'right')
+data_pp04_LL = normalized_values('PP04', 'lumbar', 'left')
+data_pp04_LR = normalized_values('PP04', 'lumbar', 'right')
 
 # Mean values of thoracic and lumbar region: PP03
 mean_pp04_thoracic = [(x + y) / 2 for x, y in zip(data_pp04_TL, data_pp04_TR)]
@@ -58,10 +60,10 @@ mean_pp04_lumbar = [(x + y) / 2 for x, y in zip(data_pp04_LL, data_pp04_LR)]
 
 
 #PP05 Data
-data_pp05_TL = [0.0903991218702938, 0.08955267810005192, 0.09251656132732143]
-data_pp05_TR = [0.10819033128151205, 0.12967595234933912, 0.13525258151258152]
-data_pp05_LL = [0.09775345481123927, 0.07813742828682649, 0.09228231977830557]
-data_pp05_LR = [0.09429585987062919, 0.10224945681136031, 0.09237418466063049]
+data_pp05_TL = normalized_values('PP05', 'thoracic', 'left')
+data_pp05_TR = normalized_values('PP05', 'thoracic', 'right')
+data_pp05_LL = normalized_values('PP05', 'lumbar', 'left')
+data_pp05_LR = normalized_values('PP05', 'lumbar', 'right')
 
 mean_pp05_thoracic = [(x + y) / 2 for x, y in zip(data_pp05_TL, data_pp05_TR)]; print(mean_pp05_thoracic)
 mean_pp05_lumbar = [(x + y) / 2 for x, y in zip(data_pp05_LL, data_pp05_LR)]
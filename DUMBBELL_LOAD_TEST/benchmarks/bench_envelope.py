@@ -0,0 +1,74 @@
+"""Per-channel script envelope vs. the vectorized rms_envelope and moving_rms on the largest recordings.
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_envelope.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.channels import ES_CHANNELS, transform_mV
+from emg_pipeline.envelope import moving_rms, rms_envelope, rms_envelope_mV
+from emg_pipeline.opensignals import load_opensignals
+
+FILES = ['PP06/PP06_8KG.txt', 'MVC/PP00_MVC.txt']
+cutoff = 10
+fs = 1000
+order = 4
+
+
+def per_channel_envelope(transformed_data):
+    # What the scripts did: design the filter and filter each channel separately
+    envelopes = []
+    for k in range(transformed_data.shape[1]):
+        b, a = signal.butter(order, cutoff / (0.5 * fs), btype='low', analog=False)
+        filtered = signal.lfilter(b, a, transformed_data[:, k] ** 2)
+        envelopes.append(np.sqrt(np.abs(filtered)))
+    return envelopes
+
+
+def best_of(func, repeats=20):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    print(f"{'file':<20}{'samples':>9}{'per-channel [ms]':>18}{'float64 [ms]':>14}{'float32 [ms]':>14}"
+          f"{'max rel. err f32':>18}")
+    for name in FILES:
+        raw = load_opensignals(os.path.join(ROOT, name)).window(0, np.iinfo(np.uint32).max, ES_CHANNELS)
+        transformed_data = transform_mV(raw)
+        out64 = np.empty(raw.shape, dtype=np.float64)
+        out32 = np.empty(raw.shape, dtype=np.float32)
+
+        t_old = best_of(lambda: per_channel_envelope(transformed_data))
+        t_64 = best_of(lambda: rms_envelope(transformed_data, cutoff, fs, order, out=out64, negative='abs'))
+        t_32 = best_of(lambda: rms_envelope_mV(raw, cutoff, fs, order, dtype=np.float32, out=out32, negative='abs'))
+
+        reference = np.column_stack(per_channel_envelope(transformed_data))
+        error = np.max(np.abs(out32 - reference)) / np.max(reference)
+        print(f"{name:<20}{len(raw):>9}{t_old * 1e3:>18.2f}{t_64 * 1e3:>14.2f}{t_32 * 1e3:>14.2f}{error:>18.2e}")
+
+    print()
+    print(f"{'file':<20}{'moving RMS windows':>20}{'step':>6}{'time [ms]':>11}{'per window [ms]':>17}")
+    for name in FILES:
+        transformed_data = transform_mV(
+            load_opensignals(os.path.join(ROOT, name)).window(0, np.iinfo(np.uint32).max, ES_CHANNELS))
+        for windows, step in [((100,), 1), ((50, 100, 250), 1), ((50, 100, 250), 10)]:
+            t = best_of(lambda: moving_rms(transformed_data, windows, fs, step=step))
+            label = '/'.join(str(w) for w in windows) + ' ms'
+            print(f"{name:<20}{label:>20}{step:>6}{t * 1e3:>11.2f}{t * 1e3 / len(windows):>17.2f}")
+
+
+if __name__ == '__main__':
+    main()
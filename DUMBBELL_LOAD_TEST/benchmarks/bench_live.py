@@ -0,0 +1,47 @@
+"""Replay a recording through the live envelope and report latency and the maximum sustainable rate.
+
+Run from the DUMBBELL_LOAD_TEST folder, e.g.
+    python benchmarks/bench_live.py PP04/PP04_6kg.txt --speed 1 --socket
+"""
+
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.channels import ES_CHANNELS
+from emg_pipeline.live import DEFAULT_PACKET_SIZE, FileReplaySource, LiveEnvelope, SocketSource, run_live
+from emg_pipeline.manifest import load_manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('file_path', nargs='?', default=os.path.join(ROOT, 'PP04', 'PP04_6kg.txt'))
+    parser.add_argument('--speed', type=float, default=10.0, help='replay speed relative to real time')
+    parser.add_argument('--packet-size', type=int, default=DEFAULT_PACKET_SIZE)
+    parser.add_argument('--socket', action='store_true', help='send the packets through a local socket pair')
+    args = parser.parse_args()
+
+    def source(speed, packet_size):
+        replay = FileReplaySource(args.file_path, packet_size=packet_size, speed=speed)
+        return SocketSource(replay) if args.socket else replay
+
+    # PP04 MVC values from the manifest (computed once, then read from the MVC cache)
+    mvc_values = load_manifest('PP04').mvc_values(ES_CHANNELS)
+
+    # Paced replay: latency distribution
+    processor = LiveEnvelope(mvc_values=mvc_values)
+    report = run_live(source(args.speed, args.packet_size), processor)
+    print(f"replay at {args.speed:g}x: {report.summary()}")
+    print(f"last %MVC: {processor.percent_mvc.round(1)}")
+
+    # Unpaced replay: how fast the processing itself can go, per packet size
+    for packet_size in (1, 10, 100, 1000):
+        report = run_live(source(None, packet_size), LiveEnvelope(mvc_values=mvc_values))
+        print(f"packet {packet_size:>5}: max sustainable rate {report.max_sample_rate:>12,.0f} samples/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Compare np.loadtxt, a cold parse (text -> cache) and a warm memory-mapped load per recording.
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_opensignals_reader.py
+"""
+
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.opensignals import cache_path, load_opensignals
+
+
+def best_of(func, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def touch_emg(recording):
+    # Force the EMG pages in so the warm load is not just an mmap() call
+    return sum(int(recording[name].sum()) for name in ('CH3', 'CH4', 'CH5', 'CH6'))
+
+
+def cold_load(file_path):
+    if os.path.exists(cache_path(file_path)):
+        os.remove(cache_path(file_path))
+    return touch_emg(load_opensignals(file_path))
+
+
+def warm_load(file_path):
+    return touch_emg(load_opensignals(file_path))
+
+
+def main(repeats=3):
+    file_paths = sorted(glob.glob(os.path.join(ROOT, 'MVC', '*.txt')) + glob.glob(os.path.join(ROOT, 'PP0*', '*.txt')))
+
+    print(f"{'file':<22}{'lines':>8}{'loadtxt [ms]':>14}{'cold [ms]':>12}{'warm [ms]':>12}{'speedup':>10}")
+    totals = np.zeros(3)
+    for file_path in file_paths:
+        t_loadtxt = best_of(lambda: np.loadtxt(file_path), repeats)
+        t_cold = best_of(lambda: cold_load(file_path), repeats)
+        warm_load(file_path)
+        t_warm = best_of(lambda: warm_load(file_path), repeats)
+        totals += (t_loadtxt, t_cold, t_warm)
+
+        lines = len(load_opensignals(file_path))
+        print(f"{os.path.basename(file_path):<22}{lines:>8}{t_loadtxt * 1e3:>14.2f}{t_cold * 1e3:>12.2f}"
+              f"{t_warm * 1e3:>12.2f}{t_loadtxt / t_warm:>9.1f}x")
+
+    print(f"{'total':<22}{'':>8}{totals[0] * 1e3:>14.2f}{totals[1] * 1e3:>12.2f}{totals[2] * 1e3:>12.2f}"
+          f"{totals[0] / totals[2]:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""Rendering envelope figures: full-resolution traces vs. min-max and LTTB downsampling.
+
+First every trial of the manifests, then single synthetic traces of increasing
+length (where the downsampling matters most).
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_plotting.py [workers]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.manifest import load_manifests
+from emg_pipeline.plotting import envelope_figure, render_figures
+
+SETTINGS = [('none', None), ('minmax', 2000), ('lttb', 2000)]
+LENGTHS = [20000, 300000, 2000000]  # samples per channel of the synthetic traces
+
+
+def main():
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 1
+    trials = load_manifests(validate=False).trials()
+    print(f"{len(trials)} figures, {max_workers} worker(s)")
+    print(f"{'method':>8}{'points':>8}{'time [s]':>10}{'figures/s':>11}")
+    with tempfile.TemporaryDirectory() as figure_dir:
+        for method, n_out in SETTINGS:
+            start = time.perf_counter()
+            render_figures(trials, figure_dir, max_workers=max_workers, method=method, n_out=n_out or 0)
+            elapsed = time.perf_counter() - start
+            print(f"{method:>8}{n_out or 'all':>8}{elapsed:>10.2f}{len(trials) / elapsed:>11.1f}")
+
+        print(f"\n{'samples':>9}" + ''.join(f"{method + ' [s]':>13}" for method, _ in SETTINGS))
+        rng = np.random.default_rng(0)
+        path = os.path.join(figure_dir, 'synthetic.png')
+        for n in LENGTHS:
+            envelopes = np.abs(np.cumsum(rng.normal(size=(n, 4)), axis=0))
+            times = []
+            for method, n_out in SETTINGS:
+                start = time.perf_counter()
+                envelope_figure(path, envelopes, ['ES-T left', 'ES-L left', 'ES-T right', 'ES-L right'],
+                                'synthetic', n_out or n, method)
+                times.append(time.perf_counter() - start)
+            print(f"{n:>9}" + ''.join(f"{t:>13.3f}" for t in times))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Bootstrap regression CIs: batched weighted least squares vs. a linregress loop, on synthetic participants.
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_regression.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.stats import linregress
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.regression import bootstrap, regression_groups
+
+LOADS = np.array([6.0, 8.0, 10.0])
+N_RESAMPLES = 5000
+SETTINGS = [4, 20, 60]  # participants
+
+
+def synthetic_series(n_participants, seed=0):
+    # Normalized EMG rising with load plus participant offsets and noise, like ResultsStore.series output
+    rng = np.random.default_rng(seed)
+    series = {}
+    for p in range(n_participants):
+        offset = rng.normal(0.1, 0.02)
+        for region in ('thoracic', 'lumbar'):
+            for side in ('left', 'right'):
+                values = offset + 0.004 * LOADS + rng.normal(0, 0.01, len(LOADS))
+                series[(f'PP{p:02d}', region, side)] = (LOADS, values)
+    return series
+
+
+def looped(x, y, clusters, n_resamples, seed=0):
+    # One resample and one linregress call at a time
+    rng = np.random.default_rng(seed)
+    slopes = np.full((n_resamples, len(x)), np.nan)
+    for g in range(len(x)):
+        valid = clusters[g] >= 0
+        gx, gy, cluster = x[g, valid], y[g, valid], clusters[g, valid]
+        n_clusters = cluster.max() + 1
+        for b in range(n_resamples):
+            chosen = rng.integers(0, n_clusters, n_clusters)
+            take = np.concatenate([np.flatnonzero(cluster == c) for c in chosen])
+            if np.ptp(gx[take]) > 0:
+                slopes[b, g] = linregress(gx[take], gy[take]).slope
+    return slopes
+
+
+def main():
+    print(f"{N_RESAMPLES} resamples per group")
+    print(f"{'participants':>12}{'groups':>8}{'loop [s]':>10}{'batched [s]':>13}{'4 workers [s]':>15}{'speedup':>9}")
+    for n_participants in SETTINGS:
+        labels, x, y, clusters, _ = regression_groups(synthetic_series(n_participants))
+        # The loop is timed on 1/50 of the resamples and scaled up
+        start = time.perf_counter()
+        looped(x, y, clusters, N_RESAMPLES // 50)
+        t_loop = (time.perf_counter() - start) * 50
+        start = time.perf_counter()
+        bootstrap(x, y, clusters, N_RESAMPLES, max_workers=1)
+        t_batched = time.perf_counter() - start
+        start = time.perf_counter()
+        bootstrap(x, y, clusters, N_RESAMPLES, max_workers=4)
+        t_pool = time.perf_counter() - start
+        print(f"{n_participants:>12}{len(labels):>8}{t_loop:>10.2f}{t_batched:>13.3f}{t_pool:>15.3f}"
+              f"{t_loop / min(t_batched, t_pool):>8.0f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Throughput curves on synthetic data: recording length and number of participants.
+
+1. One recording per duration (default 1, 10 and 60 minutes): parsing, the
+   column cache, transform_mV, the per-channel butter_lowpass_filter of the
+   original scripts, rms_envelope, moving_rms, spectral_table and a whole
+   process_job (what process_and_plot did per file), in samples/second.
+2. Synthetic studies of 5 to 500 participants (3 loads each): the batch
+   runner and the cached stage pipeline (cold and warm), in trials/second.
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python benchmarks/bench_scaling.py
+    python benchmarks/bench_scaling.py --minutes 1 10 60 180 --participants 5 50 500 --csv scaling.csv --plot scaling.png
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.batch import DEFAULT_PARAMS, process_job, run_batch
+from emg_pipeline.channels import ES_CHANNELS, transform_mV
+from emg_pipeline.envelope import moving_rms, rms_envelope
+from emg_pipeline.filters import butter_lowpass_filter
+from emg_pipeline.manifest import Manifest, Trial, read_session
+from emg_pipeline.mvc import MVCCache
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.pipeline import StageCache, run_pipeline
+from emg_pipeline.spectral import spectral_table
+from emg_pipeline.synthetic import generate_dataset, synthetic_recording, write_opensignals
+
+
+def timed(func, repeats=1):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_envelopes(block):
+    # What the experiment scripts did: square and filter every channel on its own
+    return [np.sqrt(np.abs(butter_lowpass_filter(block[:, k] ** 2, 10, 1000, 4))) for k in range(block.shape[1])]
+
+
+def duration_scaling(folder, minutes):
+    rows = []
+    for duration in minutes:
+        path = os.path.join(folder, f'synthetic_{duration}min.txt')
+        columns, _ = synthetic_recording(duration * 60, seed=1)
+        n = len(columns['nSeq'])
+        t_write = timed(lambda: write_opensignals(path, columns))
+
+        t_parse = timed(lambda: load_opensignals(path, use_cache=False))
+        load_opensignals(path)  # builds the column cache
+        t_cached = timed(lambda: load_opensignals(path), repeats=3)
+        recording = load_opensignals(path)
+        raw = recording.window(0, n, ES_CHANNELS)
+        block = transform_mV(raw)
+        trial = Trial('SYN', 0, 'thoracic', path, 0, n)
+
+        timings = {
+            'write_opensignals': t_write,
+            'parse': t_parse,
+            'cached load': t_cached,
+            'transform_mV': timed(lambda: transform_mV(raw), repeats=3),
+            'butter_lowpass_filter x4': timed(lambda: legacy_envelopes(block)),
+            'rms_envelope': timed(lambda: rms_envelope(block, negative='abs'), repeats=3),
+            'moving_rms (3 windows)': timed(lambda: moving_rms(block), repeats=3),
+            'spectral_table': timed(lambda: spectral_table(block)),
+            'process_job': timed(lambda: process_job(trial, params=DEFAULT_PARAMS, data_root=''), repeats=3),
+        }
+        for name, seconds in timings.items():
+            rows.append({'benchmark': 'duration', 'size': duration, 'function': name, 'seconds': seconds,
+                         'samples': n, 'throughput': n / seconds})
+    return rows
+
+
+def participant_scaling(folder, participants, trial_duration, max_workers):
+    rows = []
+    for n_participants in participants:
+        data_root = os.path.join(folder, f'study_{n_participants}')
+        start = time.perf_counter()
+        ids = generate_dataset(data_root, n_participants, duration=trial_duration, mvc_duration=trial_duration)
+        t_generate = time.perf_counter() - start
+
+        manifest_dir = os.path.join(data_root, 'manifests')
+        manifest = Manifest([read_session(p, manifest_dir, data_root, validate=False) for p in ids], data_root,
+                            mvc_cache=MVCCache(os.path.join(data_root, 'mvc_cache.json')))
+        trials = manifest.trials()
+        start = time.perf_counter()
+        mvc = {participant: manifest.mvc(participant) for participant in ids}
+        t_mvc = time.perf_counter() - start
+
+        cache = StageCache(os.path.join(data_root, '.pipeline_cache'))
+        timings = {
+            'generate_dataset': t_generate,
+            'mvc': t_mvc,
+            'run_batch': timed(lambda: run_batch(trials, mvc, max_workers=max_workers, data_root=data_root)),
+            'pipeline (cold)': timed(lambda: run_pipeline(trials, mvc, cache=cache, data_root=data_root)),
+            'pipeline (warm)': timed(lambda: run_pipeline(trials, mvc, cache=StageCache(cache.folder),
+                                                          data_root=data_root)),
+        }
+        n_samples = len(trials) * int(trial_duration * 1000)
+        for name, seconds in timings.items():
+            rows.append({'benchmark': 'participants', 'size': n_participants, 'function': name,
+                         'seconds': seconds, 'samples': n_samples, 'throughput': len(trials) / seconds})
+        shutil.rmtree(data_root, ignore_errors=True)
+    return rows
+
+
+def print_rows(rows, size_label, unit):
+    print(f"{size_label:>12}  {'function':<26}{'time [s]':>10}{unit:>16}")
+    for row in rows:
+        print(f"{row['size']:>12}  {row['function']:<26}{row['seconds']:>10.3f}{row['throughput']:>16,.0f}")
+
+
+def plot_curves(rows, path):
+    from emg_pipeline.plotting import headless_pyplot
+    plt = headless_pyplot()
+    fig, axes = plt.subplots(1, 2, figsize=(14, 6))
+    for ax, (benchmark, xlabel, ylabel) in zip(axes, [('duration', 'Recording length (min)', 'Samples/s'),
+                                                      ('participants', 'Participants', 'Trials/s')]):
+        selected = [row for row in rows if row['benchmark'] == benchmark]
+        for name in dict.fromkeys(row['function'] for row in selected):
+            curve = [row for row in selected if row['function'] == name]
+            ax.plot([row['size'] for row in curve], [row['throughput'] for row in curve], 'o-', label=name)
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.grid(True)
+        ax.legend(fontsize='small')
+    fig.savefig(path)
+    plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=float, nargs='+', default=[1, 10, 60])
+    parser.add_argument('--participants', type=int, nargs='+', default=[5, 50])
+    parser.add_argument('--trial-duration', type=float, default=20, help='seconds per synthetic trial')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--csv', default=None, help='write all rows to this CSV file')
+    parser.add_argument('--plot', default=None, help='save the throughput curves to this image')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        duration_rows = duration_scaling(folder, [int(m) if float(m).is_integer() else m for m in args.minutes])
+        print_rows(duration_rows, 'minutes', 'samples/s')
+        print()
+        participant_rows = participant_scaling(folder, args.participants, args.trial_duration, args.workers)
+        print_rows(participant_rows, 'participants', 'trials/s')
+
+    rows = duration_rows + participant_rows
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.plot:
+        plot_curves(rows, args.plot)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Sliding-window MDF/MNF: one batched Welch call vs. a Python loop per window, in windows/second.
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_spectral.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import signal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.channels import ES_CHANNELS, transform_mV
+from emg_pipeline.opensignals import load_opensignals
+from emg_pipeline.spectral import DEFAULT_BAND, spectral_table
+
+FILE = 'PP06/PP06_8KG.txt'
+fs = 1000
+nperseg = 256
+SETTINGS = [(500, 250), (500, 50), (250, 25), (1000, 100)]  # (window, step) in ms
+
+
+def per_window_loop(block, window, step):
+    # One welch call and reduction per window and channel
+    rows = []
+    for start in range(0, len(block) - window + 1, step):
+        mdf, mnf = [], []
+        for k in range(block.shape[1]):
+            f, p = signal.welch(block[start:start + window, k], fs=fs, nperseg=min(nperseg, window))
+            keep = (f >= DEFAULT_BAND[0]) & (f <= DEFAULT_BAND[1])
+            f, p = f[keep], p[keep]
+            cumulative = np.cumsum(p)
+            mdf.append(f[np.searchsorted(cumulative, cumulative[-1] / 2)])
+            mnf.append(np.sum(f * p) / np.sum(p))
+        rows.append((mdf, mnf))
+    return rows
+
+
+def best_of(func, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    block = transform_mV(load_opensignals(os.path.join(ROOT, FILE)).window(0, np.iinfo(np.uint32).max, ES_CHANNELS))
+    print(f"{FILE}: {len(block)} samples x {block.shape[1]} channels")
+    print(f"{'window/step [ms]':>17}{'windows':>9}{'loop [win/s]':>15}{'batched [win/s]':>18}{'speedup':>9}")
+    for window_ms, step_ms in SETTINGS:
+        window, step = window_ms * fs // 1000, step_ms * fs // 1000
+        n_windows = len(spectral_table(block, fs=fs, window_ms=window_ms, step_ms=step_ms))
+        t_loop = best_of(lambda: per_window_loop(block, window, step), repeats=1)
+        t_batched = best_of(lambda: spectral_table(block, fs=fs, window_ms=window_ms, step_ms=step_ms))
+        print(f"{f'{window_ms}/{step_ms}':>17}{n_windows:>9}{n_windows / t_loop:>15,.0f}"
+              f"{n_windows / t_batched:>18,.0f}{t_loop / t_batched:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Parameter sweep: one pass per file vs. a batch run per parameter set, on the real recordings.
+
+Both compute the same tidy table (the MVC of every parameter set included);
+the loop reruns run_batch and compute_mvc once per parameter set.
+
+Run from the DUMBBELL_LOAD_TEST folder:  python benchmarks/bench_sweep.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+from emg_pipeline.batch import run_batch
+from emg_pipeline.manifest import load_manifests
+from emg_pipeline.mvc import compute_mvc
+from emg_pipeline.sweep import parameter_grid, run_sweep
+
+GRIDS = {
+    '3 IIR': dict(cutoffs=(5, 10, 20), orders=(4,)),
+    '9 IIR + 3 moving': dict(cutoffs=(5, 10, 20), orders=(2, 4, 6), methods=('iir', 'moving'),
+                             window_ms=(50, 100, 250)),
+    '27 IIR + 6 moving': dict(cutoffs=(3, 5, 8, 10, 12, 15, 20, 30, 50), orders=(2, 4, 6), methods=('iir', 'moving'),
+                              window_ms=(25, 50, 100, 150, 250, 500)),
+}
+
+
+def looped(grid, manifest):
+    # A full batch run per parameter set, with the MVC recomputed under the same settings
+    rows = []
+    for params in grid:
+        mvc_params = {key: params[key] for key in ('cutoff', 'fs', 'order', 'negative')}
+        mvc = {participant: compute_mvc(manifest.mvc_file(participant), *manifest.mvc_window(participant),
+                                        mvc_params)['values']
+               for participant in manifest.participants}
+        rows += run_batch(manifest.trials(), mvc, params=params, max_workers=1)
+    return rows
+
+
+def main():
+    manifest = load_manifests(validate=False)
+    print(f"{'grid':<20}{'sets':>6}{'loop [s]':>10}{'sweep [s]':>11}{'speedup':>9}")
+    for name, settings in GRIDS.items():
+        grid = parameter_grid(**settings)
+        iir_only = [params for params in grid if params['method'] == 'iir']
+        # compute_mvc only knows the IIR envelope, so the loop is timed on the IIR sets and scaled up
+        start = time.perf_counter()
+        looped(iir_only, manifest)
+        t_loop = (time.perf_counter() - start) * len(grid) / len(iir_only)
+        start = time.perf_counter()
+        run_sweep(grid, max_workers=1)
+        t_sweep = time.perf_counter() - start
+        print(f"{name:<20}{len(grid):>6}{t_loop:>10.2f}{t_sweep:>11.2f}{t_loop / t_sweep:>9.1f}")
+
+    # The sweep's IIR rows equal the loop's
+    grid = parameter_grid(cutoffs=(5, 20), orders=(2, 6))
+    sweep = run_sweep(grid, max_workers=1)
+    loop = looped(grid, manifest)
+    key = lambda row: (row['participant'], row['load'], row['region'], row['channel'], row['cutoff'], row['order'])
+    reference = {}
+    for params, start in zip(grid, range(0, len(loop), len(loop) // len(grid))):
+        for row in loop[start:start + len(loop) // len(grid)]:
+            reference[key(dict(row, cutoff=params['cutoff'], order=params['order']))] = row['normalized']
+    error = max(abs(row['normalized'] - reference[key(row)]) for row in sweep)
+    print(f"max |sweep - loop| normalized: {error:.2e}")
+    assert np.isfinite(error) and error < 1e-9
+
+
+if __name__ == '__main__':
+    main()
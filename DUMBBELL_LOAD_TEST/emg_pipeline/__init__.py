@@ -0,0 +1 @@
+"""Shared processing code for the dumbbell load test and MVC recordings."""
@@ -0,0 +1,279 @@
+"""Compressed archive of OpenSignals recordings with random access by sample range.
+
+The text exports spend up to six ASCII digits plus a tab on every 16-bit
+sample. An archive (``<name>.txt.osz``) stores the header JSON once and every
+column in chunks of ``chunk_rows`` samples. Each chunk is delta-encoded in its
+own dtype (uint16 differences wrap around, so decoding is a cumulative sum in
+the same dtype), split into byte planes so the mostly-zero high bytes end up
+together, and compressed with zlib (or lzma/bz2 from the standard library).
+
+The chunk index (offset, size, first and last value) sits in the JSON at the
+start of the file. A window read (``archive.window(start_freq, end_freq)``)
+finds its rows from the nSeq chunk bounds and only decompresses the chunks of
+the requested channels that overlap them.
+
+Archive recordings and compare size and decode speed with the text files:
+    python -m emg_pipeline.archive                   # every recording in the manifests
+    python -m emg_pipeline.archive PP04/PP04_8kg.txt --codec lzma
+"""
+
+import argparse
+import bz2
+import json
+import lzma
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from .channels import ES_CHANNELS, ChannelRegistry
+from .manifest import MANIFEST_DIR, load_manifests
+from .opensignals import Recording, load_opensignals
+
+ARCHIVE_SUFFIX = ".osz"
+ARCHIVE_MAGIC = b"OSARCHV1"
+
+CODECS = {
+    'zlib': (lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'lzma': (lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+    'bz2': (lambda data, level: bz2.compress(data, max(level, 1)), bz2.decompress),
+}
+
+
+def archive_path(file_path):
+    return os.fspath(file_path) + ARCHIVE_SUFFIX
+
+
+def encode_chunk(values, codec='zlib', level=6):
+    """Delta-encode, byte-shuffle and compress one chunk of an unsigned integer column."""
+    values = np.asarray(values, dtype=values.dtype.newbyteorder('<'))
+    deltas = np.empty_like(values)
+    deltas[0] = 0
+    np.subtract(values[1:], values[:-1], out=deltas[1:])  # wraps around in the unsigned dtype
+    planes = deltas.view(np.uint8).reshape(-1, values.dtype.itemsize).T
+    return CODECS[codec][0](planes.tobytes(), level)
+
+
+def decode_chunk(payload, dtype, first, codec='zlib'):
+    """Inverse of ``encode_chunk``: the chunk's values, starting at ``first``."""
+    dtype = np.dtype(dtype).newbyteorder('=')
+    planes = np.frombuffer(CODECS[codec][1](payload), dtype=np.uint8).reshape(dtype.itemsize, -1)
+    # Reassemble the bytes with shifts: a few times faster than transposing the planes back
+    values = planes[-1].astype(dtype)
+    for plane in planes[-2::-1]:
+        values <<= 8
+        values |= plane
+    np.cumsum(values, out=values)
+    values += dtype.type(first)
+    return values
+
+
+def write_archive(path, devices, columns, chunk_rows=8192, codec='zlib', level=6):
+    """Write columns (dict in file order) and the header as an archive; returns its size in bytes."""
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {tuple(CODECS)}, not {codec!r}")
+    names = list(columns)
+    n_rows = len(columns[names[0]]) if names else 0
+    layout, payloads, offset = [], [], 0
+    for name in names:
+        column = np.asarray(columns[name])
+        chunks = []
+        for start in range(0, n_rows, chunk_rows):
+            values = column[start:start + chunk_rows]
+            payload = encode_chunk(values, codec, level)
+            chunks.append([offset, len(payload), int(values[0]), int(values[-1])])
+            payloads.append(payload)
+            offset += len(payload)
+        entry = {'name': name, 'dtype': column.dtype.str, 'chunks': chunks}
+        if name == 'nSeq':
+            entry['sorted'] = n_rows < 2 or bool(np.all(column[1:] >= column[:-1]))
+        layout.append(entry)
+
+    meta = {'n_rows': n_rows, 'chunk_rows': chunk_rows, 'codec': codec, 'columns': layout, 'devices': devices}
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(ARCHIVE_MAGIC)
+        f.write(struct.pack('<Q', len(meta_bytes)))
+        f.write(meta_bytes)
+        for payload in payloads:
+            f.write(payload)
+        size = f.tell()
+    os.replace(tmp, path)
+    return size
+
+
+def archive_recording(file_path, path=None, **kwargs):
+    """Archive an OpenSignals text export next to it (``<file>.osz``); returns the archive path."""
+    path = archive_path(file_path) if path is None else path
+    recording = load_opensignals(file_path)
+    write_archive(path, recording.devices, recording.columns, **kwargs)
+    return path
+
+
+class Archive:
+    """Read access to an archive; columns and windows are decoded on demand, chunk by chunk."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not an OpenSignals archive")
+            (meta_size,) = struct.unpack('<Q', f.read(8))
+            meta = json.loads(f.read(meta_size).decode('utf-8'))
+        self.data_start = len(ARCHIVE_MAGIC) + 8 + meta_size
+        self.n_rows = meta['n_rows']
+        self.chunk_rows = meta['chunk_rows']
+        self.codec = meta['codec']
+        self.devices = meta['devices']
+        self.header = next(iter(self.devices.values()))
+        self.layout = {entry['name']: entry for entry in meta['columns']}
+        self.column_names = list(self.layout)
+        self.channels = ChannelRegistry(self.header)
+
+    def __len__(self):
+        return self.n_rows
+
+    def __repr__(self):
+        return f"Archive({self.path!r}, rows={self.n_rows}, columns={self.column_names})"
+
+    @property
+    def sampling_rate(self):
+        return self.header['sampling rate']
+
+    def _chunks(self, name, first_chunk, last_chunk):
+        # Decoded chunks first_chunk..last_chunk of a column, read with one seek
+        entry = self.layout[name]
+        chunks = entry['chunks'][first_chunk:last_chunk + 1]
+        with open(self.path, 'rb') as f:
+            f.seek(self.data_start + chunks[0][0])
+            data = f.read(chunks[-1][0] + chunks[-1][1] - chunks[0][0])
+        base = chunks[0][0]
+        return np.concatenate([decode_chunk(data[offset - base:offset - base + size], entry['dtype'], first,
+                                            self.codec)
+                               for offset, size, first, _ in chunks])
+
+    def read(self, name, start=0, stop=None):
+        """Rows [start, stop) of one column (header column or channel name), decoding only their chunks."""
+        name = name if name in self.layout else self.channels.column(name)
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        if start >= stop:
+            return np.empty(0, dtype=self.layout[name]['dtype'])
+        first_chunk, last_chunk = start // self.chunk_rows, (stop - 1) // self.chunk_rows
+        values = self._chunks(name, first_chunk, last_chunk)
+        offset = first_chunk * self.chunk_rows
+        return values[start - offset:stop - offset]
+
+    def __getitem__(self, name):
+        return self.read(name)
+
+    def window_rows(self, start_freq, end_freq):
+        """Rows with start_freq <= nSeq <= end_freq, like ``Recording.window_rows``.
+
+        A slice found from the chunk bounds and the boundary chunks when nSeq
+        is sorted; otherwise the indices of exactly the matching rows.
+        """
+        entry = self.layout['nSeq']
+        if not entry['sorted']:
+            nseq = self.read('nSeq')
+            return np.flatnonzero((nseq >= start_freq) & (nseq <= end_freq))
+        lasts = np.array([chunk[3] for chunk in entry['chunks']])
+        # First chunk that reaches start_freq and last chunk that starts at or before end_freq
+        first_chunk = int(np.searchsorted(lasts, start_freq, side='left'))
+        firsts = np.array([chunk[2] for chunk in entry['chunks']])
+        last_chunk = int(np.searchsorted(firsts, end_freq, side='right')) - 1
+        if first_chunk > last_chunk:
+            return slice(0, 0)
+        nseq = self._chunks('nSeq', first_chunk, last_chunk)
+        offset = first_chunk * self.chunk_rows
+        return slice(offset + int(np.searchsorted(nseq, start_freq, side='left')),
+                     offset + int(np.searchsorted(nseq, end_freq, side='right')))
+
+    def read_rows(self, name, rows):
+        """One column at ``rows`` from ``window_rows`` (a slice or increasing row indices)."""
+        if isinstance(rows, slice):
+            return self.read(name, rows.start, rows.stop)
+        if len(rows) == 0:
+            return self.read(name, 0, 0)
+        # Decode the chunks from the first to the last row once, then pick the rows
+        return self.read(name, int(rows[0]), int(rows[-1]) + 1)[rows - rows[0]]
+
+    def window(self, start_freq, end_freq, names=ES_CHANNELS):
+        """Raw counts (N, C) of the named channels for an nSeq window, like ``Recording.window``."""
+        rows = self.window_rows(start_freq, end_freq)
+        return np.column_stack([self.read_rows(name, rows) for name in self.channels.resolve(names)])
+
+    def to_recording(self):
+        """A ``Recording`` with every column decoded."""
+        return Recording(self.path, self.devices, {name: self.read(name) for name in self.column_names})
+
+
+def compare_with_text(file_path, path=None, repeats=3, window_s=5.0):
+    """Sizes and decode speed of one recording as text and as archive.
+
+    Returns a dict with both sizes, the ratio, full-parse and full-decode
+    times and the time of a ``window_s`` window of the four ES channels.
+    """
+    path = archive_path(file_path) if path is None else path
+
+    def best(func):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    archive = Archive(path)
+    n_rows = len(archive)
+    fs = archive.sampling_rate
+    middle = int(archive.read('nSeq', n_rows // 2, n_rows // 2 + 1)[0])
+    window = (middle, middle + int(window_s * fs) - 1)
+    text_size, archive_size = os.path.getsize(file_path), os.path.getsize(path)
+    return {
+        'file': file_path, 'rows': n_rows, 'text_bytes': text_size, 'archive_bytes': archive_size,
+        'ratio': text_size / archive_size,
+        'parse': best(lambda: load_opensignals(file_path, use_cache=False)),
+        'decode': best(lambda: Archive(path).to_recording()),
+        'text_window': best(lambda: load_opensignals(file_path, use_cache=False).window(*window)),
+        'archive_window': best(lambda: Archive(path).window(*window)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive OpenSignals recordings and compare them with the text.')
+    parser.add_argument('files', nargs='*', help='recordings to archive (default: every recording in the manifests)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--codec', choices=tuple(CODECS), default='zlib')
+    parser.add_argument('--level', type=int, default=6)
+    parser.add_argument('--chunk-rows', type=int, default=8192, help='samples per compressed chunk')
+    args = parser.parse_args()
+
+    files = args.files
+    if not files:
+        manifest = load_manifests(folder=args.manifests, validate=False)
+        files = list(dict.fromkeys([manifest.path(trial) for trial in manifest.trials()]
+                                   + [manifest.mvc_file(participant) for participant in manifest.participants]))
+
+    print(f"{'recording':<24}{'text [kB]':>10}{'archive [kB]':>13}{'ratio':>7}{'parse [ms]':>12}{'decode [ms]':>12}"
+          f"{'5 s window text/archive [ms]':>30}")
+    totals = {'text_bytes': 0, 'archive_bytes': 0, 'rows': 0, 'parse': 0.0, 'decode': 0.0}
+    for file_path in files:
+        archive_recording(file_path, codec=args.codec, level=args.level, chunk_rows=args.chunk_rows)
+        report = compare_with_text(file_path)
+        for key in totals:
+            totals[key] += report[key]
+        print(f"{os.path.relpath(file_path):<24}{report['text_bytes'] / 1e3:>10.0f}"
+              f"{report['archive_bytes'] / 1e3:>13.0f}"
+              f"{report['ratio']:>7.1f}{report['parse'] * 1e3:>12.1f}{report['decode'] * 1e3:>12.2f}"
+              f"{report['text_window'] * 1e3:>20.1f} / {report['archive_window'] * 1e3:.2f}")
+    print(f"total: {totals['text_bytes'] / 1e6:.1f} MB text -> {totals['archive_bytes'] / 1e6:.2f} MB archive "
+          f"({totals['text_bytes'] / totals['archive_bytes']:.1f}x); "
+          f"parse {totals['rows'] / totals['parse'] / 1e6:.1f} M rows/s, "
+          f"decode {totals['rows'] / totals['decode'] / 1e6:.1f} M rows/s")
+
+
+if __name__ == '__main__':
+    main()
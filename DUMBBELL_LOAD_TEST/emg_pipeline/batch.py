@@ -0,0 +1,217 @@
+"""Batch processing of all participants and loads in a process pool.
+
+Each job is one (participant, load, region) ``Trial`` from the session
+manifests (see ``manifest.py``) with its nSeq window. A worker loads the
+recording, selects the region's channels, computes the RMS envelopes, extracts
+the amplitude features and normalizes them by the MVC, optionally saving a
+figure with a non-interactive backend. With ``quality`` the raw counts are
+screened first (see ``quality.py``): 'annotate' adds each channel's status to
+its row, 'skip' drops trials with a bad channel.
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.batch --workers 4 --figures figures
+    python -m emg_pipeline.batch PP04 PP05 --scaling
+    python -m emg_pipeline.batch PP07 --store      # append a new participant to the results store
+    python -m emg_pipeline.batch --quality skip    # leave out trials with a bad channel
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .channels import transform_mV
+from .envelope import ENVELOPE_METHODS, compute_envelope
+from .manifest import DATA_ROOT, MANIFEST_DIR, REGION_CHANNELS, load_manifests
+from .mvc import DEFAULT_MVC_PARAMS, lookup_mvc
+from .opensignals import load_opensignals
+from .plotting import envelope_figure
+from .profiling import pool_map, profiled, stage
+from .quality import quality_summary, screen_raw
+from .results import RESULTS_PATH, ResultsStore, normalize_params
+
+# Envelope settings shared by all experiment scripts; 'method': 'moving' with 'window_ms' selects the moving RMS
+DEFAULT_PARAMS = {'method': 'iir', 'cutoff': 10, 'fs': 1000, 'order': 4, 'negative': 'abs'}
+
+QUALITY_MODES = ('annotate', 'skip')
+
+
+def save_envelope_figure(job, envelopes, names, figure_dir):
+    """Plot the region's envelopes with their maxima to a PNG, without a GUI and with downsampled traces."""
+    path = os.path.join(figure_dir, f'{job.participant}_{job.load}kg_{job.region}.png')
+    return envelope_figure(path, envelopes, names, f'{job.participant} {job.load} kg {job.region}')
+
+
+@profiled('process_job')
+def process_job(job, mvc=None, params=DEFAULT_PARAMS, figure_dir=None, data_root=DATA_ROOT, quality=None):
+    """Load -> select channels -> envelope -> features -> normalize for one job; returns result rows."""
+    names = REGION_CHANNELS[job.region]
+    recording = load_opensignals(os.path.join(data_root, job.file_path))
+    with stage('select'):
+        raw = recording.window(job.start_freq, job.end_freq, names)
+    if quality is not None:
+        with stage('quality', raw.nbytes):
+            summary = quality_summary(screen_raw(raw, params['fs']), names)
+        if quality == 'skip' and np.any(summary['status'] == 'bad'):
+            return []
+    transformed_data = transform_mV(raw)
+    envelopes = compute_envelope(transformed_data, **params)
+
+    with stage('features', envelopes.nbytes):
+        peaks = envelopes.max(axis=0)
+        mid_range = (peaks + envelopes.min(axis=0)) / 2
+
+    rows = []
+    for k, name in enumerate(names):
+        mvc_value = None if mvc is None else mvc[name]
+        rows.append({
+            'participant': job.participant, 'load': job.load, 'region': job.region,
+            'side': name.split()[-1], 'channel': name,
+            'peak_rms': float(peaks[k]), 'mid_range_rms': float(mid_range[k]),
+            'mvc': mvc_value,
+            'normalized': None if mvc_value is None else float(mid_range[k] / mvc_value),
+        })
+        if quality is not None:
+            rows[-1]['quality'] = str(summary['status'][k])
+
+    if figure_dir is not None:
+        with stage('figure'):
+            save_envelope_figure(job, envelopes, names, figure_dir)
+    return rows
+
+
+def _run_job(args):
+    job, mvc, params, figure_dir, data_root, quality = args
+    return process_job(job, mvc, params, figure_dir, data_root, quality)
+
+
+def mvc_params(params):
+    """MVC envelope settings that go with the trial ``params``.
+
+    IIR runs use the MVC scripts' settings (``DEFAULT_MVC_PARAMS``), any other
+    method computes the MVC with the same envelope as the trials, so the
+    normalized values never divide one envelope method by another.
+    """
+    if params.get('method', 'iir') == 'iir':
+        return DEFAULT_MVC_PARAMS
+    return {key: params[key] for key in ('method', 'fs', 'window_ms') if key in params}
+
+
+def manifest_jobs(participants=None, folder=MANIFEST_DIR, params=DEFAULT_PARAMS):
+    """Jobs and MVC values (per participant, keyed by channel) of every manifest in ``folder``.
+
+    IIR runs use the manifests' MVC; other methods compute (and cache) it with ``mvc_params(params)``.
+    """
+    manifest = load_manifests(participants, folder)
+    if params.get('method', 'iir') == 'iir':
+        return manifest.trials(), {participant: manifest.mvc(participant) for participant in manifest.participants}
+    settings = mvc_params(params)
+    mvc = {participant: dict(lookup_mvc(manifest.mvc_file(participant), *manifest.mvc_window(participant),
+                                        settings, manifest.mvc_cache)['values'])
+           for participant in manifest.participants}
+    return manifest.trials(), mvc
+
+
+def run_batch(jobs=None, mvc=None, params=DEFAULT_PARAMS, max_workers=None, figure_dir=None, data_root=DATA_ROOT,
+              quality=None):
+    """Process all jobs, in a process pool when max_workers != 1; rows come back in job order.
+
+    Without ``jobs`` every trial of the manifests is processed. ``quality`` is
+    None, 'annotate' or 'skip' (see ``process_job``).
+    """
+    if quality not in (None,) + QUALITY_MODES:
+        raise ValueError(f"quality must be one of {QUALITY_MODES} or None, not {quality!r}")
+    if jobs is None:
+        jobs, manifest_mvc = manifest_jobs(params=params)
+        mvc = manifest_mvc if mvc is None else mvc
+    tasks = [(job, None if mvc is None else mvc.get(job.participant), params, figure_dir, data_root, quality)
+             for job in jobs]
+    if max_workers == 1:
+        results = map(_run_job, tasks)
+        return [row for rows in results for row in rows]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = pool_map(executor, _run_job, tasks)
+        return [row for rows in results for row in rows]
+
+
+def scaling_report(jobs=None, mvc=None, max_workers=None, repeats=1, **kwargs):
+    """Wall-clock time of run_batch for 1..max_workers processes: [(workers, seconds, speedup)]."""
+    if jobs is None:
+        jobs, mvc = manifest_jobs(params=kwargs.get('params', DEFAULT_PARAMS))
+    max_workers = max_workers or os.cpu_count() or 1
+    report = []
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            run_batch(jobs, mvc, max_workers=workers, **kwargs)
+        elapsed = (time.perf_counter() - start) / repeats
+        report.append((workers, elapsed, report[0][1] / elapsed if report else 1.0))
+    return report
+
+
+def ensure_results(store, participants=None, params=DEFAULT_PARAMS, max_workers=None, folder=MANIFEST_DIR):
+    """Process and append only the participants whose results are not in ``store`` yet; returns them."""
+    if participants is None:
+        participants = load_manifests(folder=folder, validate=False).participants
+    missing = [p for p in participants if p not in set(store.participants('normalized', params))]
+    if missing:
+        jobs, mvc = manifest_jobs(missing, folder, params)
+        store.append(run_batch(jobs, mvc, params, max_workers), params)
+    return missing
+
+
+def print_results(rows):
+    quality = bool(rows) and 'quality' in rows[0]
+    print(f"{'participant':<12}{'load':>5}  {'region':<9}{'side':<6}{'peak':>8}{'mid-range':>11}{'mvc':>8}{'norm.':>8}"
+          + ('  quality' if quality else ''))
+    for row in rows:
+        mvc = '' if row['mvc'] is None else f"{row['mvc']:.4f}"
+        normalized = '' if row['normalized'] is None else f"{row['normalized']:.4f}"
+        print(f"{row['participant']:<12}{row['load']:>5}  {row['region']:<9}{row['side']:<6}{row['peak_rms']:>8.4f}"
+              f"{row['mid_range_rms']:>11.4f}{mvc:>8}{normalized:>8}" + (f"  {row['quality']}" if quality else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process all participants and loads in a process pool.')
+    parser.add_argument('participants', nargs='*', help='participants to process (default: every manifest)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--figures', default=None, help='folder to save one figure per job to')
+    parser.add_argument('--method', choices=ENVELOPE_METHODS, default=DEFAULT_PARAMS['method'],
+                        help='envelope method: IIR low-pass of the squared signal or moving-window RMS')
+    parser.add_argument('--window-ms', type=float, default=100, help='moving RMS window length in ms')
+    parser.add_argument('--store', nargs='?', const=RESULTS_PATH, default=None,
+                        help=f'append the results to a SQLite results store (default: {os.path.basename(RESULTS_PATH)})')
+    parser.add_argument('--quality', choices=QUALITY_MODES, default=None,
+                        help='screen the raw signals: annotate every row, or skip trials with a bad channel')
+    parser.add_argument('--scaling', action='store_true', help='report wall-clock scaling from 1 to --workers cores')
+    args = parser.parse_args()
+    params = dict(DEFAULT_PARAMS, method=args.method)
+    if args.method == 'moving':
+        params['window_ms'] = args.window_ms
+    params = normalize_params(params)
+    jobs, mvc = manifest_jobs(args.participants or None, args.manifests, params)
+
+    if args.scaling:
+        report = scaling_report(jobs, mvc, args.workers, params=params, figure_dir=args.figures)
+        for workers, elapsed, speedup in report:
+            print(f"{workers:>3} workers: {elapsed:8.3f} s  speedup {speedup:5.2f}x")
+        return
+
+    rows = run_batch(jobs, mvc, params, args.workers, args.figures, quality=args.quality)
+    print_results(rows)
+    if args.quality == 'skip':
+        kept = {(row['participant'], row['load'], row['region']) for row in rows}
+        skipped = [job for job in jobs if (job.participant, job.load, job.region) not in kept]
+        for job in skipped:
+            print(f"skipped {job.participant} {job.load} kg {job.region}: bad signal quality")
+    if args.store is not None:
+        with ResultsStore(args.store) as store:
+            print(f"{store.append(rows, params)} values stored in {args.store}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Named channels resolved from the OpenSignals header.
+
+The header lists the device inputs (``"label"``), the sensor type on each input
+(``"sensor"``) and the column order of the export (``"column"``). The electrode
+placement below maps the muscles we recorded onto those inputs, so scripts can
+ask for ``'ES-L left'`` instead of remembering that it is column 5 of the file.
+"""
+
+import numpy as np
+
+from .profiling import profiled
+
+# Electrode placement used for every session: channel name -> (device label, expected sensor)
+DEFAULT_PLACEMENT = {
+    'GONIO 1': ('CH1', 'GONIO'),
+    'GONIO 2': ('CH2', 'GONIO'),
+    'ES-T left': ('CH3', 'EMG'),
+    'ES-L left': ('CH4', 'EMG'),
+    'ES-T right': ('CH5', 'EMG'),
+    'ES-L right': ('CH6', 'EMG'),
+}
+
+# The four erector spinae channels in the order the scripts have always used
+ES_CHANNELS = ['ES-T left', 'ES-L left', 'ES-T right', 'ES-L right']
+THORACIC_CHANNELS = ['ES-T left', 'ES-T right']
+LUMBAR_CHANNELS = ['ES-L left', 'ES-L right']
+GONIO_CHANNELS = ['GONIO 1', 'GONIO 2']
+REGION_CHANNELS = {'thoracic': THORACIC_CHANNELS, 'lumbar': LUMBAR_CHANNELS}
+
+
+@profiled('transform_mV', nbytes=lambda emg_data, *args, **kwargs: np.asarray(emg_data).nbytes)
+def transform_mV(emg_data, out=None):
+    """Convert raw 16-bit ADC counts to mV (float64 unless ``out`` says otherwise)."""
+    if out is None:
+        return (emg_data - ((2**16 - 1) / 2)) / 32768
+    np.subtract(emg_data, (2**16 - 1) / 2, out=out)
+    np.divide(out, 32768, out=out)
+    return out
+
+
+class ChannelRegistry:
+    """Resolve channel names to column names of one recording's header."""
+
+    def __init__(self, header, placement=None):
+        self.header = header
+        self.placement = dict(DEFAULT_PLACEMENT if placement is None else placement)
+        self.columns = list(header['column'])
+        self.sensors = dict(zip(header['label'], header['sensor']))
+
+        for name, (label, sensor) in self.placement.items():
+            if label not in self.sensors:
+                continue
+            if self.sensors[label] != sensor:
+                raise ValueError(f"Channel {name} expects a {sensor} sensor on {label}, "
+                                 f"the header says {self.sensors[label]}")
+
+    @property
+    def names(self):
+        """Channel names that are present in this recording."""
+        return [name for name, (label, _) in self.placement.items() if label in self.sensors]
+
+    def column(self, name):
+        """Return the header column name for a channel name, label or column name."""
+        if name in self.placement:
+            label = self.placement[name][0]
+            if label not in self.columns:
+                raise KeyError(f"Channel {name} ({label}) is not in this recording")
+            return label
+        if name in self.columns:
+            return name
+        raise KeyError(f"Unknown channel {name!r}; known channels are {self.names}")
+
+    def index(self, name):
+        """Return the column position of a channel in the text export."""
+        return self.columns.index(self.column(name))
+
+    def sensor(self, name):
+        return self.sensors.get(self.column(name))
+
+    def resolve(self, names):
+        return [self.column(name) for name in names]
+
+    def by_sensor(self, sensor):
+        """Channel names whose input carries the given sensor type, e.g. 'EMG'."""
+        return [name for name in self.names if self.sensor(name) == sensor]
+
+
+def nseq_window(nseq, start_freq, end_freq, is_sorted=None):
+    """Rows with start_freq <= nSeq <= end_freq.
+
+    Returns a slice when nSeq is sorted (a plain view, found by binary search)
+    and falls back to a boolean mask otherwise. Pass ``is_sorted`` when it is
+    already known to skip the O(N) check.
+    """
+    if is_sorted is None:
+        is_sorted = len(nseq) < 2 or bool(np.all(nseq[1:] >= nseq[:-1]))
+    if is_sorted:
+        start = np.searchsorted(nseq, start_freq, side='left')
+        end = np.searchsorted(nseq, end_freq, side='right')
+        return slice(int(start), int(end))
+    return (nseq >= start_freq) & (nseq <= end_freq)
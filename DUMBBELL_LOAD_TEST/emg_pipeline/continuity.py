@@ -0,0 +1,201 @@
+"""nSeq continuity check and dropped-sample repair for Bluetooth recordings.
+
+The biosignalsplux streams over Bluetooth (``"device connection": "BTH..."``
+in the header), and the scripts use ``nSeq`` as a clean sample index when they
+select windows (``frequency >= start_freq``). A dropped packet leaves a gap in
+nSeq, a resent one a duplicate, and a counter that overflows wraps back to
+zero. One ``np.diff`` over the whole column finds all of them. Steps are
+taken from the highest nSeq so far, so the sample after an out-of-order one
+does not look like a gap:
+
+- step 1: continuous;
+- step > 1: a gap of step - 1 dropped samples;
+- step 0: a duplicate sample;
+- step < 0: a wraparound when adding the counter modulus gives a small
+  forward step, otherwise the sample went backwards (out of order).
+
+``repair_recording`` rebuilds a recording on a continuous nSeq grid:
+duplicates and out-of-order samples are dropped, and the missing samples are
+linearly interpolated or masked (EMG at mid-scale, i.e. 0 mV, other channels
+holding their last value). A mask of the inserted samples comes back with it,
+so time-based windows and filters see the right number of samples.
+
+Report the dropped-sample rate of recordings, or of every recording in the manifests:
+    python -m emg_pipeline.continuity PP04/PP04_8kg.txt --events
+    python -m emg_pipeline.continuity
+"""
+
+import argparse
+import os
+
+import numpy as np
+
+from .manifest import MANIFEST_DIR, load_manifests
+from .opensignals import Recording, load_opensignals
+
+EVENT_KINDS = ('gap', 'duplicate', 'wrap', 'backward')
+REPAIR_METHODS = ('interpolate', 'mask')
+
+# row: index of the sample after the event; nseq: its nSeq; samples: see continuity_events
+EVENT_DTYPE = np.dtype([('row', np.int64), ('nseq', np.int64), ('kind', 'U9'), ('samples', np.int64)])
+
+EMG_MID_SCALE = 2**15  # (2**16 - 1) / 2 rounded: 0 mV after transform_mV
+
+
+def infer_modulus(nseq):
+    """Counter modulus of nSeq: the power of two above its maximum (2**4 for a 4-bit counter)."""
+    top = int(np.max(nseq)) if len(nseq) else 0
+    return 1 << max(top, 1).bit_length()
+
+
+def nseq_steps(nseq, modulus=None):
+    """(steps, wraps): the nSeq differences with wraparounds unwrapped, and where they occurred.
+
+    A backward step counts as a wraparound when adding ``modulus`` turns it
+    into a forward step of at most half the modulus.
+    """
+    steps = np.diff(np.asarray(nseq, dtype=np.int64))
+    modulus = infer_modulus(nseq) if modulus is None else modulus
+    wraps = (steps < 0) & (steps + modulus > 0) & (steps + modulus <= modulus // 2)
+    steps[wraps] += modulus
+    return steps, wraps
+
+
+def _advances(nseq, modulus=None):
+    # (unwrapped nSeq, step of every sample past the highest nSeq before it, wraps)
+    nseq = np.asarray(nseq)
+    if len(nseq) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=bool)
+    steps, wraps = nseq_steps(nseq, modulus)
+    unwrapped = np.empty(len(nseq), dtype=np.int64)
+    unwrapped[0] = nseq[0]
+    np.cumsum(steps, out=unwrapped[1:])
+    unwrapped[1:] += nseq[0]
+    highest = np.maximum.accumulate(unwrapped)
+    return unwrapped, unwrapped[1:] - highest[:-1], wraps
+
+
+def unwrap_nseq(nseq, modulus=None):
+    """nSeq as an int64 counter that keeps counting past every wraparound."""
+    return _advances(nseq, modulus)[0]
+
+
+def continuity_events(nseq, modulus=None):
+    """Every discontinuity of nSeq as an ``EVENT_DTYPE`` table, in file order.
+
+    ``samples`` is the number of dropped samples for a gap or a wrap (0 for a
+    clean wrap) and the step back for a duplicate (0) or backward sample.
+    """
+    _, advances, wraps = _advances(nseq, modulus)
+    codes = np.zeros(len(advances), dtype=np.int8)
+    codes[advances > 1] = 1
+    codes[advances == 0] = 2
+    codes[wraps & (advances > 0)] = 3
+    codes[advances < 0] = 4
+    rows = np.flatnonzero(codes)
+    events = np.empty(len(rows), dtype=EVENT_DTYPE)
+    events['row'] = rows + 1
+    events['nseq'] = np.asarray(nseq)[rows + 1]
+    events['kind'] = np.array(('',) + EVENT_KINDS)[codes[rows]]
+    events['samples'] = np.where(advances[rows] > 0, advances[rows] - 1, advances[rows])
+    return events
+
+
+def continuity_report(nseq, modulus=None):
+    """Summary of one nSeq column: counts per kind of event and the dropped-sample rate.
+
+    ``expected`` is the number of samples from the first to the highest nSeq;
+    ``dropped`` the ones of those that never arrived.
+    """
+    unwrapped, advances, wraps = _advances(nseq, modulus)
+    expected = int(unwrapped.max() - unwrapped[0]) + 1 if len(unwrapped) else 0
+    dropped = max(expected - 1 - int(np.count_nonzero(advances > 0)), 0)
+    return {
+        'samples': len(nseq), 'expected': expected, 'dropped': dropped,
+        'gaps': int(np.count_nonzero(advances > 1)), 'duplicates': int(np.count_nonzero(advances == 0)),
+        'wraps': int(np.count_nonzero(wraps)), 'backward': int(np.count_nonzero(advances < 0)),
+        'drop_rate': dropped / expected if expected else 0.0,
+    }
+
+
+def repair_recording(recording, method='interpolate', modulus=None):
+    """(recording, inserted): a copy of ``recording`` on a continuous nSeq, and a mask of the inserted rows.
+
+    method: 'interpolate' fills missing samples linearly between their
+    neighbours; 'mask' sets EMG channels to mid-scale (0 mV) and holds the
+    last value of the other columns. Duplicates and samples that go backwards
+    are dropped. A continuous recording comes back unchanged.
+    """
+    if method not in REPAIR_METHODS:
+        raise ValueError(f"method must be one of {REPAIR_METHODS}, not {method!r}")
+    nseq = recording['nSeq']
+    if len(nseq) < 2:
+        return recording, np.zeros(len(nseq), dtype=bool)
+    unwrapped, advances, _ = _advances(nseq, modulus)
+    if np.all(advances == 1):
+        return recording, np.zeros(len(nseq), dtype=bool)
+
+    # Keep a sample only when it is beyond every sample before it
+    keep = np.ones(len(unwrapped), dtype=bool)
+    keep[1:] = advances > 0
+    positions = unwrapped[keep] - unwrapped[0]
+    total = int(positions[-1]) + 1
+    inserted = np.ones(total, dtype=bool)
+    inserted[positions] = False
+    missing = np.flatnonzero(inserted)
+    # Last kept sample before every missing one
+    previous = np.searchsorted(positions, missing) - 1
+
+    sensors = dict(zip(recording.header.get('label', []), recording.header.get('sensor', [])))
+    columns = {}
+    for name, column in recording.columns.items():
+        if name == 'nSeq':
+            first = int(unwrapped[0])
+            dtype = column.dtype if first + total - 1 <= np.iinfo(column.dtype).max else np.int64
+            columns[name] = np.arange(first, first + total, dtype=dtype)
+            continue
+        values = np.asarray(column)[keep]
+        repaired = np.empty(total, dtype=column.dtype)
+        repaired[positions] = values
+        if method == 'interpolate':
+            repaired[missing] = np.rint(np.interp(missing, positions, values))
+        elif sensors.get(name) == 'EMG':
+            repaired[missing] = EMG_MID_SCALE
+        else:
+            repaired[missing] = values[previous]
+        columns[name] = repaired
+    return Recording(recording.file_path, recording.devices, columns, from_cache=False), inserted
+
+
+def print_report(label, report):
+    print(f"{label:<28}{report['samples']:>9}{report['expected']:>10}{report['dropped']:>9}"
+          f"{report['drop_rate']:>9.3%}{report['gaps']:>6}{report['duplicates']:>6}{report['wraps']:>6}"
+          f"{report['backward']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the nSeq column of recordings for dropped samples.')
+    parser.add_argument('files', nargs='*', help='recordings to check (default: every recording in the manifests)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--modulus', type=int, default=None, help='nSeq counter modulus (default: inferred)')
+    parser.add_argument('--events', action='store_true', help='list every gap, duplicate and wraparound')
+    args = parser.parse_args()
+
+    files = args.files
+    if not files:
+        manifest = load_manifests(folder=args.manifests, validate=False)
+        files = list(dict.fromkeys([manifest.path(trial) for trial in manifest.trials()]
+                                   + [manifest.mvc_file(participant) for participant in manifest.participants]))
+
+    print(f"{'recording':<28}{'samples':>9}{'expected':>10}{'dropped':>9}{'rate':>9}"
+          f"{'gaps':>6}{'dupl.':>6}{'wraps':>6}{'back':>6}")
+    for file_path in files:
+        nseq = load_opensignals(file_path)['nSeq']
+        print_report(os.path.relpath(file_path), continuity_report(nseq, args.modulus))
+        if args.events:
+            for event in continuity_events(nseq, args.modulus):
+                print(f"    row {event['row']:>9}  nSeq {event['nseq']:>10}  {event['kind']:<9}  {event['samples']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Multi-channel RMS envelope: square -> low-pass -> rectify -> sqrt.
+
+This is the envelope every script computed channel by channel. Here all
+channels of an (N, C) block are done at once, and apart from the filter
+output no intermediate arrays are allocated.
+
+``moving_rms`` is the alternative without a filter: the RMS over a trailing
+window, from one cumulative sum of the squared signal, for several window
+lengths at once. ``compute_envelope`` selects either method by name.
+"""
+
+import numpy as np
+from scipy import signal
+
+from .channels import transform_mV
+from .filters import butter_sos
+from .profiling import profiled, stage
+
+
+@profiled('rms_envelope', nbytes=lambda block, *args, **kwargs: np.asarray(block).nbytes)
+def rms_envelope(block, cutoff=10, fs=1000, order=4, dtype=np.float64, out=None,
+                 negative='clip', overwrite_input=False):
+    """RMS envelope of every column of ``block`` (N, C), or of a single 1-D signal.
+
+    dtype: np.float64, or np.float32 to halve the memory traffic (the filter
+        then also runs in single precision; about 1e-4 relative error on our recordings).
+    out: optional preallocated (N, C) array of ``dtype`` that receives the result.
+    negative: how to treat the small negative values the low-pass leaves behind
+        after squaring: 'clip' sets them to zero, 'abs' takes their magnitude
+        (what the four-channel experiment scripts did).
+    overwrite_input: square ``block`` in place when it already has ``dtype``.
+    """
+    dtype = np.dtype(dtype)
+    block = np.asarray(block)
+
+    one_channel = block.ndim == 1
+    if one_channel:
+        block = block[:, np.newaxis]
+
+    # Square channel-major (C, N) so the filter runs along contiguous rows;
+    # reuse the input's memory when it already is channel-major and may be overwritten
+    channels = block.T
+    if overwrite_input and channels.dtype == dtype and channels.flags.c_contiguous:
+        squared = np.square(channels, out=channels)
+    else:
+        squared = np.empty(channels.shape, dtype=dtype)
+        np.square(channels, out=squared, casting='same_kind')
+
+    with stage('butter'):
+        sos = butter_sos(cutoff, fs, order, 'low').astype(dtype, copy=False)
+    with stage('sosfilt', squared.nbytes):
+        filtered = signal.sosfilt(sos, squared, axis=-1)
+
+    if negative == 'clip':
+        np.maximum(filtered, 0, out=filtered)
+    elif negative == 'abs':
+        np.abs(filtered, out=filtered)
+    else:
+        raise ValueError(f"negative must be 'clip' or 'abs', not {negative!r}")
+
+    if out is not None:
+        target = out[:, np.newaxis] if one_channel else out
+        np.sqrt(filtered, out=target.T)
+        return out
+
+    envelopes = np.sqrt(filtered, out=filtered).T
+    return envelopes[:, 0] if one_channel else envelopes
+
+
+def rms_envelope_mV(raw, cutoff=10, fs=1000, order=4, dtype=np.float64, out=None, negative='clip'):
+    """RMS envelope straight from raw 16-bit counts (e.g. ``recording.window(...)``)."""
+    # Convert straight into a channel-major buffer that rms_envelope may square in place
+    raw = np.asarray(raw)
+    mV = transform_mV(raw.T, out=np.empty(raw.T.shape, dtype=dtype)).T
+    return rms_envelope(mV, cutoff, fs, order, dtype=dtype, out=out, negative=negative, overwrite_input=True)
+
+
+ENVELOPE_METHODS = ('iir', 'moving')
+
+
+@profiled('moving_rms', nbytes=lambda block, *args, **kwargs: np.asarray(block).nbytes)
+def moving_rms(block, window_ms=(50, 100, 250), fs=1000, step=1, dtype=np.float64):
+    """Trailing moving RMS of every column of ``block`` (N, C) for several window lengths.
+
+    window_ms: window lengths in milliseconds.
+    step: only emit every step-th sample (samples 0, step, 2 * step, ...).
+    Returns a (W, ceil(N / step), C) array, or (W, ceil(N / step)) for 1-D input.
+    The first samples use the part of the window that has been recorded so far.
+
+    One cumulative sum of the squares makes every output sample two lookups,
+    so the cost per sample does not depend on the window length.
+    """
+    block = np.asarray(block)
+    one_channel = block.ndim == 1
+    if one_channel:
+        block = block[:, np.newaxis]
+    n = len(block)
+
+    # Cumulative sum in float64 whatever the output dtype: the differences of large sums need the precision
+    cumsum = np.empty((n + 1, block.shape[1]), dtype=np.float64)
+    cumsum[0] = 0
+    np.square(block, out=cumsum[1:], casting='same_kind')
+    np.cumsum(cumsum[1:], axis=0, out=cumsum[1:])
+
+    sizes = np.maximum(1, np.round(np.asarray(window_ms, dtype=np.float64) * fs / 1000).astype(np.int64))
+    ends = cumsum[1::step]
+    counts = np.arange(0, n, step) + 1
+    power = np.empty((len(sizes),) + ends.shape)
+    for k, size in enumerate(sizes):
+        # Outputs before `full` have not seen a whole window yet and average over what they have
+        full = min(len(ends), -(-(size - 1) // step))
+        power[k, :full] = ends[:full] / counts[:full, np.newaxis]
+        np.subtract(ends[full:], cumsum[full * step + 1 - size::step][:len(ends) - full], out=power[k, full:])
+        power[k, full:] /= size
+
+    np.maximum(power, 0, out=power)
+    envelopes = np.sqrt(power, out=power).astype(dtype, copy=False)
+    return envelopes[..., 0] if one_channel else envelopes
+
+
+def compute_envelope(block, method='iir', cutoff=10, fs=1000, order=4, window_ms=100, negative='clip',
+                     dtype=np.float64):
+    """Envelope of ``block`` (N, C) with the IIR (``rms_envelope``) or moving-window (``moving_rms``) method."""
+    if method == 'iir':
+        return rms_envelope(block, cutoff, fs, order, dtype=dtype, negative=negative)
+    if method == 'moving':
+        return moving_rms(block, [window_ms], fs, dtype=dtype)[0]
+    raise ValueError(f"method must be one of {ENVELOPE_METHODS}, not {method!r}")
@@ -0,0 +1,68 @@
+"""Butterworth filters with cached second-order-sections designs.
+
+Every envelope in this project uses the same few designs (mostly a 10 Hz,
+order 4 low-pass at 1000 Hz), so each design is computed once and reused.
+Designs are kept in second-order sections, which stay stable at orders where
+the (b, a) polynomial form starts losing precision.
+"""
+
+import functools
+
+import numpy as np
+from scipy import signal
+
+
+def _design_key(cutoff):
+    # Band filters take a (low, high) pair; make it hashable for the cache
+    if np.ndim(cutoff):
+        return tuple(float(c) for c in cutoff)
+    return float(cutoff)
+
+
+@functools.lru_cache(maxsize=None)
+def _butter_sos(cutoff, fs, order, btype):
+    return signal.butter(order, cutoff, btype=btype, fs=fs, output='sos')
+
+
+def butter_sos(cutoff, fs, order=4, btype='low'):
+    """Return the cached SOS coefficients for a digital Butterworth filter.
+
+    The array is shared between callers, so do not modify it in place.
+    """
+    return _butter_sos(_design_key(cutoff), float(fs), int(order), btype)
+
+
+def design_cache_info():
+    """Hits/misses of the design cache, as reported by functools.lru_cache."""
+    return _butter_sos.cache_info()
+
+
+def sos_filter(data, cutoff, fs, order=4, btype='low', axis=0, zi=None):
+    """Filter every channel of ``data`` along ``axis`` in one sosfilt call.
+
+    ``data`` is usually an (N, C) block of channels. When ``zi`` is given the
+    final filter state is returned as well, as with ``scipy.signal.sosfilt``.
+    """
+    sos = butter_sos(cutoff, fs, order, btype)
+    if zi is None:
+        return signal.sosfilt(sos, data, axis=axis)
+    return signal.sosfilt(sos, data, axis=axis, zi=zi)
+
+
+def sos_initial_state(cutoff, fs, order=4, btype='low', n_channels=None, dtype=np.float64):
+    """Zero filter state for sos_filter(..., zi=...) on an (N, n_channels) block."""
+    n_sections = butter_sos(cutoff, fs, order, btype).shape[0]
+    shape = (n_sections, 2) if n_channels is None else (n_sections, 2, n_channels)
+    return np.zeros(shape, dtype=dtype)
+
+
+def butter_lowpass(cutoff, fs, order=5):
+    """Low-pass design as (b, a), as the scripts used to return it; use ``butter_sos`` for filtering."""
+    nyq = 0.5 * fs
+    b, a = signal.butter(order, cutoff / nyq, btype='low', analog=False)
+    return b, a
+
+
+def butter_lowpass_filter(data, cutoff, fs, order=5):
+    """Drop-in replacement for the scripts' lfilter-based low-pass, using the cached SOS design."""
+    return sos_filter(data, cutoff, fs, order, 'low', axis=-1)
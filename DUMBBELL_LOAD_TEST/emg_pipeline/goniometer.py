@@ -0,0 +1,162 @@
+"""Goniometer stage: joint angle, flexion/extension cycles and per-repetition EMG features.
+
+CH1/CH2 carry the two goniometer axes. Counts are converted to degrees with a
+linear calibration; the default maps the 16-bit range onto -180..180 degrees
+around mid-scale, use ``calibrate_two_point`` with two known postures for
+absolute angles. Cycles are found on the deviation of the low-passed angle
+from its rest position with the same hysteresis detector as ``segments.py``:
+each repetition runs from leaving rest (start) over maximum flexion (peak)
+back to rest (end).
+
+Repetitions are returned as a structured index table, so the EMG envelope of
+every repetition can be reduced with one ``np.maximum.reduceat`` /
+``np.add.reduceat`` call instead of a Python loop over manual windows.
+"""
+
+import numpy as np
+
+from .channels import ES_CHANNELS, GONIO_CHANNELS, transform_mV
+from .envelope import rms_envelope
+from .filters import sos_filter
+from .segments import detect_segments
+
+ADC_RESOLUTION = 16
+
+# Default calibration: mid-scale is 0 degrees and the full range spans 360 degrees
+DEFAULT_CALIBRATION = ((2**ADC_RESOLUTION - 1) / 2, 360 / 2**ADC_RESOLUTION)
+
+REPETITION_DTYPE = np.dtype([
+    ('rep', np.int32), ('start', np.int64), ('peak', np.int64), ('end', np.int64),
+    ('start_nseq', np.int64), ('peak_nseq', np.int64), ('end_nseq', np.int64),
+    ('peak_angle', np.float64), ('duration', np.float64),
+])
+
+
+def calibrate_two_point(counts_a, angle_a, counts_b, angle_b):
+    """(offset, scale) so that angle = (counts - offset) * scale passes through both postures."""
+    scale = (angle_b - angle_a) / (counts_b - counts_a)
+    return counts_a - angle_a / scale, scale
+
+
+def counts_to_angle(raw, calibration=DEFAULT_CALIBRATION, out=None):
+    """Convert raw goniometer counts to degrees."""
+    offset, scale = calibration
+    if out is None:
+        return (raw - offset) * scale
+    np.subtract(raw, offset, out=out)
+    np.multiply(out, scale, out=out)
+    return out
+
+
+def smooth_angle(angle, fs=1000, cutoff=2, order=2):
+    """Low-pass the angle; the filter starts at the first sample to avoid a start-up step."""
+    start = angle[:1].copy()
+    return sos_filter(angle - start, cutoff, fs, order) + start
+
+
+def motion_channel(angles):
+    """Column of an (N, C) angle block with the largest movement (robust 5-95 % range)."""
+    spread = np.subtract(*np.percentile(angles, [95, 5], axis=0))
+    return int(np.argmax(spread))
+
+
+def detect_repetitions(angle, nseq=None, fs=1000, **kwargs):
+    """Per-repetition index table of a smoothed 1-D angle signal.
+
+    Rest is the median angle; flexion may be in either direction. Extra
+    keyword arguments go to ``segments.detect_segments``.
+    """
+    deviation = np.abs(angle - np.median(angle))
+    cycles = detect_segments(deviation, fs, **kwargs)
+    if nseq is None:
+        nseq = np.arange(len(angle))
+
+    table = np.zeros(len(cycles), dtype=REPETITION_DTYPE)
+    if len(cycles) == 0:
+        return table
+    starts, ends = cycles[:, 0], cycles[:, 1]
+    # Maximum deviation per cycle in one pass; its position is found with a per-cycle argmax over a padded view
+    lengths = ends - starts
+    offsets = np.arange(lengths.max())
+    index = np.minimum(starts[:, None] + offsets, ends[:, None] - 1)
+    peaks = starts + np.argmax(deviation[index], axis=1)
+
+    table['rep'] = np.arange(len(cycles))
+    table['start'], table['peak'], table['end'] = starts, peaks, ends
+    table['start_nseq'], table['peak_nseq'], table['end_nseq'] = nseq[starts], nseq[peaks], nseq[ends - 1]
+    table['peak_angle'] = angle[peaks]
+    table['duration'] = lengths / fs
+    return table
+
+
+def recording_repetitions(recording, names=ES_CHANNELS, gonio=None, calibration=DEFAULT_CALIBRATION,
+                          cutoff=10, order=4, **kwargs):
+    """(envelope, angle, table) of a whole recording.
+
+    ``gonio`` picks the goniometer channel; by default the one that moves the most.
+    """
+    fs = recording.sampling_rate
+    everything = (0, np.iinfo(np.uint32).max)
+    nseq = np.asarray(recording['nSeq'])
+    angles = smooth_angle(counts_to_angle(recording.window(*everything, GONIO_CHANNELS), calibration), fs)
+    column = motion_channel(angles) if gonio is None else GONIO_CHANNELS.index(gonio)
+    angle = angles[:, column]
+
+    envelope = rms_envelope(transform_mV(recording.window(*everything, names)), cutoff, fs, order)
+    return envelope, angle, detect_repetitions(angle, nseq, fs, **kwargs)
+
+
+def repetition_features(envelope, table, phase=None):
+    """Peak and mean RMS per repetition and channel: two (R, C) arrays.
+
+    ``phase='flexion'`` uses start..peak, ``'extension'`` peak..end, ``None`` the whole repetition.
+    """
+    if len(table) == 0:
+        empty = np.empty((0, envelope.shape[1]))
+        return empty, empty
+    starts = table['peak'] if phase == 'extension' else table['start']
+    ends = table['peak'] if phase == 'flexion' else table['end']
+    ends = np.maximum(ends, starts + 1)
+
+    # reduceat over [start_0, end_0, start_1, end_1, ...]: the even results are the repetitions
+    padded = np.vstack([envelope, np.zeros((1, envelope.shape[1]), dtype=envelope.dtype)])
+    bounds = np.column_stack([starts, ends]).ravel()
+    peak = np.maximum.reduceat(padded, bounds, axis=0)[::2]
+    mean = np.add.reduceat(padded, bounds, axis=0)[::2] / (ends - starts)[:, None]
+    return peak, mean
+
+
+def batch_repetition_features(trials, names=ES_CHANNELS, phase=None, **kwargs):
+    """Per-repetition rows for many recordings with a single reduction pass.
+
+    ``trials`` is an iterable of (participant, load, recording). The envelopes
+    are stacked and the repetition indices shifted so one ``reduceat`` call
+    covers every repetition of every load.
+    """
+    keys, envelopes, tables = [], [], []
+    offset = 0
+    for participant, load, recording in trials:
+        envelope, _, table = recording_repetitions(recording, names, **kwargs)
+        table = table.copy()
+        for field in ('start', 'peak', 'end'):
+            table[field] += offset
+        keys.extend((participant, load) for _ in range(len(table)))
+        envelopes.append(envelope)
+        tables.append(table)
+        offset += len(envelope)
+
+    if not envelopes:
+        return []
+    table = np.concatenate(tables)
+    peak, mean = repetition_features(np.vstack(envelopes), table, phase)
+
+    rows = []
+    for k, ((participant, load), rep) in enumerate(zip(keys, table)):
+        for c, name in enumerate(names):
+            rows.append({
+                'participant': participant, 'load': load, 'rep': int(rep['rep']), 'channel': name,
+                'start_nseq': int(rep['start_nseq']), 'end_nseq': int(rep['end_nseq']),
+                'peak_angle': float(rep['peak_angle']), 'duration': float(rep['duration']),
+                'peak_rms': float(peak[k, c]), 'mean_rms': float(mean[k, c]),
+            })
+    return rows
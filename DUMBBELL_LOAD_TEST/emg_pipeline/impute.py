@@ -0,0 +1,129 @@
+"""Imputation of missing trials on a dense (participant, load, channel) grid.
+
+Results are laid out as a (P, L, C) array with a boolean mask of missing
+cells (e.g. PP03 has no 8 kg trial). ``impute`` fills the gaps of all
+participants and channels in one call and returns, next to the filled array,
+a code per cell saying where its value came from, so imputed values can
+always be told apart from measured ones:
+
+    0 measured, 1 linear, 2 regression, 3 group mean, -1 still missing
+
+Methods:
+- 'linear': interpolation between the nearest measured loads of the same
+  participant and channel (the nearest measured value beyond the ends, like np.interp).
+- 'regression': the participant's own least-squares line over load.
+- 'group_mean': mean of the other participants at the same load and channel.
+
+Passing several methods tries them in order; later ones only fill what is
+still missing.
+"""
+
+import numpy as np
+
+from .channels import ES_CHANNELS, REGION_CHANNELS
+from .regression import weighted_fit
+
+IMPUTE_METHODS = ('linear', 'regression', 'group_mean')
+MEASURED, MISSING = 0, -1
+
+
+def channel_name(region, side):
+    """ES channel of a (region, side) pair, e.g. ('thoracic', 'left') -> 'ES-T left'."""
+    return next(name for name in REGION_CHANNELS[region] if name.split()[-1] == side)
+
+
+def dense_grid(series, participants=None, loads=None, channels=ES_CHANNELS):
+    """(P, L, C) array of ``ResultsStore.series`` values with its missing mask.
+
+    Returns (values, missing, participants, loads); missing cells hold NaN.
+    """
+    if participants is None:
+        participants = sorted({participant for participant, _, _ in series})
+    if loads is None:
+        loads = np.unique(np.concatenate([series_loads for series_loads, _ in series.values()]))
+    loads = np.asarray(loads, dtype=np.float64)
+
+    values = np.full((len(participants), len(loads), len(channels)), np.nan)
+    for (participant, region, side), (series_loads, series_values) in series.items():
+        name = channel_name(region, side)
+        if participant not in participants or name not in channels:
+            continue
+        rows = np.searchsorted(loads, series_loads)
+        known = (rows < len(loads)) & (loads[np.minimum(rows, len(loads) - 1)] == series_loads)
+        values[participants.index(participant), rows[known], list(channels).index(name)] = series_values[known]
+    return values, np.isnan(values), list(participants), loads
+
+
+def _linear(values, missing, loads):
+    # Nearest measured load below and above every cell, found with running max/min over the load axis
+    n_loads = values.shape[1]
+    index = np.arange(n_loads)[np.newaxis, :, np.newaxis]
+    below = np.maximum.accumulate(np.where(missing, -1, index), axis=1)
+    above = np.minimum.accumulate(np.where(missing, n_loads, index)[:, ::-1], axis=1)[:, ::-1]
+    below = np.where(below < 0, above, below)
+    above = np.where(above >= n_loads, below, above)
+    valid = below < n_loads
+
+    below, above = np.minimum(below, n_loads - 1), np.minimum(above, n_loads - 1)
+    v_below = np.take_along_axis(values, below, axis=1)
+    v_above = np.take_along_axis(values, above, axis=1)
+    x, x_below, x_above = loads[index], loads[below], loads[above]
+    span = x_above - x_below
+    fraction = np.divide(x - x_below, span, out=np.zeros_like(span), where=span > 0)
+    return np.where(valid, v_below + fraction * (v_above - v_below), np.nan)
+
+
+def _regression(values, missing, loads):
+    # One weighted fit per (participant, channel): loads on axis -1, missing loads get weight zero
+    y = np.nan_to_num(np.moveaxis(values, 1, -1))
+    slope, intercept, _ = weighted_fit(loads, y, (~np.moveaxis(missing, 1, -1)).astype(np.float64))
+    return intercept[:, np.newaxis, :] + slope[:, np.newaxis, :] * loads[np.newaxis, :, np.newaxis]
+
+
+def _group_mean(values, missing, loads):
+    measured = (~missing).sum(axis=0)
+    total = np.where(missing, 0, values).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(measured > 0, total / measured, np.nan)
+    return np.broadcast_to(mean, values.shape)
+
+
+_ESTIMATORS = {'linear': _linear, 'regression': _regression, 'group_mean': _group_mean}
+
+
+def impute(values, missing=None, method='linear', loads=None):
+    """Fill the missing cells of a (P, L, C) array; returns (filled, source).
+
+    missing: boolean mask of cells to fill (default: the NaN cells).
+    method: one of IMPUTE_METHODS or a sequence of them, tried in order.
+    loads: the L load levels (default 0..L-1); 'linear' and 'regression' use their spacing.
+    source: int8 array with 0 for measured cells, 1 + the index in
+        IMPUTE_METHODS of the method that filled a cell, or -1 if none could.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values) if missing is None else np.asarray(missing, dtype=bool)
+    loads = np.arange(values.shape[1], dtype=np.float64) if loads is None else np.asarray(loads, dtype=np.float64)
+    methods = [method] if isinstance(method, str) else list(method)
+    for name in methods:
+        if name not in IMPUTE_METHODS:
+            raise ValueError(f"method must be one of {IMPUTE_METHODS}, not {name!r}")
+
+    filled = np.where(missing, np.nan, values)
+    source = np.where(missing, MISSING, MEASURED).astype(np.int8)
+    # Estimates always come from measured cells only, never from values imputed by an earlier method
+    measured_values = filled.copy()
+    for name in methods:
+        todo = source == MISSING
+        if not todo.any():
+            break
+        estimate = _ESTIMATORS[name](measured_values, missing, loads)
+        fill = todo & np.isfinite(estimate)
+        filled[fill] = estimate[fill]
+        source[fill] = IMPUTE_METHODS.index(name) + 1
+    return filled, source
+
+
+def imputed_cells(source, participants, loads, channels=ES_CHANNELS):
+    """(participant, load, channel, method) of every imputed cell, for reporting."""
+    return [(participants[p], float(loads[l]), channels[c], IMPUTE_METHODS[source[p, l, c] - 1])
+            for p, l, c in zip(*np.nonzero(source > 0))]
@@ -0,0 +1,158 @@
+"""Live RMS envelope and %MVC from a stream of biosignalsplux packets.
+
+A source yields packets ``(t_acquired, nseq, raw)``: the time the last sample
+of the packet was available, its nSeq values and the raw (n, C) channel
+counts. ``LiveEnvelope`` updates the envelope and %MVC per packet and
+``run_live`` records how long after acquisition each packet was processed.
+
+There is no device in this repository, so the sources replay an existing
+OpenSignals export: either directly (``FileReplaySource``) or through a local
+socket pair that stands in for the Bluetooth link (``SocketSource``).
+"""
+
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .channels import ES_CHANNELS
+from .opensignals import load_opensignals
+from .streaming import EnvelopeState
+
+# biosignalsplux frames arrive a few samples at a time; 10 samples = 10 ms at 1000 Hz
+DEFAULT_PACKET_SIZE = 10
+
+_PACKET_HEADER = struct.Struct('<dII')  # t_acquired, number of samples, number of channels
+
+
+class FileReplaySource:
+    """Replay a recording packet by packet at ``speed`` x real time (``None`` = as fast as possible)."""
+
+    def __init__(self, file_path, names=ES_CHANNELS, packet_size=DEFAULT_PACKET_SIZE, speed=1.0):
+        recording = load_opensignals(file_path)
+        self.fs = recording.sampling_rate
+        self.nseq = np.asarray(recording['nSeq'])
+        self.raw = recording.window(0, np.iinfo(np.uint32).max, names)
+        self.packet_size = packet_size
+        self.speed = speed
+
+    def __iter__(self):
+        t0 = time.perf_counter()
+        for start in range(0, len(self.raw), self.packet_size):
+            end = min(start + self.packet_size, len(self.raw))
+            if self.speed is None:
+                t_acquired = time.perf_counter()
+            else:
+                # Wait until the packet's last sample would have been recorded
+                t_acquired = t0 + end / (self.fs * self.speed)
+                delay = t_acquired - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield t_acquired, self.nseq[start:end], self.raw[start:end]
+
+
+class SocketSource:
+    """Send another source's packets through a local socket pair and decode them on the other end."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def _send(self, sock):
+        with sock:
+            for t_acquired, nseq, raw in self.source:
+                payload = np.ascontiguousarray(nseq, dtype=np.uint32).tobytes() + \
+                    np.ascontiguousarray(raw, dtype=np.uint16).tobytes()
+                sock.sendall(_PACKET_HEADER.pack(t_acquired, raw.shape[0], raw.shape[1]) + payload)
+
+    @staticmethod
+    def _recv_exactly(sock, size):
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                return None
+            received += n
+        return bytes(buffer)
+
+    def __iter__(self):
+        sender, receiver = socket.socketpair()
+        thread = threading.Thread(target=self._send, args=(sender,), daemon=True)
+        thread.start()
+        with receiver:
+            while True:
+                header = self._recv_exactly(receiver, _PACKET_HEADER.size)
+                if header is None:
+                    break
+                t_acquired, n_samples, n_channels = _PACKET_HEADER.unpack(header)
+                payload = self._recv_exactly(receiver, n_samples * (4 + 2 * n_channels))
+                nseq = np.frombuffer(payload, dtype=np.uint32, count=n_samples)
+                raw = np.frombuffer(payload, dtype=np.uint16, offset=4 * n_samples).reshape(n_samples, n_channels)
+                yield t_acquired, nseq, raw
+        thread.join()
+
+
+class LiveEnvelope:
+    """Per-packet RMS envelope and %MVC of the ES-T/ES-L channels."""
+
+    def __init__(self, names=ES_CHANNELS, mvc_values=None, cutoff=10, fs=1000, order=4):
+        self.names = list(names)
+        self.state = EnvelopeState(len(self.names), cutoff, fs, order)
+        self.mvc_values = None if mvc_values is None else np.asarray(mvc_values, dtype=float)
+        self.envelope = np.zeros(len(self.names))
+        self.percent_mvc = np.full(len(self.names), np.nan)
+        self.nseq = None
+
+    def update(self, nseq, raw):
+        """Process one packet; returns the latest envelope value per channel."""
+        envelope = self.state.process(raw)
+        self.envelope = envelope[-1]
+        self.nseq = int(nseq[-1])
+        if self.mvc_values is not None:
+            self.percent_mvc = self.envelope / self.mvc_values * 100
+        return self.envelope
+
+
+class LatencyReport:
+    """Latency of every processed packet, measured from acquisition of its last sample."""
+
+    def __init__(self, latencies, busy_time, n_samples, wall_time):
+        self.latencies = np.asarray(latencies)
+        self.busy_time = busy_time
+        self.n_samples = n_samples
+        self.wall_time = wall_time
+
+    def percentiles(self, q=(50, 95, 99, 100)):
+        return dict(zip(q, np.percentile(self.latencies, q)))
+
+    @property
+    def max_sample_rate(self):
+        """Samples per second the processing alone could keep up with."""
+        return self.n_samples / self.busy_time if self.busy_time > 0 else float('inf')
+
+    def summary(self):
+        p = self.percentiles()
+        return (f"{len(self.latencies)} packets, {self.n_samples} samples in {self.wall_time:.2f} s; "
+                f"latency p50 {p[50] * 1e3:.3f} ms, p95 {p[95] * 1e3:.3f} ms, p99 {p[99] * 1e3:.3f} ms, "
+                f"max {p[100] * 1e3:.3f} ms; max sustainable rate {self.max_sample_rate:,.0f} samples/s")
+
+
+def run_live(source, processor, on_update=None):
+    """Feed every packet of ``source`` to ``processor`` and measure the latency per packet."""
+    latencies = []
+    busy_time = 0.0
+    n_samples = 0
+    start = time.perf_counter()
+    for t_acquired, nseq, raw in source:
+        t_begin = time.perf_counter()
+        processor.update(nseq, raw)
+        if on_update is not None:
+            on_update(processor)
+        t_done = time.perf_counter()
+        busy_time += t_done - t_begin
+        latencies.append(t_done - t_acquired)
+        n_samples += len(raw)
+    return LatencyReport(latencies, busy_time, n_samples, time.perf_counter() - start)
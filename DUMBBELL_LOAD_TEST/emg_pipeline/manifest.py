@@ -0,0 +1,301 @@
+"""Session manifests: which files and windows belong to each participant.
+
+Every participant has one JSON file in ``DUMBBELL_LOAD_TEST/manifests``::
+
+    {
+      "participant": "PP04",
+      "mvc": {"file": "MVC/PP04_MVC.txt", "window": [1200, 13700]},
+      "trials": [
+        {"load": 6, "file": "PP04/PP04_6kg.txt", "window": [1500, 3200],
+         "region_windows": {"lumbar": [6800, 10800]}}
+      ]
+    }
+
+File paths are relative to the DUMBBELL_LOAD_TEST folder and windows are
+inclusive nSeq bounds. ``window`` is the window the four-channel analysis uses
+for both regions; ``region_windows`` holds the windows of the single-region
+scripts where they differ. The MVC values themselves are computed from the
+MVC recording and window by ``mvc.py`` (and cached), not written down here.
+
+``mvc_variants`` optionally names MVC references that some scripts were
+published with and that differ from the default settings, e.g.::
+
+    "mvc_variants": {
+      "lumbar_script": {"window": [31000, 35799], "params": {"order": 6},
+                        "gain": 1.5, "channel": "ES-L right"}
+    }
+
+``params`` override the default MVC envelope settings, ``window`` defaults to
+the MVC window and ``channel`` (or ``region``, for the left/right average)
+picks the value. A variant no recording reproduces is written down as
+``{"value": 0.1715}``.
+"""
+
+import collections
+import glob
+import json
+import os
+
+import numpy as np
+
+from .channels import ES_CHANNELS, REGION_CHANNELS, ChannelRegistry
+from .mvc import DEFAULT_MVC_PARAMS, lookup_mvc
+from .opensignals import load_opensignals, read_header
+
+DATA_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_DIR = os.path.join(DATA_ROOT, 'manifests')
+
+Trial = collections.namedtuple('Trial', ['participant', 'load', 'region', 'file_path', 'start_freq', 'end_freq'])
+
+
+class ManifestError(ValueError):
+    """A manifest does not match its schema or the recordings on disk."""
+
+    def __init__(self, source, problems):
+        self.source = source
+        self.problems = list(problems)
+        super().__init__(f"{source}:\n" + "\n".join(f"  - {problem}" for problem in self.problems))
+
+
+def _check_window(window, what, problems):
+    if (not isinstance(window, list) or len(window) != 2 or not all(isinstance(v, int) for v in window)
+            or window[0] >= window[1]):
+        problems.append(f"{what}: window must be [start, end] nSeq integers with start < end, got {window!r}")
+        return False
+    return True
+
+
+def _check_schema(session):
+    problems = []
+    if not isinstance(session.get('participant'), str):
+        problems.append("'participant' must be a string")
+
+    mvc = session.get('mvc', {})
+    if not isinstance(mvc.get('file'), str):
+        problems.append("mvc: 'file' must be the path of the MVC recording")
+    _check_window(mvc.get('window'), 'mvc', problems)
+
+    for name, variant in session.get('mvc_variants', {}).items():
+        what = f"mvc variant {name!r}"
+        if not isinstance(variant, dict):
+            problems.append(f"{what}: must be an object")
+        elif 'value' in variant:
+            if not isinstance(variant['value'], (int, float)):
+                problems.append(f"{what}: 'value' must be a number")
+        else:
+            if 'window' in variant:
+                _check_window(variant['window'], what, problems)
+            if not isinstance(variant.get('params', {}), dict):
+                problems.append(f"{what}: 'params' must be an object of envelope settings")
+            if not isinstance(variant.get('gain', 1), (int, float)):
+                problems.append(f"{what}: 'gain' must be a number")
+            if (variant.get('channel') not in ES_CHANNELS) == (variant.get('region') not in REGION_CHANNELS):
+                problems.append(f"{what}: give either a 'channel' of {ES_CHANNELS} or a 'region' of "
+                                f"{list(REGION_CHANNELS)}")
+
+    trials = session.get('trials')
+    if not trials:
+        problems.append("'trials' must list at least one trial")
+        return problems
+    loads = [trial.get('load') for trial in trials]
+    if len(set(loads)) != len(loads):
+        problems.append(f"loads must be unique per participant, got {loads}")
+    for trial in trials:
+        what = f"trial {trial.get('load')!r} kg"
+        if not isinstance(trial.get('load'), (int, float)):
+            problems.append(f"{what}: 'load' must be a number")
+        if not isinstance(trial.get('file'), str):
+            problems.append(f"{what}: 'file' must be a path")
+        _check_window(trial.get('window'), what, problems)
+        for region, window in trial.get('region_windows', {}).items():
+            if region not in REGION_CHANNELS:
+                problems.append(f"{what}: unknown region {region!r} in 'region_windows'")
+            _check_window(window, f"{what} {region}", problems)
+    return problems
+
+
+def _exact_path_exists(path):
+    # os.path.exists is case-insensitive on Windows and macOS; PP06_8kg.txt vs PP06_8KG.txt must fail everywhere
+    folder, name = os.path.split(path)
+    return os.path.isdir(folder or '.') and name in os.listdir(folder or '.')
+
+
+def _check_recording(path, windows, names, what, problems):
+    if not _exact_path_exists(path):
+        problems.append(f"{what}: {path} does not exist")
+        return
+    try:
+        devices, _ = read_header(path)
+        registry = ChannelRegistry(next(iter(devices.values())))
+        for name in names:
+            if registry.sensor(name) != 'EMG':
+                problems.append(f"{what}: {name} is not an EMG channel in {path}")
+    except (ValueError, KeyError) as error:
+        problems.append(f"{what}: {error}")
+        return
+
+    nseq = np.asarray(load_opensignals(path)['nSeq'])
+    first, last = int(nseq.min()), int(nseq.max())
+    for start, end in windows:
+        if end < first or start > last:
+            problems.append(f"{what}: window [{start}, {end}] is outside the recorded nSeq range [{first}, {last}]")
+
+
+def validate_session(session, data_root=DATA_ROOT):
+    """Return the problems of one parsed manifest; an empty list means it is valid."""
+    problems = _check_schema(session)
+    if problems:
+        return problems
+
+    mvc = session['mvc']
+    windows = [mvc['window']] + [variant['window'] for variant in session.get('mvc_variants', {}).values()
+                                 if 'window' in variant]
+    _check_recording(os.path.join(data_root, mvc['file']), windows, ES_CHANNELS, 'mvc', problems)
+    for trial in session['trials']:
+        windows = [trial['window']] + list(trial.get('region_windows', {}).values())
+        _check_recording(os.path.join(data_root, trial['file']), windows, ES_CHANNELS,
+                         f"trial {trial['load']} kg", problems)
+    return problems
+
+
+def _manifest_path(source, folder):
+    if os.path.sep in source or source.endswith('.json'):
+        return source
+    return os.path.join(folder, f'{source}.json')
+
+
+def read_session(source, folder=MANIFEST_DIR, data_root=DATA_ROOT, validate=True):
+    """Parse one manifest, given a participant id ('PP04') or a path to the JSON file."""
+    path = _manifest_path(source, folder)
+    with open(path) as f:
+        session = json.load(f)
+    problems = validate_session(session, data_root) if validate else _check_schema(session)
+    if problems:
+        raise ManifestError(path, problems)
+    return session
+
+
+class Manifest:
+    """Trials and MVC values of one or more participants, indexed by participant, load and region.
+
+    MVC values are looked up in the MVC cache (computed on first use) with ``mvc_params``.
+    """
+
+    def __init__(self, sessions, data_root=DATA_ROOT, mvc_params=DEFAULT_MVC_PARAMS, mvc_cache=None):
+        self.data_root = data_root
+        self.mvc_params = mvc_params
+        self.mvc_cache = mvc_cache
+        self.sessions = {}
+        self._trials = {}
+        self._index = {'participant': collections.defaultdict(list), 'load': collections.defaultdict(list),
+                       'region': collections.defaultdict(list)}
+
+        for session in sessions:
+            participant = session['participant']
+            if participant in self.sessions:
+                raise ValueError(f"Participant {participant} appears in more than one manifest")
+            self.sessions[participant] = session
+            for trial in session['trials']:
+                for region in REGION_CHANNELS:
+                    region_window = trial.get('region_windows', {}).get(region, trial['window'])
+                    key = (participant, trial['load'], region)
+                    self._trials[key] = (Trial(participant, trial['load'], region, trial['file'], *trial['window']),
+                                         Trial(participant, trial['load'], region, trial['file'], *region_window))
+                    self._index['participant'][participant].append(key)
+                    self._index['load'][trial['load']].append(key)
+                    self._index['region'][region].append(key)
+
+    def __repr__(self):
+        return f"Manifest({list(self.sessions)}, {len(self._trials)} trials)"
+
+    @property
+    def participants(self):
+        return list(self.sessions)
+
+    def _session(self, participant):
+        if participant is None:
+            if len(self.sessions) != 1:
+                raise ValueError(f"Pick one of the participants {self.participants}")
+            return next(iter(self.sessions.values()))
+        return self.sessions[participant]
+
+    def trials(self, participant=None, load=None, region=None, region_window=False):
+        """Trials matching the given participant/load/region, in manifest order.
+
+        With ``region_window=True`` the single-region windows are returned
+        instead of the shared four-channel window.
+        """
+        keys = None
+        for field, value in (('participant', participant), ('load', load), ('region', region)):
+            if value is None:
+                continue
+            matches = self._index[field].get(value, [])
+            if keys is None:
+                keys = matches
+            else:
+                selected = set(matches)
+                keys = [key for key in keys if key in selected]
+        if keys is None:
+            keys = list(self._trials)
+        return [self._trials[key][1 if region_window else 0] for key in keys]
+
+    def trial(self, participant, load, region, region_window=False):
+        return self._trials[(participant, load, region)][1 if region_window else 0]
+
+    def path(self, file_path):
+        """Absolute path of a manifest file entry (or of a Trial's file)."""
+        if isinstance(file_path, Trial):
+            file_path = file_path.file_path
+        return os.path.join(self.data_root, file_path)
+
+    def mvc_reference(self, participant=None):
+        """Cached MVC reference: {'values', 'peak_nseq', 'region_average'}."""
+        return lookup_mvc(self.mvc_file(participant), *self.mvc_window(participant), self.mvc_params, self.mvc_cache)
+
+    def mvc(self, participant=None):
+        """MVC values keyed by channel name."""
+        return dict(self.mvc_reference(participant)['values'])
+
+    def mvc_values(self, names, participant=None):
+        """MVC values as a list in the order of ``names``."""
+        values = self.mvc(participant)
+        return [values[name] for name in names]
+
+    def region_average_mvc(self, region, participant=None):
+        """MVC of the left/right average envelope of a region."""
+        return self.mvc_reference(participant)['region_average'][region]
+
+    def mvc_variant(self, name, participant=None):
+        """Named MVC reference from the manifest's ``mvc_variants`` (see the module docstring)."""
+        variant = self._session(participant)['mvc_variants'][name]
+        if 'value' in variant:
+            return float(variant['value'])
+        start_freq, end_freq = variant.get('window', self.mvc_window(participant))
+        params = dict(self.mvc_params, **variant.get('params', {}))
+        reference = lookup_mvc(self.mvc_file(participant), start_freq, end_freq, params, self.mvc_cache)
+        if 'channel' in variant:
+            value = reference['values'][variant['channel']]
+        else:
+            value = reference['region_average'][variant['region']]
+        return variant.get('gain', 1) * value
+
+    def mvc_file(self, participant=None):
+        return self.path(self._session(participant)['mvc']['file'])
+
+    def mvc_window(self, participant=None):
+        start_freq, end_freq = self._session(participant)['mvc']['window']
+        return start_freq, end_freq
+
+
+def load_manifest(source, folder=MANIFEST_DIR, data_root=DATA_ROOT, validate=True):
+    """Manifest of one participant, e.g. ``load_manifest('PP04')``."""
+    return Manifest([read_session(source, folder, data_root, validate)], data_root)
+
+
+def load_manifests(participants=None, folder=MANIFEST_DIR, data_root=DATA_ROOT, validate=True):
+    """Manifest of all participants in ``folder`` (or only the given ones)."""
+    if participants is None:
+        participants = sorted(os.path.splitext(os.path.basename(path))[0]
+                              for path in glob.glob(os.path.join(folder, '*.json')))
+    return Manifest([read_session(participant, folder, data_root, validate) for participant in participants],
+                    data_root)
@@ -0,0 +1,211 @@
+"""MVC references computed from the MVC recordings, with an on-disk cache.
+
+For every channel the MVC is the maximum of its RMS envelope within the MVC
+window (what ``MVC/PP0x_MVC_v2`` printed); for every region it is the maximum
+of the left/right average envelope (what ``MVC/PP0x_MVC_data.py`` printed).
+
+Results are stored in ``MVC/mvc_cache.json``, keyed by the SHA-256 of the
+recording's contents together with the window and envelope settings, so they
+are computed once and only recomputed when the recording or the settings
+change. The file's size and modification time are remembered to avoid
+rehashing unchanged recordings on every lookup.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from .channels import ES_CHANNELS, REGION_CHANNELS, transform_mV
+from .envelope import compute_envelope
+from .opensignals import load_opensignals
+from .profiling import profiled
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MVC', 'mvc_cache.json')
+
+# Envelope settings of the MVC scripts
+DEFAULT_MVC_PARAMS = {'cutoff': 10, 'fs': 1000, 'order': 4, 'negative': 'clip'}
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def memo_hash(hashes, file_path):
+    """(digest, changed): file hash from the size+mtime memo ``hashes``, which is updated on a miss."""
+    stat = os.stat(file_path)
+    key = os.path.abspath(file_path)
+    known = hashes.get(key)
+    if known is not None and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+        return known['sha256'], False
+    digest = file_hash(file_path)
+    hashes[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+    return digest, True
+
+
+def _lock(path, timeout=5.0, stale=30.0):
+    # Exclusive lock file next to path (portable, unlike fcntl). Returns its path once this call created it,
+    # or None when another writer held it for the whole timeout. A lock file older than `stale` seconds
+    # (a save takes milliseconds) is left over from a crashed writer and is removed before trying again.
+    lock_path = path + '.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale:
+                    os.unlink(lock_path)
+                    continue
+            except FileNotFoundError:
+                # Released in the meantime
+                continue
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(0.005)
+
+
+def save_sections(path, data, merge=True):
+    """Write a JSON dict of sections (dicts) atomically, after merging in what is on disk.
+
+    With ``merge`` the entries other processes saved since ``data`` was read
+    are kept (``data`` wins on equal keys) and ``data`` is updated with them.
+    Each writer gets its own temporary file, so concurrent writers never
+    overwrite each other's half-written file, and a lock file keeps them
+    from merging and replacing at the same time. When the lock stays taken
+    the file is left alone; ``data`` is merged in by the next save.
+    """
+    try:
+        lock_path = _lock(path)
+    except OSError:
+        # A read-only data folder still gets correct results, just without persistence
+        return
+    if lock_path is None:
+        return
+    try:
+        if merge:
+            try:
+                with open(path) as f:
+                    on_disk = json.load(f)
+            except (OSError, ValueError):
+                on_disk = {}
+            for section, entries in on_disk.items():
+                if isinstance(entries, dict) and isinstance(data.get(section), dict):
+                    data[section] = dict(entries, **data[section])
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError:
+        pass
+    finally:
+        try:
+            os.unlink(lock_path)
+        except OSError:
+            pass
+
+
+@profiled('compute_mvc')
+def compute_mvc(file_path, start_freq, end_freq, params=DEFAULT_MVC_PARAMS):
+    """Per-channel and per-region MVC of one recording's nSeq window (no caching).
+
+    ``params`` are envelope settings as ``compute_envelope`` takes them; without
+    'method' the IIR envelope is used.
+    """
+    recording = load_opensignals(file_path)
+    nseq = np.asarray(recording['nSeq'][recording.window_rows(start_freq, end_freq)])
+    envelopes = compute_envelope(transform_mV(recording.window(start_freq, end_freq, ES_CHANNELS)), **params)
+
+    peaks = np.argmax(envelopes, axis=0)
+    reference = {
+        'values': {name: float(envelopes[peaks[k], k]) for k, name in enumerate(ES_CHANNELS)},
+        'peak_nseq': {name: int(nseq[peaks[k]]) for k, name in enumerate(ES_CHANNELS)},
+        'region_average': {},
+    }
+    for region, pair in REGION_CHANNELS.items():
+        average = envelopes[:, [ES_CHANNELS.index(name) for name in pair]].mean(axis=1)
+        reference['region_average'][region] = float(average.max())
+    return reference
+
+
+class MVCCache:
+    """JSON-backed cache of MVC references; ``get`` computes and stores on a miss."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault('hashes', {})
+            self._data.setdefault('entries', {})
+        return self._data
+
+    def _save(self, merge=True):
+        # Other processes (batch and sweep workers) may have added entries since this one read the file
+        save_sections(self.path, self._data, merge)
+
+    def content_hash(self, file_path):
+        """File hash, recomputed only when the file's size or modification time changed."""
+        digest, changed = memo_hash(self._load()['hashes'], file_path)
+        if changed:
+            self._save()
+        return digest
+
+    @staticmethod
+    def key(digest, start_freq, end_freq, params):
+        settings = dict(params, start_freq=int(start_freq), end_freq=int(end_freq))
+        return f"{digest}:{json.dumps(settings, sort_keys=True)}"
+
+    def get(self, file_path, start_freq, end_freq, params=DEFAULT_MVC_PARAMS):
+        data = self._load()
+        key = self.key(self.content_hash(file_path), start_freq, end_freq, params)
+        if key in data['entries']:
+            self.hits += 1
+            return data['entries'][key]
+
+        self.misses += 1
+        reference = compute_mvc(file_path, start_freq, end_freq, params)
+        data['entries'][key] = reference
+        self._save()
+        return reference
+
+    def clear(self):
+        self._data = {'hashes': {}, 'entries': {}}
+        self._save(merge=False)
+
+
+_default_cache = None
+
+
+def default_cache():
+    """The shared cache at CACHE_PATH."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = MVCCache()
+    return _default_cache
+
+
+def lookup_mvc(file_path, start_freq, end_freq, params=DEFAULT_MVC_PARAMS, cache=None):
+    """MVC reference of a recording window: {'values', 'peak_nseq', 'region_average'}."""
+    return (default_cache() if cache is None else cache).get(file_path, start_freq, end_freq, params)
@@ -0,0 +1,270 @@
+"""Reader for OpenSignals text exports with a memory-mapped binary column cache.
+
+The first time a ``.txt`` export is loaded its body is parsed once and written
+next to the source as ``<name>.txt.oscache``: every column is stored
+contiguously (``nSeq`` as uint32, everything else as uint16). Later loads
+memory-map that file instead of parsing the text again. The cache is rebuilt
+automatically when the source file changes size or modification time.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+from .channels import ES_CHANNELS, ChannelRegistry, nseq_window
+from .profiling import profiled, stage
+
+HEADER_MAGIC = "# OpenSignals Text File Format"
+END_OF_HEADER = "# EndOfHeader"
+
+CACHE_SUFFIX = ".oscache"
+CACHE_MAGIC = b"OSCACHE1"
+CACHE_ALIGN = 64
+
+
+def read_header(file_path):
+    """Parse the OpenSignals header and return (devices, header_size_in_bytes).
+
+    ``devices`` is the header JSON, keyed by device MAC address.
+    """
+    with open(file_path, 'rb') as f:
+        first_line = f.readline().decode('utf-8').strip()
+        if not first_line.startswith(HEADER_MAGIC):
+            raise ValueError(f"{file_path} is not an OpenSignals text file")
+
+        devices = None
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"No '{END_OF_HEADER}' line found in {file_path}")
+            line = line.decode('utf-8').strip()
+            if line.startswith(END_OF_HEADER):
+                break
+            if line.startswith('# {'):
+                devices = json.loads(line[2:])
+
+        header_size = f.tell()
+
+    if devices is None:
+        raise ValueError(f"No header JSON found in {file_path}")
+    return devices, header_size
+
+
+def column_names(devices):
+    """Return the column names declared by the header, in file order."""
+    device = next(iter(devices.values()))
+    return list(device['column'])
+
+
+def column_dtype(name):
+    # nSeq counts every sample of the session, everything else is a 16-bit ADC value or a digital input
+    return np.dtype(np.uint32) if name == 'nSeq' else np.dtype(np.uint16)
+
+
+def parse_body(file_path, header_size, names):
+    """Parse the tab-separated body into a dict of compact column arrays."""
+    with open(file_path, 'rb') as f:
+        f.seek(header_size)
+        body = f.read()
+
+    values = np.fromstring(body, dtype=np.uint32, sep=' ')
+    if values.size % len(names) != 0:
+        raise ValueError(f"{file_path}: body does not split into {len(names)} columns")
+    table = values.reshape(-1, len(names))
+
+    columns = {}
+    for i, name in enumerate(names):
+        dtype = column_dtype(name)
+        column = table[:, i]
+        if column.size and column.max() > np.iinfo(dtype).max:
+            raise ValueError(f"{file_path}: column {name} does not fit in {dtype}")
+        columns[name] = np.ascontiguousarray(column, dtype=dtype)
+    return columns
+
+
+def cache_path(file_path):
+    return os.fspath(file_path) + CACHE_SUFFIX
+
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def _align(offset):
+    return (offset + CACHE_ALIGN - 1) // CACHE_ALIGN * CACHE_ALIGN
+
+
+def write_cache(file_path, devices, columns):
+    """Write the column cache for file_path; the file is replaced atomically."""
+    names = list(columns)
+    n_rows = len(columns[names[0]]) if names else 0
+
+    # Lay out the columns one after the other, each aligned for memory-mapping
+    layout = []
+    offset = 0
+    for name in names:
+        layout.append({'name': name, 'dtype': columns[name].dtype.str, 'offset': offset})
+        offset = _align(offset + columns[name].nbytes)
+
+    meta = dict(_source_stamp(file_path), n_rows=n_rows, columns=layout, devices=devices)
+    meta_bytes = json.dumps(meta).encode('utf-8')
+    data_start = _align(len(CACHE_MAGIC) + 8 + len(meta_bytes))
+
+    target = cache_path(file_path)
+    tmp = target + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(CACHE_MAGIC)
+        f.write(struct.pack('<Q', len(meta_bytes)))
+        f.write(meta_bytes)
+        for entry in layout:
+            f.seek(data_start + entry['offset'])
+            f.write(columns[entry['name']].tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp, target)
+    return target
+
+
+def read_cache(file_path):
+    """Memory-map the column cache, or return None when it is missing or stale."""
+    path = cache_path(file_path)
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            (meta_size,) = struct.unpack('<Q', f.read(8))
+            meta = json.loads(f.read(meta_size).decode('utf-8'))
+    except (OSError, ValueError, struct.error):
+        return None
+
+    stamp = _source_stamp(file_path)
+    if any(meta.get(key) != value for key, value in stamp.items()):
+        return None
+
+    data_start = _align(len(CACHE_MAGIC) + 8 + meta_size)
+    n_rows = meta['n_rows']
+    columns = {}
+    for entry in meta['columns']:
+        if n_rows == 0:
+            columns[entry['name']] = np.empty(0, dtype=entry['dtype'])
+            continue
+        columns[entry['name']] = np.memmap(path, dtype=entry['dtype'], mode='r',
+                                           offset=data_start + entry['offset'], shape=(n_rows,))
+    return meta['devices'], columns
+
+
+class Recording:
+    """Columns of one OpenSignals recording.
+
+    Columns are looked up by header name (``recording['nSeq']``). Indexing with
+    a ``(rows, columns)`` tuple mimics the 2-D array ``np.loadtxt`` used to
+    return, but only the requested columns are touched: ``recording[:, 0]`` is a
+    view and ``recording[mask, 4:8]`` stacks just those four columns.
+    """
+
+    def __init__(self, file_path, devices, columns, from_cache=False):
+        self.file_path = file_path
+        self.devices = devices
+        self.device = next(iter(devices))
+        self.header = devices[self.device]
+        self.columns = columns
+        self.column_names = list(columns)
+        self.from_cache = from_cache
+        self._channels = None
+        self._nseq_sorted = None
+
+    @property
+    def sampling_rate(self):
+        return self.header['sampling rate']
+
+    @property
+    def shape(self):
+        return (len(self), len(self.column_names))
+
+    def __len__(self):
+        return len(self.columns[self.column_names[0]]) if self.column_names else 0
+
+    def __repr__(self):
+        return f"Recording({self.file_path!r}, rows={len(self)}, columns={self.column_names})"
+
+    def column(self, name):
+        return self.columns[name]
+
+    @property
+    def channels(self):
+        """ChannelRegistry built from this recording's header."""
+        if self._channels is None:
+            self._channels = ChannelRegistry(self.header)
+        return self._channels
+
+    def channel(self, name):
+        """Zero-copy view of a named channel, e.g. ``recording.channel('ES-L left')``."""
+        return self.columns[self.channels.column(name)]
+
+    def window_rows(self, start_freq, end_freq):
+        """Rows whose nSeq lies in [start_freq, end_freq], as a slice when possible."""
+        nseq = self.columns['nSeq']
+        if self._nseq_sorted is None:
+            self._nseq_sorted = len(nseq) < 2 or bool(np.all(nseq[1:] >= nseq[:-1]))
+        return nseq_window(nseq, start_freq, end_freq, is_sorted=self._nseq_sorted)
+
+    def window(self, start_freq, end_freq, names=ES_CHANNELS):
+        """Raw counts of the named channels for an nSeq window, as an (N, C) block.
+
+        Only the requested channels are read; they stay in their compact
+        integer dtype until the caller converts them.
+        """
+        rows = self.window_rows(start_freq, end_freq)
+        return np.column_stack([self.columns[column][rows] for column in self.channels.resolve(names)])
+
+    def _names(self, key):
+        if isinstance(key, (int, np.integer)):
+            return self.column_names[key]
+        if isinstance(key, slice):
+            return self.column_names[key]
+        return [self.column_names[k] if isinstance(k, (int, np.integer)) else k for k in key]
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise IndexError("Index a Recording with a column name or a (rows, columns) tuple")
+
+        rows, cols = key
+        names = self._names(cols)
+        if isinstance(names, str):
+            return self.columns[names][rows]
+        return np.column_stack([self.columns[name][rows] for name in names])
+
+
+@profiled('load_opensignals', nbytes=lambda file_path, *args, **kwargs: os.path.getsize(file_path))
+def load_opensignals(file_path, use_cache=True):
+    """Load an OpenSignals text export, going through the binary cache when possible.
+
+    A compressed archive (``.osz``, see ``archive.py``) is decoded as a whole.
+    """
+    if os.fspath(file_path).endswith('.osz'):
+        from .archive import Archive
+        with stage('decode_archive'):
+            return Archive(file_path).to_recording()
+    if use_cache:
+        with stage('read_cache'):
+            cached = read_cache(file_path)
+        if cached is not None:
+            devices, columns = cached
+            return Recording(file_path, devices, columns, from_cache=True)
+
+    with stage('parse'):
+        devices, header_size = read_header(file_path)
+        columns = parse_body(file_path, header_size, column_names(devices))
+
+    if use_cache:
+        try:
+            with stage('write_cache'):
+                write_cache(file_path, devices, columns)
+        except OSError:
+            # Read-only data directory: keep working from the parsed arrays
+            pass
+    return Recording(file_path, devices, columns)
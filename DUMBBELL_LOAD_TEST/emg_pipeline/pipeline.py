@@ -0,0 +1,274 @@
+"""Incremental per-trial pipeline with a content-addressed stage cache.
+
+Every trial runs through the chain
+
+    load -> select -> transform -> envelope -> features -> normalize
+
+and every stage output is stored on disk (``.pipeline_cache/<stage>/``)
+under the SHA-256 of the stage name, its parameters and the keys of its
+inputs. The key of ``load`` is the hash of the recording's contents, so a
+key changes exactly when something upstream changed: editing a window in a
+manifest recomputes select and everything after it, a new MVC value only
+recomputes normalize. Hashes are remembered by file size and modification
+time in ``.pipeline_cache/hashes.json``, so unchanged recordings are not
+read again just to compute their key.
+
+Stages are evaluated lazily from the end of the chain: a cached ``normalize``
+never touches the recording at all. ``load`` itself is not stored again,
+the parsed columns already live in the ``.oscache`` file next to each
+recording (see ``opensignals.py``).
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.pipeline            # all trials, with a cache report
+    python -m emg_pipeline.pipeline PP04 --clear
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .batch import DEFAULT_PARAMS
+from .channels import REGION_CHANNELS, transform_mV
+from .envelope import compute_envelope
+from .manifest import DATA_ROOT, MANIFEST_DIR, load_manifests
+from .mvc import memo_hash, save_sections
+from .opensignals import load_opensignals
+from .profiling import stage
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.pipeline_cache')
+
+STAGES = ('load', 'select', 'transform', 'envelope', 'features', 'normalize')
+
+
+def stage_key(name, params, input_keys, version=1):
+    """SHA-256 of a stage's name, version, parameters and the keys of its inputs."""
+    description = json.dumps([name, version, params, list(input_keys)], sort_keys=True)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+class Node:
+    """A stage output that is read from the cache or computed only when ``value`` is first used."""
+
+    def __init__(self, cache, name, key, func, inputs, store):
+        self.cache = cache
+        self.name = name
+        self.key = key
+        self.func = func
+        self.inputs = inputs
+        self.store = store
+        self._evaluated = False
+        self._value = None
+        self.seconds = 0.0  # time to compute this stage and every upstream stage that had to run for it
+
+    @property
+    def value(self):
+        if not self._evaluated:
+            self._value = self.cache.evaluate(self)
+            self._evaluated = True
+        return self._value
+
+
+class StageCache:
+    """On-disk store of stage outputs, with hit/miss counts and time saved per stage.
+
+    Arrays are stored as ``.npy`` and everything else as JSON, each with a
+    small JSON record of how long the stage and its upstream took to compute.
+    """
+
+    def __init__(self, folder=CACHE_DIR, enabled=True):
+        self.folder = folder
+        self.enabled = enabled
+        self.stats = {name: {'hits': 0, 'misses': 0, 'computed': 0.0, 'saved': 0.0} for name in STAGES}
+        self._hashes = None
+
+    @property
+    def hashes_path(self):
+        return os.path.join(self.folder, 'hashes.json')
+
+    def _load_hashes(self):
+        if self._hashes is None:
+            try:
+                with open(self.hashes_path) as f:
+                    self._hashes = json.load(f)
+            except (OSError, ValueError):
+                self._hashes = {}
+            self._hashes.setdefault('hashes', {})
+        return self._hashes
+
+    def content_hash(self, file_path):
+        """Hash of a file's contents, rehashed only when its size or modification time changed.
+
+        The size+mtime memo is kept in ``hashes.json`` in the cache folder (as
+        ``MVCCache`` does), so a fully cached rerun does not read the recordings.
+        """
+        hashes = self._load_hashes()
+        digest, changed = memo_hash(hashes['hashes'], file_path)
+        if changed and self.enabled:
+            try:
+                os.makedirs(self.folder, exist_ok=True)
+            except OSError:
+                return digest
+            save_sections(self.hashes_path, hashes)
+        return digest
+
+    def stage(self, name, func, params=None, inputs=(), store=True, version=1):
+        """Node for ``func(*input values)``; nothing is read or computed yet."""
+        key = stage_key(name, params, [node.key for node in inputs], version)
+        return Node(self, name, key, func, inputs, store)
+
+    def _paths(self, node):
+        folder = os.path.join(self.folder, node.name)
+        return os.path.join(folder, node.key + '.json'), os.path.join(folder, node.key + '.npy')
+
+    def _read(self, node):
+        record_path, array_path = self._paths(node)
+        try:
+            with open(record_path) as f:
+                record = json.load(f)
+            value = np.load(array_path) if record['kind'] == 'array' else record['value']
+        except (OSError, ValueError, KeyError):
+            return None, None
+        return record, value
+
+    def _write(self, node, value, seconds):
+        record_path, array_path = self._paths(node)
+        record = {'stage': node.name, 'seconds': seconds}
+        try:
+            os.makedirs(os.path.dirname(record_path), exist_ok=True)
+            if isinstance(value, np.ndarray):
+                record['kind'] = 'array'
+                # np.save appends .npy to names without it, so the temporary name keeps the suffix
+                tmp_path = array_path[:-4] + '.tmp.npy'
+                np.save(tmp_path, value)
+                os.replace(tmp_path, array_path)
+            else:
+                record['kind'] = 'json'
+                record['value'] = value
+            # The record is written last: a stage only counts as cached once its output is complete
+            with open(record_path + '.tmp', 'w') as f:
+                json.dump(record, f)
+            os.replace(record_path + '.tmp', record_path)
+        except OSError:
+            # A read-only folder still gives correct results, just without persistence
+            pass
+
+    def evaluate(self, node):
+        stats = self.stats[node.name]
+        if self.enabled and node.store:
+            start = time.perf_counter()
+            record, value = self._read(node)
+            if record is not None:
+                stats['hits'] += 1
+                stats['saved'] += max(0.0, record['seconds'] - (time.perf_counter() - start))
+                return value
+
+        values = [upstream.value for upstream in node.inputs]
+        start = time.perf_counter()
+        with stage(node.name):
+            value = node.func(*values)
+        elapsed = time.perf_counter() - start
+        node.seconds = elapsed + sum(upstream.seconds for upstream in node.inputs)
+        stats['misses'] += 1
+        stats['computed'] += elapsed
+        if self.enabled and node.store:
+            self._write(node, value, node.seconds)
+        return value
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+        self._hashes = None
+
+    def report(self):
+        """[(stage, hits, misses, computed seconds, saved seconds)] in chain order."""
+        return [(name, s['hits'], s['misses'], s['computed'], s['saved']) for name, s in self.stats.items()]
+
+
+def amplitude_features(envelopes):
+    """Peak and mid-range ((max + min) / 2) of every envelope column."""
+    peaks = envelopes.max(axis=0)
+    return {'peak_rms': peaks.tolist(), 'mid_range_rms': ((peaks + envelopes.min(axis=0)) / 2).tolist()}
+
+
+def normalize_features(features, mvc_values):
+    """Mid-range RMS divided by the MVC of every channel (None without an MVC)."""
+    return [None if mvc is None else mid / mvc for mid, mvc in zip(features['mid_range_rms'], mvc_values)]
+
+
+def trial_nodes(cache, trial, mvc=None, params=DEFAULT_PARAMS, data_root=DATA_ROOT):
+    """The (features, normalize) nodes of one manifest ``Trial``."""
+    names = REGION_CHANNELS[trial.region]
+    file_path = os.path.join(data_root, trial.file_path)
+    mvc_values = [None if mvc is None else mvc[name] for name in names]
+
+    load = cache.stage('load', lambda: load_opensignals(file_path), {'sha256': cache.content_hash(file_path)},
+                       store=False)
+    select = cache.stage('select', lambda recording: recording.window(trial.start_freq, trial.end_freq, names),
+                         {'start_freq': int(trial.start_freq), 'end_freq': int(trial.end_freq), 'names': names},
+                         [load])
+    transform = cache.stage('transform', transform_mV, None, [select])
+    envelope = cache.stage('envelope', lambda block: compute_envelope(block, **params), params, [transform])
+    features = cache.stage('features', amplitude_features, None, [envelope])
+    normalize = cache.stage('normalize', lambda f: normalize_features(f, mvc_values), {'mvc': mvc_values},
+                            [features])
+    return features, normalize
+
+
+def run_pipeline(trials, mvc=None, params=DEFAULT_PARAMS, cache=None, data_root=DATA_ROOT):
+    """Result rows (as ``batch.run_batch`` returns them) of every trial, reusing cached stages."""
+    cache = StageCache() if cache is None else cache
+    rows = []
+    for trial in trials:
+        # A participant without an MVC still gets its features, just no normalized values
+        participant_mvc = None if mvc is None else mvc.get(trial.participant)
+        features, normalize = trial_nodes(cache, trial, participant_mvc, params, data_root)
+        normalized = normalize.value
+        # features is only read when normalize had to be computed; otherwise it comes from the cache as well
+        features = features.value
+        for k, name in enumerate(REGION_CHANNELS[trial.region]):
+            mvc_value = None if participant_mvc is None else participant_mvc[name]
+            rows.append({
+                'participant': trial.participant, 'load': trial.load, 'region': trial.region,
+                'side': name.split()[-1], 'channel': name,
+                'peak_rms': features['peak_rms'][k], 'mid_range_rms': features['mid_range_rms'][k],
+                'mvc': mvc_value, 'normalized': normalized[k],
+            })
+    return rows
+
+
+def print_report(cache, elapsed=None):
+    print(f"{'stage':<10}{'hits':>6}{'misses':>8}{'computed [s]':>14}{'saved [s]':>11}")
+    for name, hits, misses, computed, saved in cache.report():
+        print(f"{name:<10}{hits:>6}{misses:>8}{computed:>14.3f}{saved:>11.3f}")
+    if elapsed is not None:
+        print(f"total {elapsed:.3f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all trials through the cached stage pipeline.')
+    parser.add_argument('participants', nargs='*', help='participants to process (default: every manifest)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--cache', default=CACHE_DIR, help='stage cache folder')
+    parser.add_argument('--clear', action='store_true', help='empty the cache first')
+    parser.add_argument('--no-cache', action='store_true', help='compute every stage without reading or writing')
+    args = parser.parse_args()
+
+    manifest = load_manifests(args.participants or None, args.manifests)
+    mvc = {participant: manifest.mvc(participant) for participant in manifest.participants}
+    cache = StageCache(args.cache, enabled=not args.no_cache)
+    if args.clear:
+        cache.clear()
+
+    start = time.perf_counter()
+    rows = run_pipeline(manifest.trials(), mvc, cache=cache)
+    elapsed = time.perf_counter() - start
+    print(f"{len(rows)} rows")
+    print_report(cache, elapsed)
+
+
+if __name__ == '__main__':
+    main()
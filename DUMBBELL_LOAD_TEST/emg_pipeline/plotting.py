@@ -0,0 +1,173 @@
+"""Headless figure rendering with downsampled traces, in worker processes.
+
+Figures are drawn with the non-interactive Agg backend and saved to files,
+so batch runs never block on GUI windows. Long traces are reduced to a few
+thousand points before drawing, which keeps their visual shape:
+- 'minmax': the minimum and maximum of every bucket, in time order (keeps
+  every peak and trough; the default).
+- 'lttb': largest-triangle-three-buckets, one point per bucket picked to
+  keep the largest triangle area with its neighbours.
+Markers such as the envelope maxima are taken from the full-resolution trace.
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.plotting --figures figures
+    python -m emg_pipeline.plotting PP04 --figures figures --method lttb --points 1000
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .profiling import pool_map, stage
+
+DOWNSAMPLE_METHODS = ('minmax', 'lttb', 'none')
+DEFAULT_POINTS = 2000
+
+
+def headless_pyplot():
+    """pyplot with the non-interactive Agg backend."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def minmax_indices(y, n_out=DEFAULT_POINTS):
+    """Sample indices (M, C) of the minimum and maximum of every bucket of ``y`` (N, C), in time order."""
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    # Pad the last bucket with its final sample so all buckets can be reduced in one reshape
+    padded = np.concatenate([y, np.repeat(y[-1:], n_buckets * size - n, axis=0)])
+    blocks = padded.reshape(n_buckets, size, -1)
+    starts = (np.arange(n_buckets) * size)[:, np.newaxis]
+    pair = np.stack([blocks.argmin(axis=1) + starts, blocks.argmax(axis=1) + starts], axis=1)
+    pair.sort(axis=1)
+    return np.minimum(pair.reshape(2 * n_buckets, -1), n - 1)
+
+
+def lttb_indices(y, n_out=DEFAULT_POINTS):
+    """Sample indices (n_out, C) picked by largest-triangle-three-buckets for every column of ``y`` (N, C).
+
+    The buckets depend on each other and are visited in order; each step is
+    vectorized over the bucket's samples and all channels.
+    """
+    n, n_channels = y.shape
+    columns = np.arange(n_channels)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+    # Mean point of every bucket from one cumulative sum; the bucket after the last is the final sample
+    cumsum = np.concatenate([np.zeros((1, n_channels)), np.cumsum(y, axis=0)])
+    counts = np.diff(edges)[:, np.newaxis]
+    mean_y = np.concatenate([(cumsum[edges[1:]] - cumsum[edges[:-1]]) / counts, y[-1:]])
+    mean_x = np.concatenate([(edges[1:] + edges[:-1] - 1) / 2, [n - 1]])
+
+    out = np.empty((n_out, n_channels), dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = out[b], y[out[b], columns]
+        cx, cy = mean_x[b + 1], mean_y[b + 1]
+        candidates_x = np.arange(lo, hi)[:, np.newaxis]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - candidates_x) * (cy - ay))
+        out[b + 1] = lo + area.argmax(axis=0)
+    return out
+
+
+def downsample(y, n_out=DEFAULT_POINTS, method='minmax'):
+    """(x, y) of a trace (N,) or (N, C) reduced to about ``n_out`` points per channel; x are sample indices."""
+    y = np.asarray(y)
+    one_channel = y.ndim == 1
+    if one_channel:
+        y = y[:, np.newaxis]
+    if method == 'none' or len(y) <= n_out:
+        indices = np.broadcast_to(np.arange(len(y))[:, np.newaxis], y.shape)
+    elif method == 'minmax':
+        indices = minmax_indices(y, n_out)
+    elif method == 'lttb':
+        indices = lttb_indices(y, max(3, n_out))
+    else:
+        raise ValueError(f"method must be one of {DOWNSAMPLE_METHODS}, not {method!r}")
+    values = np.take_along_axis(y, indices, axis=0)
+    return (indices[:, 0], values[:, 0]) if one_channel else (indices, values)
+
+
+def envelope_figure(path, envelopes, names, title, n_out=DEFAULT_POINTS, method='minmax'):
+    """Save the envelopes (N, C) with their maxima marked, like the final_dumbbell scripts, to ``path``."""
+    plt = headless_pyplot()
+    with stage('downsample', envelopes.nbytes):
+        x, y = downsample(envelopes, n_out, method)
+    peaks = np.argmax(envelopes, axis=0)
+
+    with stage('draw'):
+        fig, ax = plt.subplots(figsize=(12, 8))
+        for k, name in enumerate(names):
+            line, = ax.plot(x[:, k], y[:, k], label=name)
+            ax.axvline(peaks[k], color=line.get_color(), linestyle='--')
+            ax.plot(peaks[k], envelopes[peaks[k], k], 'o', color=line.get_color())
+        ax.set_xlabel('Sample Index')
+        ax.set_ylabel('RMS EMG (mV)')
+        ax.set_title(title)
+        ax.legend()
+        ax.grid(True)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    # Fast PNG compression: encoding at the default level takes a quarter of the rendering time
+    with stage('savefig'):
+        fig.savefig(path, **({'pil_kwargs': {'compress_level': 1}} if path.endswith('.png') else {}))
+    plt.close(fig)
+    return path
+
+
+def _render_trial(args):
+    trial, params, figure_dir, data_root, n_out, method = args
+    from .channels import REGION_CHANNELS, transform_mV
+    from .envelope import compute_envelope
+    from .opensignals import load_opensignals
+
+    names = REGION_CHANNELS[trial.region]
+    recording = load_opensignals(os.path.join(data_root, trial.file_path))
+    envelopes = compute_envelope(transform_mV(recording.window(trial.start_freq, trial.end_freq, names)), **params)
+    path = os.path.join(figure_dir, f'{trial.participant}_{trial.load}kg_{trial.region}.png')
+    title = f'RMS EMG Data with Maximum Value Marked ({trial.participant}, Load {trial.load}kg, {trial.region})'
+    return envelope_figure(path, envelopes, names, title, n_out, method)
+
+
+def render_figures(trials, figure_dir, params=None, max_workers=None, n_out=DEFAULT_POINTS, method='minmax',
+                   data_root=None):
+    """Render one envelope figure per trial in a process pool (in-process when max_workers == 1); returns the paths."""
+    from .batch import DEFAULT_PARAMS
+    from .manifest import DATA_ROOT
+
+    tasks = [(trial, DEFAULT_PARAMS if params is None else params, figure_dir,
+              DATA_ROOT if data_root is None else data_root, n_out, method) for trial in trials]
+    if max_workers == 1:
+        return [_render_trial(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(pool_map(executor, _render_trial, tasks))
+
+
+def main():
+    from .manifest import MANIFEST_DIR, load_manifests
+
+    parser = argparse.ArgumentParser(description='Render the envelope figure of every trial to PNG files.')
+    parser.add_argument('participants', nargs='*', help='participants to render (default: every manifest)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--figures', default='figures', help='output folder')
+    parser.add_argument('--method', choices=DOWNSAMPLE_METHODS, default='minmax', help='trace downsampling')
+    parser.add_argument('--points', type=int, default=DEFAULT_POINTS, help='points per trace after downsampling')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    trials = load_manifests(args.participants or None, args.manifests, validate=False).trials()
+    start = time.perf_counter()
+    paths = render_figures(trials, args.figures, max_workers=args.workers, n_out=args.points, method=args.method)
+    print(f"{len(paths)} figures in {time.perf_counter() - start:.2f} s -> {args.figures}")
+
+
+if __name__ == '__main__':
+    main()
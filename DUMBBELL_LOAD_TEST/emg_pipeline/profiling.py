@@ -0,0 +1,288 @@
+"""Per-stage timing instrumentation: wall time, CPU time, peak memory and bytes processed.
+
+The loader, envelope, MVC, batch, pipeline and plotting code is wrapped in
+named stages. Profiling is off by default; a disabled stage is one flag
+check (well under a microsecond), so the instrumentation can stay in place.
+
+Switch it on from code:
+
+    from emg_pipeline import profiling
+    profiling.enable(memory=True)
+    ...
+    profiling.write_report('profile.json')   # or .csv
+
+or for any script without changing it, through the environment:
+
+    EMG_PROFILE=profile.json python PP04/final_dumbbell_PP04_v2
+
+Nested stages are recorded under their path (``process_job/envelope``) and
+their times include the stages inside them. Peak memory comes from
+tracemalloc and is only tracked with ``memory=True``, since tracing every
+allocation slows numpy code down.
+
+Pool workers exit without running ``atexit``, so process pools go through
+``pool_map``: each task returns its worker's events with its result and they
+are merged into the parent's report.
+
+Compare two runs:  python -m emg_pipeline.profiling old.json new.json
+"""
+
+import argparse
+import atexit
+import csv
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+REPORT_FIELDS = ('stage', 'calls', 'wall', 'cpu', 'peak_memory', 'bytes', 'throughput')
+
+
+class _NullStage:
+    """Context manager that does nothing; returned while profiling is off."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profiler, name, nbytes):
+        self.profiler = profiler
+        self.name = name
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        profiler = self.profiler
+        parent = profiler._stack[-1] if profiler._stack else None
+        self.path = self.name if parent is None else f'{parent.path}/{self.name}'
+        if profiler.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            # Fold the peak so far into the enclosing stage before the counter is reset for this one
+            if parent is not None:
+                parent.peak = max(parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory, self.peak = current, current
+        profiler._stack.append(self)
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        profiler = self.profiler
+        profiler._stack.pop()
+        peak = 0
+        if profiler.memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            peak = self.peak - self.start_memory
+            if profiler._stack:
+                profiler._stack[-1].peak = max(profiler._stack[-1].peak, self.peak)
+        profiler.events.append((self.path, wall, cpu, peak, self.nbytes))
+        return False
+
+
+class Profiler:
+    """Collects one event per stage execution while ``enabled``."""
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.events = []
+        self.started = None
+        self._stack = []
+
+    def enable(self, memory=False):
+        self.enabled = True
+        self.memory = memory
+        self.started = self.started or time.time()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.memory = False
+
+    def reset(self):
+        self.events = []
+        self.started = time.time() if self.enabled else None
+
+    def stage(self, name, nbytes=0):
+        """Context manager timing the code inside it as stage ``name``; ``nbytes`` is the data it processes."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, nbytes)
+
+    def summary(self):
+        """One dict per stage path (REPORT_FIELDS), in order of first appearance; times in seconds."""
+        stages = {}
+        for path, wall, cpu, peak, nbytes in self.events:
+            row = stages.setdefault(path, {'stage': path, 'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                           'peak_memory': 0, 'bytes': 0})
+            row['calls'] += 1
+            row['wall'] += wall
+            row['cpu'] += cpu
+            row['peak_memory'] = max(row['peak_memory'], peak)
+            row['bytes'] += nbytes
+        for row in stages.values():
+            row['throughput'] = row['bytes'] / row['wall'] if row['wall'] > 0 else 0.0
+        return list(stages.values())
+
+    def report(self, include_events=False):
+        """Machine-readable report of the run: metadata plus the per-stage summary."""
+        report = {
+            'run': {
+                'started': self.started, 'written': time.time(), 'argv': sys.argv,
+                'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                'memory_tracked': self.memory,
+            },
+            'stages': self.summary(),
+        }
+        if include_events:
+            report['events'] = [dict(zip(('stage', 'wall', 'cpu', 'peak_memory', 'bytes'), event))
+                                for event in self.events]
+        return report
+
+    def write_report(self, path, include_events=False):
+        """Write the report as CSV (per-stage rows) or JSON, chosen by the file extension."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(self.summary())
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.report(include_events), f, indent=1)
+        return path
+
+
+PROFILER = Profiler()
+
+
+def enable(memory=False):
+    PROFILER.enable(memory)
+
+
+def disable():
+    PROFILER.disable()
+
+
+def stage(name, nbytes=0):
+    """Time a block as stage ``name`` on the shared profiler."""
+    if not PROFILER.enabled:
+        return _NULL_STAGE
+    return _Stage(PROFILER, name, nbytes)
+
+
+def write_report(path, include_events=False):
+    return PROFILER.write_report(path, include_events)
+
+
+def profiled(name, nbytes=None):
+    """Decorator timing every call of a function as stage ``name``.
+
+    nbytes: optional function of the call's arguments giving the bytes processed.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _Stage(PROFILER, name, 0 if nbytes is None else nbytes(*args, **kwargs)):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def _call_profiled(func, memory, task):
+    # Runs in a pool worker: profile one task and hand its events back with the result
+    if not PROFILER.enabled:
+        PROFILER.enable(memory)
+    start = len(PROFILER.events)
+    result = func(task)
+    events = PROFILER.events[start:]
+    del PROFILER.events[start:]
+    return result, events
+
+
+def _merge_events(results):
+    for result, events in results:
+        PROFILER.events.extend(events)
+        yield result
+
+
+def pool_map(executor, func, tasks):
+    """``executor.map(func, tasks)`` that merges the workers' profiling events into this process's report.
+
+    Without profiling this is plain ``executor.map``. ``func`` must be a
+    module-level function, as for any process pool.
+    """
+    if not PROFILER.enabled:
+        return executor.map(func, tasks)
+    return _merge_events(executor.map(functools.partial(_call_profiled, func, PROFILER.memory), tasks))
+
+
+def compare_reports(old, new):
+    """[(stage, old wall, new wall, ratio)] for the stages in both reports (dicts or paths), slowest change first."""
+    reports = []
+    for report in (old, new):
+        if isinstance(report, str):
+            with open(report) as f:
+                report = json.load(f)
+        reports.append({row['stage']: row for row in report['stages']})
+    rows = [(name, reports[0][name]['wall'], row['wall'],
+             row['wall'] / reports[0][name]['wall'] if reports[0][name]['wall'] > 0 else float('inf'))
+            for name, row in reports[1].items() if name in reports[0]]
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def print_summary(rows):
+    print(f"{'stage':<40}{'calls':>7}{'wall [s]':>10}{'cpu [s]':>10}{'peak [MB]':>11}{'MB/s':>9}")
+    for row in rows:
+        print(f"{row['stage']:<40}{row['calls']:>7}{row['wall']:>10.4f}{row['cpu']:>10.4f}"
+              f"{row['peak_memory'] / 1e6:>11.2f}{row['throughput'] / 1e6:>9.1f}")
+
+
+def _environment_profile():
+    # EMG_PROFILE=<report path> profiles the whole process and writes the report when it exits
+    path = os.environ.get('EMG_PROFILE')
+    if not path:
+        return
+    enable(memory=os.environ.get('EMG_PROFILE_MEMORY', '1') != '0')
+    # Spawned pool workers inherit the variable; their events reach the parent through pool_map
+    if multiprocessing.parent_process() is None:
+        atexit.register(write_report, path)
+
+
+_environment_profile()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the per-stage wall times of two profiling reports.')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=1.2, help='flag stages at least this much slower')
+    args = parser.parse_args()
+    print(f"{'stage':<40}{'old [s]':>10}{'new [s]':>10}{'ratio':>8}")
+    for name, old, new, ratio in compare_reports(args.old, args.new):
+        flag = '  slower' if ratio >= args.threshold else ''
+        print(f"{name:<40}{old:>10.4f}{new:>10.4f}{ratio:>8.2f}{flag}")
+
+
+if __name__ == '__main__':
+    main()
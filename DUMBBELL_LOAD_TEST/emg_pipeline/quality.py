@@ -0,0 +1,196 @@
+"""Signal-quality screening of the raw 16-bit EMG, before conversion to mV.
+
+The NaN/inf check after ``transform_mV`` in the experiment scripts cannot
+fire on integer ADC data. This module looks for the problems that do occur,
+on all channels of an (N, C) block of counts at once:
+
+- rail: samples at the ADC limits (0 or 65535), where the signal is clipped;
+- flat: stretches where the value does not change, e.g. a dead channel;
+- drift: the local mean wandering away from mid-scale (the sensor output is
+  AC-coupled), typical of a loose electrode;
+- noise: windows whose power is mostly above ``noise_cutoff`` Hz and above
+  the amplifier's noise floor (a few uV), where the EMG is buried in noise;
+- quiet: windows with no more than noise-floor activity. Rest is quiet too,
+  so this does not count as bad per sample; a channel that is quiet during
+  (nearly) the whole trial is reported as lead-off, because a lift always
+  shows erector spinae activity.
+
+A lead-off electrode shows up as rail, flat, drift or quiet samples. On our
+recordings the thoracic channels of PP06 are quiet throughout (about 5 uV
+against 20-130 uV for the other participants).
+
+``screen_raw`` returns a per-sample bit mask (see ``QUALITY_FLAGS``) and
+``quality_summary`` turns it into one row per channel with the flagged
+fractions and an ok/warn/bad status, so batch runs can skip or annotate bad
+trials (``python -m emg_pipeline.batch --quality skip``).
+
+Screen recordings, or every manifest trial and MVC window without arguments:
+    python -m emg_pipeline.quality PP06/PP06_10KG.txt
+    python -m emg_pipeline.quality
+"""
+
+import argparse
+
+import numpy as np
+
+from .channels import ES_CHANNELS
+from .filters import sos_filter
+from .manifest import DATA_ROOT, MANIFEST_DIR, REGION_CHANNELS, load_manifests
+from .opensignals import load_opensignals
+
+ADC_MAX = 2**16 - 1
+MID_SCALE = ADC_MAX / 2
+COUNTS_PER_MV = 32768  # as in transform_mV
+
+# Bit of every problem in the quality mask
+QUALITY_FLAGS = {'rail': 1, 'flat': 2, 'drift': 4, 'noise': 8, 'quiet': 16}
+
+# Flags that make a sample bad on their own ('quiet' is also what rest looks like)
+BAD_FLAGS = QUALITY_FLAGS['rail'] | QUALITY_FLAGS['flat'] | QUALITY_FLAGS['drift'] | QUALITY_FLAGS['noise']
+
+QUALITY_DTYPE = np.dtype([
+    ('channel', 'U16'), ('samples', np.int64),
+    ('rail', np.float64), ('flat', np.float64), ('drift', np.float64), ('noise', np.float64),
+    ('quiet', np.float64), ('bad', np.float64), ('lead_off', np.bool_), ('status', 'U4'),
+])
+
+
+def moving_mean(x, size):
+    """Centered moving mean of every column of ``x`` (N, C); the window shrinks at the edges."""
+    n = len(x)
+    cumsum = np.empty((n + 1,) + x.shape[1:], dtype=np.float64)
+    cumsum[0] = 0
+    np.cumsum(x, axis=0, out=cumsum[1:])
+    starts = np.clip(np.arange(n) - size // 2, 0, n)
+    ends = np.clip(np.arange(n) - size // 2 + size, 0, n)
+    counts = (ends - starts).reshape((n,) + (1,) * (x.ndim - 1))
+    return (cumsum[ends] - cumsum[starts]) / counts
+
+
+def run_mask(same, length):
+    """Samples covered by runs of at least ``length`` samples, from an (N - 1, C) mask of unchanged steps."""
+    n = len(same) + 1
+    steps = length - 1
+    covered = np.zeros((n,) + same.shape[1:], dtype=bool)
+    if steps < 1:
+        covered[:] = True
+        return covered
+    if steps > len(same):
+        return covered
+    cumsum = np.zeros((len(same) + 1,) + same.shape[1:], dtype=np.int64)
+    np.cumsum(same, axis=0, out=cumsum[1:])
+    # A run of `length` samples starts at i when the steps i .. i + steps - 1 are all unchanged
+    starts = np.zeros((n + 1,) + same.shape[1:], dtype=np.int64)
+    starts[1:n - steps + 1] = cumsum[steps:] - cumsum[:-steps] == steps
+    # Sample j is covered when a run started within the `length` samples up to j
+    np.cumsum(starts, axis=0, out=starts)
+    covered[:] = starts[1:] > starts[np.maximum(np.arange(n) + 1 - length, 0)]
+    return covered
+
+
+def screen_raw(raw, fs=1000, rail_margin=0, flat_ms=20, flat_tolerance=0, drift_ms=1000, drift_mV=0.1,
+               window_ms=500, noise_cutoff=250, noise_fraction=0.3, noise_mV=0.005, quiet_mV=0.01):
+    """Per-sample quality mask (N, C) of raw ADC counts (N, C); bits as in ``QUALITY_FLAGS``.
+
+    rail_margin: counts from 0/65535 that still count as the rail.
+    flat_ms, flat_tolerance: minimum length of a flat stretch and the change (in counts) still called flat.
+    drift_ms, drift_mV: window of the local mean and its allowed distance from mid-scale.
+    window_ms: window of the local power used by the noise and quiet checks.
+    noise_cutoff, noise_fraction, noise_mV: cut-off (Hz), allowed share of the power
+        above it, and the RMS above the cut-off that the noise floor stays under.
+    quiet_mV: local RMS under which a window shows no activity.
+    """
+    raw = np.asarray(raw)
+    one_channel = raw.ndim == 1
+    if one_channel:
+        raw = raw[:, np.newaxis]
+    mask = np.zeros(raw.shape, dtype=np.uint8)
+    if len(raw) == 0:
+        return mask[:, 0] if one_channel else mask
+
+    mask[(raw <= rail_margin) | (raw >= ADC_MAX - rail_margin)] |= QUALITY_FLAGS['rail']
+
+    same = np.abs(np.diff(raw.astype(np.int32), axis=0)) <= flat_tolerance
+    mask[run_mask(same, max(2, int(round(flat_ms * fs / 1000))))] |= QUALITY_FLAGS['flat']
+
+    x = raw - MID_SCALE
+    local_mean = moving_mean(x, max(1, int(round(drift_ms * fs / 1000))))
+    mask[np.abs(local_mean) > drift_mV * COUNTS_PER_MV] |= QUALITY_FLAGS['drift']
+
+    # Local signal power (variance within the window) and the part of it above noise_cutoff
+    size = max(1, int(round(window_ms * fs / 1000)))
+    x = x - x.mean(axis=0)
+    high = sos_filter(x, noise_cutoff, fs, order=4, btype='high')
+    variance = moving_mean(x**2, size) - moving_mean(x, size) ** 2
+    high_power = moving_mean(high**2, size)
+    noisy = (high_power > noise_fraction * variance) & (high_power > (noise_mV * COUNTS_PER_MV) ** 2)
+    mask[noisy] |= QUALITY_FLAGS['noise']
+    mask[variance < (quiet_mV * COUNTS_PER_MV) ** 2] |= QUALITY_FLAGS['quiet']
+
+    return mask[:, 0] if one_channel else mask
+
+
+def quality_summary(mask, names, warn_fraction=0.01, bad_fraction=0.2, lead_off_fraction=0.95):
+    """One ``QUALITY_DTYPE`` row per channel: flagged fraction per problem and in total, and a status.
+
+    'bad' counts rail, flat, drift and noise samples. A channel is lead-off
+    when more than ``lead_off_fraction`` of it is quiet. Its status is 'bad'
+    when lead-off or more than ``bad_fraction`` bad, 'warn' above
+    ``warn_fraction`` and 'ok' otherwise.
+    """
+    mask = np.asarray(mask)
+    if mask.ndim == 1:
+        mask = mask[:, np.newaxis]
+    n = max(len(mask), 1)
+    summary = np.zeros(mask.shape[1], dtype=QUALITY_DTYPE)
+    summary['channel'] = names
+    summary['samples'] = len(mask)
+    for flag, bit in QUALITY_FLAGS.items():
+        summary[flag] = np.count_nonzero(mask & bit, axis=0) / n
+    summary['bad'] = np.count_nonzero(mask & BAD_FLAGS, axis=0) / n
+    summary['lead_off'] = (summary['quiet'] > lead_off_fraction) & (len(mask) > 0)
+    summary['status'] = np.where(summary['lead_off'] | (summary['bad'] > bad_fraction), 'bad',
+                                 np.where(summary['bad'] > warn_fraction, 'warn', 'ok'))
+    return summary
+
+
+def screen_recording(recording, start_freq=0, end_freq=np.iinfo(np.uint32).max, names=ES_CHANNELS, **kwargs):
+    """(mask, summary) of a recording's nSeq window; extra keyword arguments go to ``screen_raw``."""
+    raw = recording.window(start_freq, end_freq, names)
+    mask = screen_raw(raw, recording.sampling_rate, **kwargs)
+    return mask, quality_summary(mask, names)
+
+
+def print_summary(summary, label=''):
+    for row in summary:
+        lead_off = 'lead-off' if row['lead_off'] else ''
+        print(f"{label:<28}{row['channel']:<12}{row['status']:<7}{row['bad']:>7.1%}{row['rail']:>7.1%}"
+              f"{row['flat']:>7.1%}{row['drift']:>7.1%}{row['noise']:>7.1%}{row['quiet']:>7.1%}  {lead_off}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Screen raw EMG for rails, flat lines, drift and noise.')
+    parser.add_argument('files', nargs='*', help='recordings to screen (default: every manifest trial and MVC)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--bad-only', action='store_true', help='only list channels that are not ok')
+    args = parser.parse_args()
+
+    if args.files:
+        windows = [(file_path, file_path, 0, np.iinfo(np.uint32).max, ES_CHANNELS) for file_path in args.files]
+    else:
+        manifest = load_manifests(folder=args.manifests, data_root=DATA_ROOT, validate=False)
+        windows = [(f'{trial.participant} {trial.load} kg {trial.region}', manifest.path(trial), trial.start_freq,
+                    trial.end_freq, REGION_CHANNELS[trial.region]) for trial in manifest.trials()]
+        windows += [(f'{participant} MVC', manifest.mvc_file(participant), *manifest.mvc_window(participant),
+                     ES_CHANNELS) for participant in manifest.participants]
+
+    print(f"{'':<28}{'channel':<12}{'status':<7}{'bad':>7}{'rail':>7}{'flat':>7}{'drift':>7}{'noise':>7}{'quiet':>7}")
+    for label, file_path, start_freq, end_freq, names in windows:
+        _, summary = screen_recording(load_opensignals(file_path), start_freq, end_freq, names)
+        if args.bad_only:
+            summary = summary[summary['status'] != 'ok']
+        print_summary(summary, label)
+
+
+if __name__ == '__main__':
+    main()
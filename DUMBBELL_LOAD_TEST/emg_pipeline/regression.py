@@ -0,0 +1,269 @@
+"""Load-vs-EMG linear regression for every participant, side and the pooled group at once.
+
+Like ``PP_TOTAL/linear regression.py`` the load (kg) is regressed on the
+normalized EMG in %MVC. All fits are least squares from weighted sums over a
+padded (groups, points) array: a missing trial (PP03 has no 8 kg recording)
+just gets weight zero. Resampling only changes the weights, so B bootstrap
+resamples are one (B, groups, points) weight array and the same formulas.
+
+Confidence intervals:
+- bootstrap: percentile intervals over resamples. Pooled groups resample whole
+  participants (their trials are not independent), per-participant groups
+  resample trials. Chunks of resamples run in worker processes.
+- leave-one-participant-out: jackknife interval of the pooled fits (only
+  defined for groups with more than one participant).
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.regression --resamples 10000
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+from .profiling import pool_map
+
+REGRESSION_DTYPE = np.dtype([
+    ('region', 'U8'), ('side', 'U5'), ('group', 'U8'), ('n', np.int64), ('n_participants', np.int64),
+    ('slope', np.float64), ('intercept', np.float64), ('r2', np.float64), ('stderr', np.float64),
+    ('p_value', np.float64),
+    ('boot_slope', np.float64, (2,)), ('boot_intercept', np.float64, (2,)), ('boot_r2', np.float64, (2,)),
+    ('loo_slope', np.float64, (2,)), ('loo_intercept', np.float64, (2,)),
+])
+
+SIDES = ('left', 'right', 'mean')
+
+
+def weighted_fit(x, y, w):
+    """Least-squares slope, intercept and R² of y on x along the last axis, with point weights ``w``.
+
+    ``w`` may carry extra leading axes (e.g. resamples); x and y broadcast against it.
+    Fits with fewer than two distinct x values come out as NaN.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = w.sum(axis=-1)
+        mean_x = (w * x).sum(axis=-1) / total
+        mean_y = (w * y).sum(axis=-1) / total
+        dx = x - mean_x[..., np.newaxis]
+        dy = y - mean_y[..., np.newaxis]
+        sxx = (w * dx * dx).sum(axis=-1)
+        sxy = (w * dx * dy).sum(axis=-1)
+        syy = (w * dy * dy).sum(axis=-1)
+        # Resamples that drew a single x value leave only rounding noise in sxx
+        sxx[sxx <= 1e-12 * (w * x * x).sum(axis=-1)] = np.nan
+        slope = sxy / sxx
+        intercept = mean_y - slope * mean_x
+        r2 = sxy * sxy / (sxx * syy)
+    return slope, intercept, r2
+
+
+def regression_groups(series, participants=None, regions=('thoracic', 'lumbar'), sides=SIDES, scale=100):
+    """Padded fit groups from ``ResultsStore.series`` output.
+
+    Returns (labels, x, y, clusters, members): ``labels`` lists (region, side,
+    group) with group a participant or 'pooled'; x (EMG * scale), y (load),
+    ``clusters`` (resampling unit of each point, -1 for padding) and
+    ``members`` (participant index of each point, -1 for padding) are
+    (groups, points) arrays. Side 'mean' is the left/right average at the
+    loads where both sides were measured.
+    """
+    if participants is None:
+        participants = sorted({participant for participant, _, _ in series})
+    points = {}
+    for region in regions:
+        for participant in participants:
+            measured = {side: series.get((participant, region, side)) for side in ('left', 'right')}
+            for side in sides:
+                if side == 'mean':
+                    if measured['left'] is None or measured['right'] is None:
+                        continue
+                    loads, left, right = np.intersect1d(measured['left'][0], measured['right'][0],
+                                                        return_indices=True)
+                    values = (measured['left'][1][left] + measured['right'][1][right]) / 2
+                elif measured[side] is not None:
+                    loads, values = measured[side]
+                else:
+                    continue
+                keep = np.isfinite(values)
+                points[(region, side, participant)] = (loads[keep], values[keep] * scale)
+
+    labels, groups = [], []
+    for region in regions:
+        for side in sides:
+            present = [p for p in participants if (region, side, p) in points]
+            for participant in present:
+                loads, values = points[(region, side, participant)]
+                labels.append((region, side, participant))
+                owners = np.full(len(loads), participants.index(participant))
+                groups.append((values, loads, np.arange(len(loads)), owners))
+            if present:
+                loads = np.concatenate([points[(region, side, p)][0] for p in present])
+                values = np.concatenate([points[(region, side, p)][1] for p in present])
+                owners = np.concatenate([np.full(len(points[(region, side, p)][0]), participants.index(p))
+                                         for p in present])
+                labels.append((region, side, 'pooled'))
+                groups.append((values, loads, np.unique(owners, return_inverse=True)[1], owners))
+
+    width = max((len(group[0]) for group in groups), default=0)
+    x, y = np.zeros((len(groups), width)), np.zeros((len(groups), width))
+    clusters, members = np.full((len(groups), width), -1), np.full((len(groups), width), -1)
+    for g, (values, loads, cluster, owners) in enumerate(groups):
+        x[g, :len(values)], y[g, :len(values)] = values, loads
+        clusters[g, :len(values)], members[g, :len(values)] = cluster, owners
+    return labels, x, y, clusters, members
+
+
+def bootstrap_weights(clusters, n_resamples, rng):
+    """(B, groups, points) resampling counts: clusters drawn with replacement within every group."""
+    weights = np.zeros((n_resamples,) + clusters.shape)
+    for g, cluster in enumerate(clusters):
+        valid = cluster >= 0
+        n_clusters = cluster[valid].max() + 1 if valid.any() else 0
+        if n_clusters == 0:
+            continue
+        counts = rng.multinomial(n_clusters, np.full(n_clusters, 1 / n_clusters), size=n_resamples)
+        weights[:, g, valid] = counts[:, cluster[valid]]
+    return weights
+
+
+def _bootstrap_chunk(args):
+    x, y, clusters, n_resamples, seed = args
+    weights = bootstrap_weights(clusters, n_resamples, np.random.default_rng(seed))
+    return np.stack(weighted_fit(x, y, weights))
+
+
+def bootstrap(x, y, clusters, n_resamples=2000, seed=0, max_workers=None, chunk_elements=1 << 22):
+    """Slope, intercept and R² of every resample: a (3, B, groups) array.
+
+    Groups with the same number of points are resampled together, so the
+    per-participant groups are not padded to the width of the pooled ones.
+    Resamples are split into chunks of about ``chunk_elements`` weights with
+    independent seeds (the result does not depend on the number of workers)
+    and run in a process pool when max_workers != 1.
+    """
+    lengths = (clusters >= 0).sum(axis=1)
+    tasks, placement = [], []
+    widths = np.unique(lengths)
+    for width, bucket_seed in zip(widths, np.random.SeedSequence(seed).spawn(len(widths))):
+        rows = np.flatnonzero(lengths == width)
+        size = int(max(1, min(n_resamples, chunk_elements // max(1, len(rows) * width))))
+        starts = range(0, n_resamples, size)
+        for start, chunk_seed in zip(starts, bucket_seed.spawn(len(starts))):
+            tasks.append((x[rows, :width], y[rows, :width], clusters[rows, :width],
+                          min(size, n_resamples - start), chunk_seed))
+            placement.append((start, rows))
+
+    if max_workers == 1 or len(tasks) <= 1:
+        chunks = [_bootstrap_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(pool_map(executor, _bootstrap_chunk, tasks))
+    fits = np.full((3, n_resamples, len(x)), np.nan)
+    for (start, rows), chunk in zip(placement, chunks):
+        fits[:, start:start + chunk.shape[1], rows] = chunk
+    return fits
+
+
+def leave_one_out(x, y, members):
+    """Fits with each participant left out: (3, participants, groups), NaN where nothing was left out."""
+    valid = members >= 0
+    participants = np.arange(members.max() + 1 if valid.any() else 0)
+    weights = (valid & (members != participants[:, np.newaxis, np.newaxis])).astype(np.float64)
+    fits = np.stack(weighted_fit(x, y, weights))
+    # A participant who is not in the group leaves nothing out
+    absent = ~(members == participants[:, np.newaxis, np.newaxis]).any(axis=-1)
+    fits[:, absent] = np.nan
+    return fits
+
+
+def jackknife_interval(estimates, confidence=0.95):
+    """Jackknife confidence interval around the mean of leave-one-out estimates (axis 0)."""
+    n = np.sum(np.isfinite(estimates), axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(estimates, axis=0) / n
+        stderr = np.sqrt((n - 1) / n * np.nansum((estimates - mean) ** 2, axis=0))
+        half = stats.t.ppf(0.5 + confidence / 2, n - 1) * stderr
+    half = np.where(n > 2, half, np.nan)
+    return np.stack([mean - half, mean + half], axis=-1)
+
+
+def regression_table(series, participants=None, n_resamples=2000, confidence=0.95, seed=0, max_workers=None,
+                     min_finite=0.5, **kwargs):
+    """Fit every (region, side, participant/pooled) group with bootstrap and leave-one-out intervals.
+
+    Bootstrap intervals are NaN for groups with fewer than 3 points, or when
+    less than ``min_finite`` of the resamples give a fit (a resample that
+    draws one participant or load repeatedly has no slope): percentiles over
+    the few fits that remain would look like a precise estimate.
+    """
+    labels, x, y, clusters, members = regression_groups(series, participants, **kwargs)
+    weights = (clusters >= 0).astype(np.float64)
+    slope, intercept, r2 = weighted_fit(x, y, weights)
+
+    table = np.zeros(len(labels), dtype=REGRESSION_DTYPE)
+    table['region'], table['side'], table['group'] = zip(*labels) if labels else ((), (), ())
+    table['n'] = weights.sum(axis=1)
+    table['n_participants'] = [len(np.unique(m[m >= 0])) for m in members]
+    table['slope'], table['intercept'], table['r2'] = slope, intercept, r2
+
+    # Slope standard error and two-sided p-value as scipy.stats.linregress reports them
+    df = table['n'] - 2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.where(weights > 0, x - (weights * x).sum(1, keepdims=True) / table['n'][:, np.newaxis], 0)
+        dy = np.where(weights > 0, y - (weights * y).sum(1, keepdims=True) / table['n'][:, np.newaxis], 0)
+        table['stderr'] = np.sqrt((1 - r2) * (dy * dy).sum(1) / (dx * dx).sum(1) / df)
+        table['p_value'] = 2 * stats.t.sf(np.abs(slope / table['stderr']), df)
+    table['stderr'][df <= 0] = np.nan
+    table['p_value'][df <= 0] = np.nan
+
+    alpha = (1 - confidence) / 2 * 100
+    if n_resamples:
+        fits = bootstrap(x, y, clusters, n_resamples, seed, max_workers)
+        with np.errstate(invalid='ignore'):
+            bounds = np.nanpercentile(fits, [alpha, 100 - alpha], axis=1)
+        table['boot_slope'], table['boot_intercept'], table['boot_r2'] = np.moveaxis(bounds, 0, -1)
+        uninformative = (table['n'] < 3) | (np.isfinite(fits[0]).mean(axis=0) < min_finite)
+        for field in ('boot_slope', 'boot_intercept', 'boot_r2'):
+            table[field][uninformative] = np.nan
+
+    loo = leave_one_out(x, y, members)
+    table['loo_slope'] = jackknife_interval(loo[0], confidence)
+    table['loo_intercept'] = jackknife_interval(loo[1], confidence)
+    return table
+
+
+def print_table(table):
+    print(f"{'region':<9}{'side':<6}{'group':<8}{'n':>3}{'slope':>8}{'icpt':>8}{'R2':>6}{'p':>7}"
+          f"{'boot slope CI':>18}{'LOPO slope CI':>18}")
+    for row in table:
+        boot = 'n/a' if np.isnan(row['boot_slope'][0]) else f"[{row['boot_slope'][0]:.2f}, {row['boot_slope'][1]:.2f}]"
+        loo = '' if np.isnan(row['loo_slope'][0]) else f"[{row['loo_slope'][0]:.2f}, {row['loo_slope'][1]:.2f}]"
+        print(f"{row['region']:<9}{row['side']:<6}{row['group']:<8}{row['n']:>3}{row['slope']:>8.3f}"
+              f"{row['intercept']:>8.2f}{row['r2']:>6.2f}{row['p_value']:>7.3f}{boot:>18}{loo:>18}")
+
+
+def main():
+    from .batch import DEFAULT_PARAMS, ensure_results
+    from .results import RESULTS_PATH, ResultsStore
+
+    parser = argparse.ArgumentParser(description='Fit load vs. normalized EMG for every participant, side and pooled.')
+    parser.add_argument('participants', nargs='*', help='participants to include (default: all in the store)')
+    parser.add_argument('--store', default=RESULTS_PATH, help='SQLite results store')
+    parser.add_argument('--resamples', type=int, default=2000, help='number of bootstrap resamples')
+    parser.add_argument('--confidence', type=float, default=0.95, help='confidence level of the intervals')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    with ResultsStore(args.store) as store:
+        ensure_results(store, args.participants or None, max_workers=args.workers)
+        series = store.series('normalized', DEFAULT_PARAMS, participant=args.participants or None)
+    table = regression_table(series, args.participants or None, args.resamples, args.confidence, args.seed,
+                             args.workers)
+    print_table(table)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Local results store (SQLite) for per-trial metrics.
+
+Every value is one row: participant, load, region, side, channel, metric,
+value and the processing parameters (canonical JSON) it was computed with.
+Rows are unique per (participant, load, region, side, metric, params), so
+re-running a session replaces its rows and adding a participant is a single
+append. The regression stage reads all rows it needs with one indexed query
+instead of copying printed values into the script.
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from .manifest import DATA_ROOT
+
+RESULTS_PATH = os.path.join(DATA_ROOT, 'results.sqlite')
+
+# Metrics the batch runner produces per row
+METRICS = ('peak_rms', 'mid_range_rms', 'mvc', 'normalized')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    participant TEXT NOT NULL,
+    load REAL NOT NULL,
+    region TEXT NOT NULL,
+    side TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL,
+    params TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (participant, load, region, side, metric, params)
+);
+CREATE INDEX IF NOT EXISTS results_by_metric ON results (metric, params, region, side, participant, load);
+CREATE INDEX IF NOT EXISTS results_by_participant ON results (participant, metric);
+"""
+
+
+def normalize_params(params):
+    """Parameters with whole-number floats as ints, so 100 and 100.0 are the same setting."""
+    return {key: int(value) if isinstance(value, float) and value.is_integer() else value
+            for key, value in params.items()}
+
+
+def params_key(params):
+    """Canonical JSON of a parameter dict, so equal settings always give the same key."""
+    return json.dumps(normalize_params(params), sort_keys=True)
+
+
+class ResultsStore:
+    """Append and query per-trial metrics in a SQLite file."""
+
+    def __init__(self, path=RESULTS_PATH):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, rows, params, metrics=METRICS):
+        """Store the metrics of result rows (dicts as returned by ``batch.run_batch``); returns the row count."""
+        key = params_key(params)
+        created = time.time()
+        records = [(row['participant'], row['load'], row['region'], row['side'], row['channel'], metric,
+                    row[metric], key, created)
+                   for row in rows for metric in metrics if metric in row]
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+        return len(records)
+
+    def delete(self, participant, params=None):
+        """Remove a participant's rows (for all parameter sets unless ``params`` is given)."""
+        query, args = "DELETE FROM results WHERE participant = ?", [participant]
+        if params is not None:
+            query, args = query + " AND params = ?", args + [params_key(params)]
+        with self.connection:
+            return self.connection.execute(query, args).rowcount
+
+    def query(self, metric, params, participant=None, region=None, side=None, load=None):
+        """Matching rows as a list of (participant, load, region, side, channel, value), ordered by load."""
+        conditions, args = ["metric = ?", "params = ?"], [metric, params_key(params)]
+        for column, value in (('participant', participant), ('region', region), ('side', side), ('load', load)):
+            if value is None:
+                continue
+            values = list(value) if isinstance(value, (list, tuple, set)) else [value]
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            args.extend(values)
+        sql = (f"SELECT participant, load, region, side, channel, value FROM results WHERE {' AND '.join(conditions)}"
+               " ORDER BY participant, region, side, load")
+        return self.connection.execute(sql, args).fetchall()
+
+    def series(self, metric, params, **filters):
+        """{(participant, region, side): (loads, values)} as float arrays, from one query."""
+        grouped = collections.defaultdict(lambda: ([], []))
+        for participant, load, region, side, _, value in self.query(metric, params, **filters):
+            loads, values = grouped[(participant, region, side)]
+            loads.append(load)
+            values.append(np.nan if value is None else value)
+        return {key: (np.array(loads), np.array(values)) for key, (loads, values) in grouped.items()}
+
+    def participants(self, metric=None, params=None):
+        """Participants with stored rows (for a metric and parameter set, when given)."""
+        conditions, args = [], []
+        if metric is not None:
+            conditions.append("metric = ?")
+            args.append(metric)
+        if params is not None:
+            conditions.append("params = ?")
+            args.append(params_key(params))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return [row[0] for row in self.connection.execute(
+            f"SELECT DISTINCT participant FROM results{where} ORDER BY participant", args)]
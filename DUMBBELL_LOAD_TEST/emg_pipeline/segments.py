@@ -0,0 +1,153 @@
+"""Onset/offset detection of lifts on the RMS envelope, optionally confirmed by the goniometers.
+
+The hand-picked ``start_freq``/``end_freq`` windows are replaced by a
+threshold with hysteresis: a segment starts when the signal rises above the
+``on`` level and only ends once it falls below the lower ``off`` level, so
+ripple around a single threshold does not chop a lift into pieces. Levels are
+given as fractions between the rest level (a low percentile) and the active
+level (a high percentile) of the signal, so they adapt to every participant
+and electrode placement.
+
+Everything is one vectorized O(N) pass over the signal; only the list of
+segments is handled in Python. To propose windows for a new recording:
+    python -m emg_pipeline.segments PP04/PP04_8kg.txt --gonio
+"""
+
+import argparse
+
+import numpy as np
+
+from .channels import ES_CHANNELS, GONIO_CHANNELS, transform_mV
+from .envelope import rms_envelope
+from .filters import sos_filter
+from .opensignals import load_opensignals
+
+
+def hysteresis_mask(x, high, low):
+    """Boolean mask that turns on where x >= high and stays on until x < low."""
+    # +1 where the state is forced on, 0 where it is forced off, -1 where it keeps the previous state
+    state = np.full(len(x), -1, dtype=np.int8)
+    state[x < low] = 0
+    state[x >= high] = 1
+    # Forward-fill the last forced state: index of the last defined sample at or before each position
+    defined = np.where(state >= 0, np.arange(len(x)), -1)
+    np.maximum.accumulate(defined, out=defined)
+    return (defined >= 0) & (state[np.maximum(defined, 0)] == 1)
+
+
+def mask_segments(mask):
+    """(K, 2) array of [start, end) index pairs of the True runs in ``mask``."""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.column_stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)])
+
+
+def clean_segments(segments, min_gap=0, min_duration=0):
+    """Merge segments less than ``min_gap`` samples apart, then drop those shorter than ``min_duration``."""
+    if len(segments) == 0:
+        return segments
+    # A segment starts a new group unless it begins within min_gap of the previous end
+    new_group = np.concatenate([[True], segments[1:, 0] - segments[:-1, 1] >= min_gap])
+    starts = segments[new_group, 0]
+    ends = segments[np.concatenate([new_group[1:], [True]]), 1]
+    merged = np.column_stack([starts, ends])
+    keep = merged[:, 1] - merged[:, 0] >= min_duration
+    return merged[keep]
+
+
+def intersect_segments(a, b):
+    """Overlap of two sorted lists of [start, end) segments."""
+    # Both lists are sorted and non-overlapping, so a single merge pass suffices
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i, 0], b[j, 0]), min(a[i, 1], b[j, 1])
+        if start < end:
+            result.append((start, end))
+        if a[i, 1] < b[j, 1]:
+            i += 1
+        else:
+            j += 1
+    return np.array(result, dtype=np.int64).reshape(-1, 2)
+
+
+def activity_levels(x, on=0.3, off=0.15, rest_percentile=10, active_percentile=99):
+    """Absolute (high, low) thresholds from fractions between the rest and active level of x."""
+    rest, active = np.percentile(x, [rest_percentile, active_percentile])
+    return rest + on * (active - rest), rest + off * (active - rest)
+
+
+def detect_segments(x, fs=1000, on=0.3, off=0.15, min_gap=0.2, min_duration=0.3, rest_percentile=10,
+                    active_percentile=99):
+    """Onset/offset index pairs (K, 2) of the active segments of a 1-D signal.
+
+    ``min_gap`` and ``min_duration`` are in seconds.
+    """
+    high, low = activity_levels(x, on, off, rest_percentile, active_percentile)
+    segments = mask_segments(hysteresis_mask(x, high, low))
+    return clean_segments(segments, int(min_gap * fs), int(min_duration * fs))
+
+
+def gonio_motion(raw_gonio, fs=1000, cutoff=2):
+    """Deviation of the low-passed goniometer signals from their rest position, in counts.
+
+    ``raw_gonio`` is (N, C); the deviation of all goniometers is summed to a 1-D signal.
+    """
+    # Filter relative to the first sample so the filter does not start with a step from zero to ~30000 counts
+    start = raw_gonio[:1].astype(np.float64)
+    smoothed = sos_filter(raw_gonio - start, cutoff, fs, order=2) + start
+    # The most common position is rest: the dumbbell is lifted for only part of the recording
+    rest = np.median(smoothed[fs:] if len(smoothed) > 2 * fs else smoothed, axis=0)
+    return np.abs(smoothed - rest).sum(axis=1)
+
+
+def detect_lifts(recording, names=ES_CHANNELS, start_freq=0, end_freq=np.iinfo(np.uint32).max, use_gonio=False,
+                 cutoff=10, fs=1000, order=4, min_duration=0.3, **kwargs):
+    """Lift repetitions of a recording as (K, 2) inclusive nSeq bounds.
+
+    The mean RMS envelope of ``names`` is thresholded with hysteresis. With
+    ``use_gonio`` a segment is only kept while the goniometers have also moved
+    away from rest, which rejects muscle activity without a lift. Extra keyword
+    arguments go to ``detect_segments``.
+    """
+    rows = recording.window_rows(start_freq, end_freq)
+    nseq = np.asarray(recording['nSeq'][rows])
+    envelope = rms_envelope(transform_mV(recording.window(start_freq, end_freq, names)), cutoff, fs, order)
+    active = detect_segments(envelope.mean(axis=1), fs, min_duration=min_duration, **kwargs)
+
+    if use_gonio:
+        motion = gonio_motion(recording.window(start_freq, end_freq, GONIO_CHANNELS), fs)
+        moving = detect_segments(motion, fs, min_duration=min_duration, **kwargs)
+        active = clean_segments(intersect_segments(active, moving), 0, int(min_duration * fs))
+
+    if len(active) == 0:
+        return np.empty((0, 2), dtype=nseq.dtype)
+    return np.column_stack([nseq[active[:, 0]], nseq[active[:, 1] - 1]])
+
+
+def detect_active_window(recording, names=ES_CHANNELS, **kwargs):
+    """One (start_freq, end_freq) window spanning all detected activity, e.g. for an MVC recording."""
+    lifts = detect_lifts(recording, names, **kwargs)
+    if len(lifts) == 0:
+        return None
+    return int(lifts[0, 0]), int(lifts[-1, 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the detected lifts of OpenSignals recordings as nSeq windows.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--gonio', action='store_true', help='only keep activity while the goniometers move')
+    parser.add_argument('--on', type=float, default=0.3, help='onset level between rest (0) and active (1)')
+    parser.add_argument('--off', type=float, default=0.15, help='offset level between rest (0) and active (1)')
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        recording = load_opensignals(file_path)
+        fs = recording.sampling_rate
+        lifts = detect_lifts(recording, use_gonio=args.gonio, fs=fs, on=args.on, off=args.off)
+        print(f"{file_path}: {len(lifts)} segments")
+        for start, end in lifts:
+            print(f"  [{start}, {end}]  {(end - start + 1) / fs:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
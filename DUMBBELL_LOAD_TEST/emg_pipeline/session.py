@@ -0,0 +1,320 @@
+"""Time-aligned sessions of several recordings, across devices and split files.
+
+Every header carries the device MAC address (the key of the header JSON), the
+sampling rate, the ``"date"`` and ``"time"`` the recording started and the
+``"sync interval"`` of the device clocks. Together with ``nSeq`` that gives
+every sample an absolute timestamp:
+
+    time = start time + (nSeq - first nSeq) / sampling rate
+
+``load_session`` builds an offset index over a set of recordings (one row per
+file, see ``SEGMENT_DTYPE``) from the headers and the first and last nSeq of
+each file only: the last text line is read from the end of the file, and an
+archive (``.osz``) has its nSeq bounds in its chunk index. Nothing else is
+parsed until a window is asked for. ``Session.window`` then finds the segments
+of a device that overlap the time window by binary search on the index and
+only loads those, so a trial split over several files reads as one recording
+and a query inside one file never touches the others.
+
+``Session.aligned`` puts the windows of several devices on one sample grid
+(counted from the session start), with a mask of the samples each device
+actually has there.
+
+Print the index of a set of recordings and read a window (seconds from the session start):
+    python -m emg_pipeline.session PP04/PP04_6kg.txt PP04/PP04_8kg.txt PP04/PP04_10kg.txt --window 50 60
+"""
+
+import argparse
+import datetime
+import os
+
+import numpy as np
+
+from .archive import ARCHIVE_SUFFIX, Archive
+from .channels import ES_CHANNELS
+from .continuity import EMG_MID_SCALE
+from .opensignals import load_opensignals, read_header
+
+# One row per recording; times are microseconds since the epoch, nSeq bounds are inclusive
+SEGMENT_DTYPE = np.dtype([
+    ('device', 'U17'), ('file', 'U256'), ('fs', np.float64), ('sync_interval', np.float64),
+    ('start_us', np.int64), ('end_us', np.int64), ('first_nseq', np.int64), ('last_nseq', np.int64),
+])
+
+
+def recording_start(header):
+    """Start time of a recording as ``datetime64[us]``, from the header's "date" and "time".
+
+    OpenSignals writes the fields without zero padding ("2024-5-23",
+    "12:36:8.702"), milliseconds included ("10:24:24.84" is 84 ms).
+    """
+    year, month, day = (int(part) for part in header['date'].split('-'))
+    clock, _, millis = header['time'].partition('.')
+    hour, minute, second = (int(part) for part in clock.split(':'))
+    start = datetime.datetime(year, month, day, hour, minute, second, int(millis or 0) * 1000)
+    return np.datetime64(start, 'us')
+
+
+def to_timestamps(nseq, start, first_nseq, fs):
+    """Absolute ``datetime64[us]`` timestamps of nSeq values of a recording that starts at ``start``."""
+    offsets = np.rint((np.asarray(nseq, dtype=np.int64) - first_nseq) * (1e6 / fs)).astype(np.int64)
+    return np.datetime64(start, 'us') + offsets.astype('timedelta64[us]')
+
+
+def recording_timestamps(recording):
+    """Absolute timestamp of every sample of a ``Recording`` (or ``Archive``)."""
+    nseq = recording['nSeq']
+    first = int(nseq[0]) if len(nseq) else 0
+    return to_timestamps(nseq, recording_start(recording.header), first, recording.sampling_rate)
+
+
+def _last_line(file_path, block=4096):
+    # Last non-empty line of a text file, read backwards from the end
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = b''
+        while end > 0:
+            start = max(end - block, 0)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+            lines = data.strip().splitlines()
+            if len(lines) > 1 or (lines and start == 0):
+                return lines[-1]
+    return b''
+
+
+def _text_bounds(file_path, header_size):
+    # (first, last) nSeq of a text export from its first and last body lines
+    with open(file_path, 'rb') as f:
+        f.seek(header_size)
+        first_line = f.readline()
+    if not first_line.strip():
+        raise ValueError(f"{file_path} has no samples")
+    return int(first_line.split()[0]), int(_last_line(file_path).split()[0])
+
+
+def _segment_header(file_path):
+    # (header, device, first nSeq, last nSeq) of one recording without reading its body
+    if os.fspath(file_path).endswith(ARCHIVE_SUFFIX):
+        archive = Archive(file_path)
+        devices = archive.devices
+        chunks = archive.layout['nSeq']['chunks']
+        if not chunks:
+            raise ValueError(f"{file_path} has no samples")
+        if archive.layout['nSeq']['sorted']:
+            bounds = chunks[0][2], chunks[-1][3]
+        else:
+            nseq = archive.read('nSeq')
+            bounds = int(nseq.min()), int(nseq.max())
+    else:
+        devices, header_size = read_header(file_path)
+        bounds = _text_bounds(file_path, header_size)
+    if len(devices) != 1:
+        raise ValueError(f"{file_path} holds {len(devices)} devices; export one file per device")
+    device, header = next(iter(devices.items()))
+    return header, device, bounds[0], bounds[1]
+
+
+def segment_index(paths):
+    """``SEGMENT_DTYPE`` table of the given recordings, sorted by device and start time."""
+    index = np.zeros(len(paths), dtype=SEGMENT_DTYPE)
+    for row, file_path in zip(index, paths):
+        header, device, first, last = _segment_header(file_path)
+        fs = header['sampling rate']
+        start = recording_start(header).astype(np.int64)
+        row['device'], row['file'], row['fs'] = device, os.fspath(file_path), fs
+        row['sync_interval'] = header.get('sync interval', 0)
+        row['start_us'] = start
+        row['end_us'] = start + int(round((last - first) * 1e6 / fs))
+        row['first_nseq'], row['last_nseq'] = first, last
+    return index[np.lexsort((index['start_us'], index['device']))]
+
+
+def _to_us(time, origin):
+    # A time as microseconds since the epoch: datetime64 as is, numbers as seconds after origin
+    if isinstance(time, np.datetime64):
+        return int(time.astype('datetime64[us]').astype(np.int64))
+    return origin + int(round(time * 1e6))
+
+
+class Session:
+    """Recordings of one or more devices merged on absolute time; files are opened on first use."""
+
+    def __init__(self, index, max_overlap=1):
+        self.index = index
+        self.devices = list(dict.fromkeys(str(device) for device in index['device']))
+        self.start_us = int(index['start_us'].min())
+        self.end_us = int(index['end_us'].max())
+        self._sources = {}
+        for device in self.devices:
+            segments = self.segments(device)
+            # A later file of the same device may start at most max_overlap samples before the last one ended
+            overlap = segments['end_us'][:-1] - segments['start_us'][1:]
+            bad = np.flatnonzero(overlap > max_overlap * 1e6 / segments['fs'][1:])
+            if len(bad):
+                raise ValueError(f"{segments['file'][bad[0] + 1]} overlaps {segments['file'][bad[0]]} in time")
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f"Session(files={len(self.index)}, devices={self.devices}, start={self.start}, end={self.end})"
+
+    @property
+    def start(self):
+        return np.datetime64(self.start_us, 'us')
+
+    @property
+    def end(self):
+        return np.datetime64(self.end_us, 'us')
+
+    @property
+    def duration(self):
+        """Seconds from the first to the last sample of the session."""
+        return (self.end_us - self.start_us) / 1e6
+
+    def _device(self, device):
+        if device is None:
+            if len(self.devices) != 1:
+                raise ValueError(f"This session has several devices, pick one of {self.devices}")
+            return self.devices[0]
+        if device not in self.devices:
+            raise KeyError(f"Unknown device {device!r}; the session has {self.devices}")
+        return device
+
+    def segments(self, device=None):
+        """Index rows of one device, in time order."""
+        return self.index[self.index['device'] == self._device(device)]
+
+    def overlapping(self, start, end, device=None):
+        """Index rows of a device with samples between ``start`` and ``end`` (inclusive)."""
+        segments = self.segments(device)
+        start_us, end_us = _to_us(start, self.start_us), _to_us(end, self.start_us)
+        # Segments are sorted and do not overlap, so their ends are sorted too
+        first = np.searchsorted(segments['end_us'], start_us, side='left')
+        last = np.searchsorted(segments['start_us'], end_us, side='right')
+        return segments[first:last]
+
+    def source(self, file_path):
+        """The ``Recording`` or ``Archive`` of a segment, opened once."""
+        if file_path not in self._sources:
+            if file_path.endswith(ARCHIVE_SUFFIX):
+                self._sources[file_path] = Archive(file_path)
+            else:
+                self._sources[file_path] = load_opensignals(file_path)
+        return self._sources[file_path]
+
+    def _read(self, segment, start_us, end_us, names):
+        # (nSeq, raw block) of one segment between two absolute times
+        fs = segment['fs']
+        start_freq = segment['first_nseq'] + int(np.ceil((start_us - segment['start_us']) * fs / 1e6 - 1e-9))
+        end_freq = segment['first_nseq'] + int(np.floor((end_us - segment['start_us']) * fs / 1e6 + 1e-9))
+        source = self.source(str(segment['file']))
+        columns = source.channels.resolve(names)
+        rows = source.window_rows(start_freq, end_freq)
+        if isinstance(source, Archive):
+            return (source.read_rows('nSeq', rows),
+                    np.column_stack([source.read_rows(column, rows) for column in columns]))
+        return source['nSeq'][rows], np.column_stack([source.columns[column][rows] for column in columns])
+
+    def window(self, start, end, names=ES_CHANNELS, device=None):
+        """(timestamps, block): raw counts (N, C) of one device between two times, across its files.
+
+        ``start`` and ``end`` are ``datetime64`` values or seconds from the
+        session start; both are inclusive. Only the files that overlap the
+        window are opened.
+        """
+        start_us, end_us = _to_us(start, self.start_us), _to_us(end, self.start_us)
+        times, blocks = [], []
+        for segment in self.overlapping(start, end, device):
+            nseq, block = self._read(segment, start_us, end_us, names)
+            times.append(to_timestamps(nseq, np.datetime64(int(segment['start_us']), 'us'),
+                                       segment['first_nseq'], segment['fs']))
+            blocks.append(block)
+        if not blocks:
+            return np.empty(0, dtype='datetime64[us]'), np.empty((0, len(names)), dtype=np.uint16)
+        return np.concatenate(times), np.concatenate(blocks)
+
+    def aligned(self, start, end, channels=None, fill=EMG_MID_SCALE):
+        """(timestamps, block, present, labels) of several devices on one sample grid.
+
+        channels: device -> channel names (default: the ES channels of every
+        device). The grid counts samples from the session start at the common
+        sampling rate; each sample lands on the nearest grid point. Grid points
+        a device has no sample for hold ``fill`` (mid-scale, 0 mV) and are
+        False in ``present`` (N, devices). ``labels`` names the block columns
+        as "<device> <channel>".
+        """
+        channels = {device: ES_CHANNELS for device in self.devices} if channels is None else channels
+        rates = np.unique(self.index['fs'][np.isin(self.index['device'], list(channels))])
+        if len(rates) != 1:
+            raise ValueError(f"Devices with different sampling rates ({rates}) cannot share one grid")
+        fs = rates[0]
+        start_us, end_us = _to_us(start, self.start_us), _to_us(end, self.start_us)
+        first = int(np.ceil((start_us - self.start_us) * fs / 1e6 - 1e-9))
+        last = int(np.floor((end_us - self.start_us) * fs / 1e6 + 1e-9))
+        n = max(last - first + 1, 0)
+        grid = np.arange(first, first + n, dtype=np.int64)
+        timestamps = np.datetime64(self.start_us, 'us') + np.rint(grid * (1e6 / fs)).astype('timedelta64[us]')
+
+        width = sum(len(names) for names in channels.values())
+        block = np.full((n, width), fill, dtype=np.uint16)
+        present = np.zeros((n, len(channels)), dtype=bool)
+        labels, column = [], 0
+        for d, (device, names) in enumerate(channels.items()):
+            times, values = self.window(start, end, names, device)
+            points = np.rint((times.astype(np.int64) - self.start_us) * fs / 1e6).astype(np.int64) - first
+            inside = (points >= 0) & (points < n)
+            block[points[inside], column:column + len(names)] = values[inside]
+            present[points[inside], d] = True
+            labels += [f'{device} {name}' for name in names]
+            column += len(names)
+        return timestamps, block, present, labels
+
+
+def load_session(paths, max_overlap=1):
+    """A ``Session`` over recordings (text or ``.osz``) of one or more devices.
+
+    Files of the same device must not overlap in time by more than
+    ``max_overlap`` samples (the header time has millisecond resolution).
+    """
+    return Session(segment_index(paths), max_overlap)
+
+
+def print_index(session):
+    print(f"{'device':<19}{'file':<28}{'start':<28}{'end':<28}{'samples':>9}{'gap [s]':>9}")
+    for device in session.devices:
+        previous_end = None
+        for segment in session.segments(device):
+            gap = '' if previous_end is None else f"{(segment['start_us'] - previous_end) / 1e6:.3f}"
+            print(f"{segment['device']:<19}{os.path.relpath(segment['file']):<28}"
+                  f"{str(np.datetime64(int(segment['start_us']), 'us')):<28}"
+                  f"{str(np.datetime64(int(segment['end_us']), 'us')):<28}"
+                  f"{segment['last_nseq'] - segment['first_nseq'] + 1:>9}{gap:>9}")
+            previous_end = segment['end_us']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge recordings into one time-aligned session.')
+    parser.add_argument('files', nargs='+', help='recordings (text or .osz), of one or more devices')
+    parser.add_argument('--window', nargs=2, type=float, metavar=('START', 'END'),
+                        help='read a window, in seconds from the session start')
+    args = parser.parse_args()
+
+    session = load_session(args.files)
+    print(session)
+    print_index(session)
+    if args.window:
+        for device in session.devices:
+            times, block = session.window(*args.window, device=device)
+            touched = session.overlapping(*args.window, device=device)
+            span = f"{times[0]} .. {times[-1]}" if len(times) else 'no samples'
+            print(f"{device}: {len(block)} samples from {len(touched)} file(s) "
+                  f"({', '.join(os.path.relpath(file) for file in touched['file'])}): {span}")
+        print(f"files opened: {len(session._sources)} of {len(session)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Spectral fatigue features over sliding windows: median and mean power frequency.
+
+The signal is cut into overlapping windows with a strided view (no copy), and
+the power spectrum of every window and channel comes from a single
+``scipy.signal.welch`` call along the last axis. Median frequency (MDF) and
+mean power frequency (MNF) are then reduced over the frequency axis for all
+windows at once; during a sustained contraction both shift down with fatigue.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import signal
+
+from .channels import ES_CHANNELS, transform_mV
+
+# Surface EMG band; power outside it is mostly motion artefact and noise
+DEFAULT_BAND = (20, 450)
+
+
+def sliding_windows(block, window, step):
+    """(K, C, window) view of the windows of an (N, C) block, starting every ``step`` samples."""
+    return sliding_window_view(block, window, axis=0)[::step]
+
+
+def window_spectra(block, fs=1000, window=500, step=250, nperseg=256):
+    """Welch spectra of every window and channel: (frequencies, psd of shape (K, C, F)).
+
+    ``window`` and ``step`` are in samples.
+    """
+    windows = sliding_windows(block, window, step)
+    return signal.welch(windows, fs=fs, nperseg=min(nperseg, window), axis=-1)
+
+
+def median_frequency(frequencies, psd):
+    """Frequency below which half of the power lies, along the last axis (interpolated between bins)."""
+    cumulative = np.cumsum(psd, axis=-1)
+    half = cumulative[..., -1:] / 2
+    upper = np.minimum(np.argmax(cumulative >= half, axis=-1), len(frequencies) - 1)
+    lower = np.maximum(upper - 1, 0)
+    c_low = np.take_along_axis(cumulative, lower[..., np.newaxis], axis=-1)[..., 0]
+    c_high = np.take_along_axis(cumulative, upper[..., np.newaxis], axis=-1)[..., 0]
+    span = c_high - c_low
+    fraction = np.divide(half[..., 0] - c_low, span, out=np.zeros_like(span), where=span > 0)
+    return frequencies[lower] + np.clip(fraction, 0, 1) * (frequencies[upper] - frequencies[lower])
+
+
+def mean_frequency(frequencies, psd):
+    """Power-weighted mean frequency along the last axis."""
+    total = psd.sum(axis=-1)
+    return np.divide(psd @ frequencies, total, out=np.zeros_like(total), where=total > 0)
+
+
+def spectral_table(block, nseq=None, fs=1000, window_ms=500, step_ms=250, nperseg=256, band=DEFAULT_BAND):
+    """Per-window feature table of an (N, C) block in mV.
+
+    Each row holds the window's start/end sample, its nSeq bounds and centre
+    time, and per channel the MDF, MNF and in-band power.
+    """
+    block = np.asarray(block, dtype=np.float64)
+    window = int(round(window_ms * fs / 1000))
+    step = int(round(step_ms * fs / 1000))
+    n_channels = block.shape[1]
+    dtype = np.dtype([
+        ('start', np.int64), ('end', np.int64), ('start_nseq', np.int64), ('end_nseq', np.int64),
+        ('time', np.float64), ('mdf', np.float64, (n_channels,)), ('mnf', np.float64, (n_channels,)),
+        ('power', np.float64, (n_channels,)),
+    ])
+    if len(block) < window:
+        return np.zeros(0, dtype=dtype)
+
+    frequencies, psd = window_spectra(block, fs, window, step, nperseg)
+    in_band = (frequencies >= band[0]) & (frequencies <= band[1])
+    frequencies, psd = frequencies[in_band], psd[..., in_band]
+
+    table = np.zeros(psd.shape[0], dtype=dtype)
+    table['start'] = np.arange(len(table)) * step
+    table['end'] = table['start'] + window
+    if nseq is None:
+        nseq = np.arange(len(block))
+    table['start_nseq'] = nseq[table['start']]
+    table['end_nseq'] = nseq[table['end'] - 1]
+    table['time'] = (table['start'] + window / 2) / fs
+    table['mdf'] = median_frequency(frequencies, psd)
+    table['mnf'] = mean_frequency(frequencies, psd)
+    table['power'] = psd.sum(axis=-1) * (frequencies[1] - frequencies[0])
+    return table
+
+
+def spectral_features(recording, start_freq=0, end_freq=np.iinfo(np.uint32).max, names=ES_CHANNELS, **kwargs):
+    """Per-window MDF/MNF table of the ``names`` channels of a recording's nSeq window."""
+    rows = recording.window_rows(start_freq, end_freq)
+    nseq = np.asarray(recording['nSeq'][rows])
+    block = transform_mV(recording.window(start_freq, end_freq, names))
+    return spectral_table(block, nseq, recording.sampling_rate, **kwargs)
+
+
+def fatigue_slope(table, field='mdf'):
+    """Least-squares slope (Hz/s) of a feature over the window centre times, per channel."""
+    time = table['time'] - table['time'].mean()
+    values = table[field] - table[field].mean(axis=0)
+    return time @ values / (time @ time)
@@ -0,0 +1,168 @@
+"""Chunked envelope computation for recordings of any length.
+
+The text export is read a fixed number of lines at a time, the low-pass filter
+state (``zi``) is carried from one chunk to the next and running statistics are
+updated per chunk, so memory use does not grow with the recording length.
+Since the filter recursion is exactly the one ``rms_envelope`` runs on the
+whole window, the streamed envelope is bit-for-bit identical to it.
+"""
+
+import itertools
+
+import numpy as np
+from scipy import signal
+
+from .channels import ES_CHANNELS, ChannelRegistry, transform_mV
+from .filters import butter_sos
+from .opensignals import read_header
+
+
+def iter_chunks(file_path, chunk_size=4096, names=ES_CHANNELS):
+    """Yield (nseq, raw) per ``chunk_size`` lines of an OpenSignals text file.
+
+    ``raw`` holds the requested channels as an (n, C) uint16 block.
+    """
+    devices, header_size = read_header(file_path)
+    header = next(iter(devices.values()))
+    registry = ChannelRegistry(header)
+    n_columns = len(header['column'])
+    nseq_index = header['column'].index('nSeq')
+    indices = [registry.index(name) for name in names]
+
+    with open(file_path, 'rb') as f:
+        f.seek(header_size)
+        while True:
+            lines = list(itertools.islice(f, chunk_size))
+            if not lines:
+                return
+            table = np.fromstring(b''.join(lines), dtype=np.uint32, sep=' ').reshape(-1, n_columns)
+            yield table[:, nseq_index], table[:, indices].astype(np.uint16)
+
+
+class EnvelopeState:
+    """RMS envelope of C channels fed one block of consecutive raw samples at a time."""
+
+    def __init__(self, n_channels, cutoff=10, fs=1000, order=4, negative='clip'):
+        if negative not in ('clip', 'abs'):
+            raise ValueError(f"negative must be 'clip' or 'abs', not {negative!r}")
+        self.sos = butter_sos(cutoff, fs, order, 'low')
+        self.zi = np.zeros((self.sos.shape[0], n_channels, 2))
+        self.negative = negative
+
+    def process(self, raw):
+        """Envelope (n, C) of the next raw (n, C) block of 16-bit counts."""
+        # Same operations as rms_envelope, channel-major, with the filter state carried over
+        squared = transform_mV(raw.T)
+        np.square(squared, out=squared)
+        filtered, self.zi = signal.sosfilt(self.sos, squared, axis=-1, zi=self.zi)
+        if self.negative == 'clip':
+            np.maximum(filtered, 0, out=filtered)
+        else:
+            np.abs(filtered, out=filtered)
+        return np.sqrt(filtered, out=filtered).T
+
+
+class MovingRMSState:
+    """Moving RMS of C channels, for one or more window lengths, fed one raw block at a time.
+
+    Only the last (longest window) squared samples are kept between blocks,
+    so the cost per sample is constant. ``process`` returns (W, n, C) like
+    ``moving_rms`` and gives the same values as running it on the whole signal.
+    """
+
+    def __init__(self, n_channels, window_ms=(100,), fs=1000):
+        self.sizes = np.maximum(1, np.round(np.asarray(window_ms, dtype=np.float64) * fs / 1000).astype(np.int64))
+        self.tail = np.zeros((0, n_channels))
+        self.seen = 0
+
+    def process(self, raw):
+        squared = transform_mV(raw)
+        np.square(squared, out=squared)
+        history = np.vstack([self.tail, squared])
+        cumsum = np.zeros((len(history) + 1, history.shape[1]))
+        np.cumsum(history, axis=0, out=cumsum[1:])
+
+        ends = np.arange(len(self.tail), len(history)) + 1
+        seen = self.seen + np.arange(1, len(squared) + 1)
+        power = np.empty((len(self.sizes), len(squared), history.shape[1]))
+        for k, size in enumerate(self.sizes):
+            count = np.minimum(seen, size)
+            np.subtract(cumsum[ends], cumsum[ends - count], out=power[k])
+            power[k] /= count[:, np.newaxis]
+
+        self.tail = history[-int(self.sizes.max()):]
+        self.seen += len(squared)
+        np.maximum(power, 0, out=power)
+        return np.sqrt(power, out=power)
+
+
+class RunningStats:
+    """Per-channel count, min, max (with the nSeq of the maximum), mean and RMS of a stream."""
+
+    def __init__(self, n_channels):
+        self.count = 0
+        self.max = np.full(n_channels, -np.inf)
+        self.min = np.full(n_channels, np.inf)
+        self.argmax_nseq = np.zeros(n_channels, dtype=np.int64)
+        self.sum = np.zeros(n_channels)
+        self.sum_sq = np.zeros(n_channels)
+
+    def update(self, nseq, values):
+        if len(values) == 0:
+            return
+        idx = np.argmax(values, axis=0)
+        chunk_max = values[idx, np.arange(values.shape[1])]
+        better = chunk_max > self.max
+        self.max = np.where(better, chunk_max, self.max)
+        self.argmax_nseq = np.where(better, nseq[idx], self.argmax_nseq)
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.sum += values.sum(axis=0)
+        self.sum_sq += np.einsum('ij,ij->j', values, values)
+        self.count += len(values)
+
+    @property
+    def mean(self):
+        return self.sum / self.count
+
+    @property
+    def rms(self):
+        return np.sqrt(self.sum_sq / self.count)
+
+    @property
+    def mid_range(self):
+        """(max + min) / 2, the amplitude measure of the four-channel experiment scripts."""
+        return (self.max + self.min) / 2
+
+
+def stream_envelope(file_path, start_freq=None, end_freq=None, names=ES_CHANNELS, cutoff=10, fs=1000,
+                    order=4, chunk_size=4096, negative='clip', stats=None):
+    """Yield (nseq, envelope) chunks for the rows with start_freq <= nSeq <= end_freq.
+
+    Each envelope chunk is (n, C) float64. Pass a RunningStats as ``stats`` to
+    have it updated with every chunk.
+    """
+    state = EnvelopeState(len(names), cutoff, fs, order, negative)
+
+    for nseq, raw in iter_chunks(file_path, chunk_size, names):
+        if start_freq is not None or end_freq is not None:
+            keep = np.ones(len(nseq), dtype=bool)
+            if start_freq is not None:
+                keep &= nseq >= start_freq
+            if end_freq is not None:
+                keep &= nseq <= end_freq
+            nseq, raw = nseq[keep], raw[keep]
+            if len(nseq) == 0:
+                continue
+
+        envelope = state.process(raw)
+        if stats is not None:
+            stats.update(nseq, envelope)
+        yield nseq, envelope
+
+
+def streamed_stats(file_path, start_freq=None, end_freq=None, names=ES_CHANNELS, **kwargs):
+    """Run stream_envelope to the end and return only its RunningStats."""
+    stats = RunningStats(len(names))
+    for _ in stream_envelope(file_path, start_freq, end_freq, names, stats=stats, **kwargs):
+        pass
+    return stats
@@ -0,0 +1,227 @@
+"""Envelope parameter sweeps: every parameter set against every recording in one pass per file.
+
+A grid of envelope settings (IIR cutoffs and orders, moving-RMS windows,
+gains such as the 1.5 of ``PP00_MVC_data.py``) is evaluated on every trial
+window and MVC window of the manifests. Each recording is loaded once, and
+each window is converted to mV and squared once for the whole grid. All
+moving-RMS windows then come from a single cumulative sum, and every IIR
+setting is one sosfilt call over all channels. The MVC reference is taken
+from the MVC recording under the same settings, so each parameter set is
+normalized consistently. Files are spread over worker processes.
+
+The result is one tidy table: a row per (trial, channel, parameter set) with
+the parameter columns next to peak, mid-range, MVC and normalized value.
+Rows can go straight into the results store, where each parameter set is kept
+under its own key.
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.sweep --cutoffs 5 10 20 --orders 2 4 6 --methods iir moving --window-ms 50 100 250
+"""
+
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import signal
+
+from .batch import DEFAULT_PARAMS
+from .channels import ES_CHANNELS, REGION_CHANNELS, transform_mV
+from .envelope import ENVELOPE_METHODS, moving_rms
+from .filters import butter_sos
+from .manifest import DATA_ROOT, MANIFEST_DIR, load_manifests
+from .opensignals import load_opensignals
+from .profiling import pool_map
+
+PARAMETER_COLUMNS = ('method', 'cutoff', 'order', 'window_ms', 'gain', 'negative')
+
+# Parameter columns that mean nothing for a method are left empty in the table
+UNUSED_COLUMNS = {'iir': ('window_ms',), 'moving': ('cutoff', 'order', 'negative')}
+
+
+def parameter_grid(cutoffs=(10,), orders=(4,), methods=('iir',), window_ms=(100,), gains=(1.0,), fs=1000,
+                   negative='abs'):
+    """Parameter sets in the batch runner's format, one per combination.
+
+    IIR sets combine every cutoff, order and gain; moving-RMS sets every window
+    and gain. A gain other than 1 is stored under 'gain', so the default set
+    has the same key as ``batch.DEFAULT_PARAMS`` in the results store.
+    """
+    base = dict(DEFAULT_PARAMS, fs=fs, negative=negative)
+    grid = []
+    for method in methods:
+        if method not in ENVELOPE_METHODS:
+            raise ValueError(f"method must be one of {ENVELOPE_METHODS}, not {method!r}")
+        settings = ([{'method': 'iir', 'cutoff': c, 'order': o} for c in cutoffs for o in orders]
+                    if method == 'iir' else [{'method': 'moving', 'window_ms': w} for w in window_ms])
+        for setting in settings:
+            for gain in gains:
+                params = dict(base, **setting)
+                if gain != 1:
+                    params['gain'] = gain
+                grid.append(params)
+    return grid
+
+
+def grid_features(block, grid):
+    """Peak and mid-range envelope of every column of ``block`` (N, C, in mV) under every parameter set.
+
+    Returns (peaks, mid_range), both (P, C).
+    """
+    block = np.asarray(block, dtype=np.float64)
+    peaks = np.empty((len(grid), block.shape[1]))
+    lows = np.empty_like(peaks)
+
+    iir = [p for p, params in enumerate(grid) if params['method'] == 'iir']
+    if iir:
+        squared = np.square(block.T)
+        for p in iir:
+            params = grid[p]
+            power = signal.sosfilt(butter_sos(params['cutoff'], params['fs'], params['order'], 'low'), squared,
+                                   axis=-1)
+            if params['negative'] == 'clip':
+                np.maximum(power, 0, out=power)
+            else:
+                np.abs(power, out=power)
+            # sqrt is monotonic, so only the extremes need it
+            peaks[p], lows[p] = np.sqrt(power.max(axis=1)), np.sqrt(power.min(axis=1))
+
+    moving = [p for p, params in enumerate(grid) if params['method'] == 'moving']
+    for fs in {grid[p]['fs'] for p in moving}:
+        group = [p for p in moving if grid[p]['fs'] == fs]
+        windows = sorted({grid[p]['window_ms'] for p in group})
+        envelopes = moving_rms(block, windows, fs)
+        for p in group:
+            envelope = envelopes[windows.index(grid[p]['window_ms'])]
+            peaks[p], lows[p] = envelope.max(axis=0), envelope.min(axis=0)
+
+    gains = np.array([params.get('gain', 1.0) for params in grid])[:, np.newaxis]
+    peaks *= gains
+    lows *= gains
+    return peaks, (peaks + lows) / 2
+
+
+def parameter_columns(params):
+    """The table's parameter columns of one parameter set."""
+    columns = {column: params.get(column) for column in PARAMETER_COLUMNS}
+    columns['gain'] = params.get('gain', 1.0)
+    for column in UNUSED_COLUMNS[params['method']]:
+        columns[column] = None
+    return columns
+
+
+def _sweep_file(args):
+    file_path, windows, grid = args
+    recording = load_opensignals(file_path)
+    results = []
+    for start_freq, end_freq, names in windows:
+        block = transform_mV(recording.window(start_freq, end_freq, list(names)))
+        results.append(grid_features(block, grid))
+    return results
+
+
+def run_sweep(grid, participants=None, folder=MANIFEST_DIR, data_root=DATA_ROOT, max_workers=None):
+    """Tidy rows (dicts) of every trial, channel and parameter set; 'params' holds each row's parameter set."""
+    manifest = load_manifests(participants, folder, data_root, validate=False)
+    trials = manifest.trials()
+
+    # Group every window by recording so each file is opened once
+    windows = {}
+    for trial in trials:
+        windows.setdefault(trial.file_path, []).append((trial.start_freq, trial.end_freq,
+                                                         tuple(REGION_CHANNELS[trial.region])))
+    for participant in manifest.participants:
+        start_freq, end_freq = manifest.mvc_window(participant)
+        windows.setdefault(manifest.mvc_file(participant), []).append((start_freq, end_freq, tuple(ES_CHANNELS)))
+
+    files = list(windows)
+    tasks = [(os.path.join(data_root, file_path), windows[file_path], grid) for file_path in files]
+    if max_workers == 1:
+        outputs = [_sweep_file(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(pool_map(executor, _sweep_file, tasks))
+    # Thoracic and lumbar windows of a recording can share an nSeq range, so the channels are part of the key
+    features = {(file_path, *window): result for file_path, output in zip(files, outputs)
+                for window, result in zip(windows[file_path], output)}
+
+    table_columns = [parameter_columns(params) for params in grid]
+    rows = []
+    for trial in trials:
+        names = tuple(REGION_CHANNELS[trial.region])
+        peaks, mid_range = features[(trial.file_path, trial.start_freq, trial.end_freq, names)]
+        mvc_peaks = features[(manifest.mvc_file(trial.participant), *manifest.mvc_window(trial.participant),
+                              tuple(ES_CHANNELS))][0]
+        for p, (params, columns) in enumerate(zip(grid, table_columns)):
+            for k, name in enumerate(names):
+                mvc = float(mvc_peaks[p, ES_CHANNELS.index(name)])
+                row = {'participant': trial.participant, 'load': trial.load, 'region': trial.region,
+                       'side': name.split()[-1], 'channel': name}
+                row.update(columns)
+                row.update({'peak_rms': float(peaks[p, k]), 'mid_range_rms': float(mid_range[p, k]), 'mvc': mvc,
+                            'normalized': float(mid_range[p, k]) / mvc, 'params': params})
+                rows.append(row)
+    return rows
+
+
+def store_sweep(store, rows):
+    """Append sweep rows to a ``ResultsStore``, each under its own parameter set; returns the value count."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(repr(sorted(row['params'].items())), (row['params'], []))[1].append(row)
+    return sum(store.append(group, params) for params, group in groups.values())
+
+
+def write_csv(rows, path):
+    fields = [key for key in rows[0] if key != 'params']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_summary(rows):
+    """Mean normalized value per parameter set and region."""
+    summary = {}
+    for row in rows:
+        key = tuple(row[column] for column in PARAMETER_COLUMNS)
+        summary.setdefault(key, {}).setdefault(row['region'], []).append(row['normalized'])
+    print(f"{'method':<8}{'cutoff':>7}{'order':>6}{'window':>7}{'gain':>6}{'thoracic':>10}{'lumbar':>8}")
+    for (method, cutoff, order, window, gain, _), regions in summary.items():
+        cutoff, order, window = ('' if value is None else value for value in (cutoff, order, window))
+        print(f"{method:<8}{cutoff:>7}{order:>6}{window:>7}{gain:>6}"
+              f"{np.mean(regions.get('thoracic', [np.nan])):>10.4f}{np.mean(regions.get('lumbar', [np.nan])):>8.4f}")
+
+
+def main():
+    from .results import RESULTS_PATH, ResultsStore, normalize_params
+
+    parser = argparse.ArgumentParser(description='Evaluate a grid of envelope parameters on every recording.')
+    parser.add_argument('participants', nargs='*', help='participants to include (default: every manifest)')
+    parser.add_argument('--manifests', default=MANIFEST_DIR, help='folder with the session manifests')
+    parser.add_argument('--cutoffs', type=float, nargs='+', default=[10])
+    parser.add_argument('--orders', type=int, nargs='+', default=[4])
+    parser.add_argument('--methods', choices=ENVELOPE_METHODS, nargs='+', default=['iir'])
+    parser.add_argument('--window-ms', type=float, nargs='+', default=[100])
+    parser.add_argument('--gains', type=float, nargs='+', default=[1.0])
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: all cores)')
+    parser.add_argument('--csv', default=None, help='write the tidy table to this CSV file')
+    parser.add_argument('--store', nargs='?', const=RESULTS_PATH, default=None,
+                        help='append the rows to a SQLite results store')
+    args = parser.parse_args()
+
+    grid = [normalize_params(params)
+            for params in parameter_grid(args.cutoffs, args.orders, args.methods, args.window_ms, args.gains)]
+    rows = run_sweep(grid, args.participants or None, args.manifests, max_workers=args.workers)
+    print(f"{len(grid)} parameter sets, {len(rows)} rows")
+    print_summary(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
+    if args.store is not None:
+        with ResultsStore(args.store) as store:
+            print(f"{store_sweep(store, rows)} values stored in {args.store}")
+
+
+if __name__ == '__main__':
+    main()
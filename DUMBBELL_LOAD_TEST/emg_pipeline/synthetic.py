@@ -0,0 +1,195 @@
+"""Synthetic OpenSignals recordings and datasets for scaling tests.
+
+Recordings have the same header structure and columns as the biosignalsplux
+exports (nSeq, DI, CH1/CH2 GONIO, CH3-CH6 EMG, 16-bit, 1000 Hz). The EMG is
+band-limited (20-450 Hz) Gaussian noise whose amplitude rises in smooth
+bursts during each lift, scaled with the load; the goniometers follow the
+lifts with a slow flexion curve. The lift windows are returned as well, so
+detectors can be checked against them.
+
+``generate_dataset`` writes a whole study: per participant one recording per
+load, an MVC recording and a session manifest, laid out like the real data
+so ``load_manifests(folder=..., data_root=...)`` and the batch runner work on it.
+
+Run from the DUMBBELL_LOAD_TEST folder:
+    python -m emg_pipeline.synthetic /tmp/synthetic --participants 50 --duration 120
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+from scipy import signal
+
+from .filters import butter_sos
+
+DEVICE = '00:07:80:46:F2:86'
+COLUMNS = ['nSeq', 'DI', 'CH1', 'CH2', 'CH3', 'CH4', 'CH5', 'CH6']
+SENSORS = ['GONIO', 'GONIO', 'EMG', 'EMG', 'EMG', 'EMG']
+
+# Resting goniometer counts (CH1, CH2) and their change at full flexion, roughly as in PP04
+GONIO_BASELINE = (31450, 27800)
+GONIO_RANGE = (300, 3500)
+
+
+def device_header(fs=1000, date='2024-5-23', time='12:00:00.000', device=DEVICE):
+    """Header JSON of a six-channel biosignalsplux recording, keyed by the device MAC address."""
+    return {device: {
+        'position': 0, 'device': 'biosignalsplux', 'device name': device, 'device connection': f'BTH{device}',
+        'sampling rate': fs, 'resolution': [16] * 6, 'firmware version': 775, 'comments': '', 'keywords': '',
+        'mode': 0, 'sync interval': 2, 'date': date, 'time': time, 'channels': [1, 2, 3, 4, 5, 6],
+        'sensor': SENSORS, 'label': [f'CH{k}' for k in range(1, 7)], 'column': COLUMNS,
+        'special': [{'SpO2': [80, 40, 5, 4, 3, 3]}] * len(COLUMNS), 'digital IO': [0, 1],
+        'sleeve color': ['green', 'black', 'dark_blue', 'white', 'light_blue', 'black'], 'convertedValues': 0,
+    }}
+
+
+def lift_schedule(n_samples, fs=1000, lift_s=2.0, rest_s=3.0, lead_s=3.0, jitter=0.2, rng=None):
+    """(K, 2) start/end samples of the lifts: lead rest, then alternating lift and rest with random jitter."""
+    rng = np.random.default_rng() if rng is None else rng
+    lifts = []
+    start = lead_s * fs
+    while True:
+        length = lift_s * fs * (1 + jitter * rng.uniform(-1, 1))
+        if start + length + lead_s * fs > n_samples:
+            break
+        lifts.append((int(start), int(start + length)))
+        start += length + rest_s * fs * (1 + jitter * rng.uniform(-1, 1))
+    return np.array(lifts, dtype=np.int64).reshape(-1, 2)
+
+
+def burst_profile(n_samples, lifts):
+    """0..1 activation: a Hann-shaped burst over every lift."""
+    profile = np.zeros(n_samples)
+    for start, end in lifts:
+        profile[start:end] = np.hanning(end - start)
+    return profile
+
+
+def synthetic_recording(duration=60, fs=1000, load=8, noise_mV=0.01, burst_mV=0.02, lift_s=2.0, rest_s=3.0,
+                        lead_s=3.0, start_nseq=0, seed=None):
+    """Columns (dict of uint32 nSeq / uint16 arrays, in file order) and lift windows (K, 2) in nSeq.
+
+    duration: seconds. burst_mV: EMG amplitude per kg at the peak of a lift,
+    on top of the ``noise_mV`` baseline. Each EMG channel gets its own gain.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(round(duration * fs))
+    lifts = lift_schedule(n, fs, lift_s, rest_s, lead_s, rng=rng)
+    profile = burst_profile(n, lifts)
+
+    gains = rng.uniform(0.6, 1.4, 4)
+    amplitude = noise_mV + burst_mV * load * profile[:, np.newaxis] * gains
+    emg = rng.standard_normal((n, 4)) * amplitude
+    emg = signal.sosfilt(butter_sos((20, 450), fs, 4, 'band'), emg, axis=0)
+    # mV -> counts, the inverse of channels.transform_mV
+    emg_counts = np.clip(np.rint(emg * 32768 + (2**16 - 1) / 2), 0, 2**16 - 1)
+
+    flexion = np.sin(np.pi * profile / 2) ** 2
+    gonio = np.column_stack([base + span * flexion + rng.normal(0, 15, n)
+                             for base, span in zip(GONIO_BASELINE, GONIO_RANGE)])
+
+    columns = {'nSeq': np.arange(start_nseq, start_nseq + n, dtype=np.uint32), 'DI': np.zeros(n, dtype=np.uint16)}
+    for k, name in enumerate(COLUMNS[2:4]):
+        columns[name] = np.clip(np.rint(gonio[:, k]), 0, 2**16 - 1).astype(np.uint16)
+    for k, name in enumerate(COLUMNS[4:]):
+        columns[name] = emg_counts[:, k].astype(np.uint16)
+    return columns, lifts + start_nseq
+
+
+def format_rows(table):
+    """Tab-separated text of an (N, M) unsigned integer table, each value and line ending like the exports.
+
+    Every column is written as fixed-width ASCII digits at once; the leading
+    zeros are then dropped with one boolean mask over the whole buffer.
+    """
+    table = np.asarray(table, dtype=np.uint64)
+    rows = len(table)
+    widths = [len(str(int(column.max()))) if rows else 1 for column in table.T]
+    line = sum(widths) + len(widths) + 1
+    chars = np.empty((rows, line), dtype=np.uint8)
+    keep = np.empty((rows, line), dtype=bool)
+    position = 0
+    for column, width in zip(table.T, widths):
+        digits = np.ones(rows, dtype=np.int64)
+        for k in range(1, width):
+            digits += column >= 10**k
+        for k in range(width):
+            chars[:, position + width - 1 - k] = 48 + column // 10**k % 10
+            keep[:, position + width - 1 - k] = k < digits
+        chars[:, position + width] = ord('\t')
+        keep[:, position + width] = True
+        position += width + 1
+    chars[:, position] = ord('\n')
+    keep[:, position] = True
+    return chars[keep].tobytes()
+
+
+def write_opensignals(file_path, columns, devices=None, chunk_rows=1 << 16):
+    """Write columns (dict in file order) as an OpenSignals text file; returns the file size in bytes."""
+    devices = device_header() if devices is None else devices
+    table = np.column_stack([np.asarray(column) for column in columns.values()])
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    with open(file_path, 'wb') as f:
+        f.write(b'# OpenSignals Text File Format. Version 1\n')
+        f.write(f'# {json.dumps(devices)}\n'.encode('utf-8'))
+        f.write(b'# EndOfHeader\n')
+        for start in range(0, len(table), chunk_rows):
+            f.write(format_rows(table[start:start + chunk_rows]))
+        return f.tell()
+
+
+def generate_dataset(folder, n_participants=5, loads=(6, 8, 10), duration=60, mvc_duration=30, seed=0, fs=1000,
+                     **kwargs):
+    """Write recordings, MVC recordings and manifests for ``n_participants``; returns the participant ids.
+
+    Layout: ``<folder>/PPxxx/PPxxx_<load>kg.txt``, ``<folder>/MVC/PPxxx_MVC.txt``
+    and ``<folder>/manifests/PPxxx.json``. Trial windows cover the whole
+    recording; extra keyword arguments go to ``synthetic_recording``.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_participants)
+    width = max(2, len(str(n_participants - 1)))
+    participants = []
+    for p, participant_seed in enumerate(seeds):
+        participant = f'PP{p:0{width}d}'
+        rngs = participant_seed.spawn(len(loads) + 1)
+        session = {'participant': participant, 'trials': []}
+
+        mvc_file = f'MVC/{participant}_MVC.txt'
+        # MVC: a few long, strong contractions
+        columns, _ = synthetic_recording(mvc_duration, fs, load=25, lift_s=5.0, rest_s=5.0, seed=rngs[0], **kwargs)
+        write_opensignals(os.path.join(folder, mvc_file), columns)
+        session['mvc'] = {'file': mvc_file, 'window': [0, int(columns['nSeq'][-1])]}
+
+        for load, rng in zip(loads, rngs[1:]):
+            trial_file = f'{participant}/{participant}_{load}kg.txt'
+            columns, _ = synthetic_recording(duration, fs, load=load, seed=rng, **kwargs)
+            write_opensignals(os.path.join(folder, trial_file), columns)
+            session['trials'].append({'load': load, 'file': trial_file, 'window': [0, int(columns['nSeq'][-1])]})
+
+        os.makedirs(os.path.join(folder, 'manifests'), exist_ok=True)
+        with open(os.path.join(folder, 'manifests', f'{participant}.json'), 'w') as f:
+            json.dump(session, f, indent=2)
+        participants.append(participant)
+    return participants
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic OpenSignals dataset with manifests.')
+    parser.add_argument('folder')
+    parser.add_argument('--participants', type=int, default=5)
+    parser.add_argument('--loads', type=float, nargs='+', default=[6, 8, 10])
+    parser.add_argument('--duration', type=float, default=60, help='seconds per trial recording')
+    parser.add_argument('--noise', type=float, default=0.01, help='baseline EMG noise in mV')
+    parser.add_argument('--burst', type=float, default=0.02, help='EMG burst amplitude per kg in mV')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    loads = [int(load) if float(load).is_integer() else load for load in args.loads]
+    participants = generate_dataset(args.folder, args.participants, loads, args.duration, seed=args.seed,
+                                    noise_mV=args.noise, burst_mV=args.burst)
+    print(f"{len(participants)} participants x {len(loads)} loads written to {args.folder}")
+
+
+if __name__ == '__main__':
+    main()
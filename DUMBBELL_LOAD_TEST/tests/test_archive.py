@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from emg_pipeline.archive import CODECS, Archive, archive_recording, decode_chunk, encode_chunk
+from emg_pipeline.channels import ES_CHANNELS
+from emg_pipeline.manifest import DATA_ROOT
+from emg_pipeline.opensignals import load_opensignals
+
+RECORDING = f'{DATA_ROOT}/PP04/PP04_6kg.txt'
+
+
+@pytest.mark.parametrize('codec', list(CODECS))
+@pytest.mark.parametrize('dtype', [np.uint16, np.uint32])
+def test_chunk_round_trip(codec, dtype):
+    # Random values include steps down, which wrap around in the unsigned delta encoding
+    values = np.random.default_rng(0).integers(0, np.iinfo(dtype).max, 1000, endpoint=True).astype(dtype)
+    decoded = decode_chunk(encode_chunk(values, codec), values.dtype.str, values[0], codec)
+    assert decoded.dtype == dtype
+    np.testing.assert_array_equal(decoded, values)
+
+
+def test_recording_round_trip(tmp_path):
+    recording = load_opensignals(RECORDING)
+    archive = Archive(archive_recording(RECORDING, str(tmp_path / 'PP04_6kg.txt.osz'), chunk_rows=1000))
+
+    assert archive.column_names == recording.column_names
+    assert archive.devices == recording.devices
+    for name in recording.column_names:
+        np.testing.assert_array_equal(archive[name], recording[name])
+    # A window across chunk boundaries decodes to the same rows as the text file
+    np.testing.assert_array_equal(archive.window(1500, 3200, ES_CHANNELS), recording.window(1500, 3200, ES_CHANNELS))
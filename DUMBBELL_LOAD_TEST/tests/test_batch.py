@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from emg_pipeline.batch import manifest_jobs, run_batch
+
+# What the original scripts printed: MVC per channel from MVC/PP0x_MVC_v2 (4 decimals) and the mid-range RMS
+# ((max + min) / 2 of the envelope) per load 6, 8 and 10 kg from the four-channel experiment scripts
+BASELINE = {
+    'PP04': {
+        'ES-T left': (0.1507, [0.01691807748, 0.01526368983, 0.0144115316]),
+        'ES-T right': (0.1171, [0.01261905793, 0.01519861917, 0.01452188652]),
+        'ES-L left': (0.3325, [0.03241238896, 0.03951844787, 0.03832923354]),
+        'ES-L right': (0.1404, [0.01351708032, 0.01578924436, 0.01180755695]),
+    },
+    'PP05': {
+        'ES-T left': (0.1436, [0.0129813139, 0.01285976458, 0.01328537821]),
+        'ES-T right': (0.1427, [0.01543876027, 0.0185047584, 0.01930054338]),
+        'ES-L left': (0.3512, [0.03435056402, 0.0274574923, 0.03242800717]),
+        'ES-L right': (0.1418, [0.01337115293, 0.01449897298, 0.01309865938]),
+    },
+}
+
+
+@pytest.fixture(scope='module')
+def rows():
+    jobs, mvc = manifest_jobs(list(BASELINE))
+    return run_batch(jobs, mvc, max_workers=1)
+
+
+@pytest.mark.parametrize('participant', list(BASELINE))
+def test_run_batch_reproduces_baseline_scripts(rows, participant):
+    for channel, (mvc, mid_range) in BASELINE[participant].items():
+        selected = sorted((row for row in rows if row['participant'] == participant and row['channel'] == channel),
+                          key=lambda row: row['load'])
+        assert [row['load'] for row in selected] == [6, 8, 10]
+        for row in selected:
+            assert row['mvc'] == pytest.approx(mvc, abs=5e-5)
+            assert row['normalized'] == pytest.approx(row['mid_range_rms'] / row['mvc'])
+        np.testing.assert_allclose([row['mid_range_rms'] for row in selected], mid_range, rtol=1e-6)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from emg_pipeline.continuity import continuity_events, continuity_report
+
+# 4-bit counter: clean wrap, gap, duplicate, backward sample, duplicate, two gaps and a wrap that drops two samples
+NSEQ = np.array([12, 13, 14, 15, 0, 1, 4, 5, 5, 6, 3, 7, 8, 8, 12, 13, 15, 2, 3], dtype=np.uint16)
+
+
+def test_continuity_events():
+    events = continuity_events(NSEQ, modulus=16)
+    assert events['row'].tolist() == [4, 6, 8, 10, 13, 14, 16, 17]
+    assert events['nseq'].tolist() == [0, 4, 5, 3, 8, 12, 15, 2]
+    assert events['kind'].tolist() == ['wrap', 'gap', 'duplicate', 'backward', 'duplicate', 'gap', 'gap', 'wrap']
+    assert events['samples'].tolist() == [0, 2, 0, -3, 0, 3, 1, 2]
+
+
+def test_continuity_report():
+    report = continuity_report(NSEQ, modulus=16)
+    # 12 up to 3 after two wraps is 24 samples, of which 2 + 3 + 1 + 2 never arrived
+    assert report['expected'] == 24
+    assert report['dropped'] == 8
+    assert (report['gaps'], report['duplicates'], report['wraps'], report['backward']) == (4, 2, 2, 1)
+
+
+def test_continuous_nseq_has_no_events():
+    nseq = np.arange(70000, dtype=np.uint32) % 2**16
+    assert len(continuity_events(nseq, modulus=2**16)) == 1  # only the clean wrap
+    assert continuity_report(nseq, modulus=2**16)['dropped'] == 0
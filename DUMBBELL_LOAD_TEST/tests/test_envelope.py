@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from scipy import signal
+
+from emg_pipeline.envelope import moving_rms, rms_envelope
+from emg_pipeline.filters import butter_sos, sos_filter, sos_initial_state
+from emg_pipeline.streaming import EnvelopeState
+
+RNG = np.random.default_rng(1)
+
+
+def direct_power(x, size):
+    # Trailing window by convolution; the first size - 1 samples average over what has been recorded
+    return np.convolve(x**2, np.ones(size))[:len(x)] / np.minimum(np.arange(1, len(x) + 1), size)
+
+
+@pytest.mark.parametrize('step', [1, 3])
+def test_moving_rms_matches_convolution(step):
+    block = RNG.normal(size=(2000, 3))
+    windows = (1, 50, 100, 250)
+    envelopes = moving_rms(block, windows, fs=1000, step=step)
+
+    assert envelopes.shape == (len(windows), -(-len(block) // step), block.shape[1])
+    for k, size in enumerate(windows):
+        for c in range(block.shape[1]):
+            # Compared as mean power: the differences of the running sum (about 2000 here) are only exact
+            # to its rounding, which the square root would blow up for near-zero windows
+            np.testing.assert_allclose(envelopes[k, :, c]**2, direct_power(block[:, c], size)[::step],
+                                       rtol=1e-9, atol=1e-11)
+
+
+def test_stream_filter_chunked_matches_one_shot():
+    block = RNG.normal(size=(5000, 4))
+    zi = sos_initial_state(10, 1000, 4, n_channels=block.shape[1])
+    chunks = []
+    for start in range(0, len(block), 777):
+        filtered, zi = sos_filter(block[start:start + 777], 10, 1000, 4, zi=zi)
+        chunks.append(filtered)
+
+    one_shot = signal.sosfilt(butter_sos(10, 1000, 4), block, axis=0)
+    np.testing.assert_allclose(np.vstack(chunks), one_shot, rtol=0, atol=1e-12)
+
+
+def test_streamed_envelope_matches_whole_window():
+    raw = RNG.integers(30000, 35000, size=(5000, 4)).astype(np.uint16)
+    state = EnvelopeState(raw.shape[1])
+    streamed = np.vstack([state.process(raw[start:start + 1000]) for start in range(0, len(raw), 1000)])
+
+    whole = rms_envelope((raw - (2**16 - 1) / 2) / 32768)
+    np.testing.assert_allclose(streamed, whole, rtol=0, atol=1e-12)